@@ -0,0 +1,90 @@
+"""Shared fixtures for the pytest-benchmark suite.
+
+Run with `make bench`; results are saved as JSON under benchmarks/.results/
+(one file per run, named after the commit) so runs can be compared with
+`make bench-compare`.
+"""
+
+import os
+import random
+
+import pytest
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
+
+
+@pytest.fixture(scope='session')
+def captcha_bytes() -> bytes:
+    """A synthetic captcha encoded as PNG, like the bytes returned by request_security_code_img."""
+    cv2 = pytest.importorskip('cv2')
+    np = pytest.importorskip('numpy')
+    from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+    from thsr_ticket.ml.captcha_solver import HEIGHT, WIDTH
+
+    random.seed(0)
+    np.random.seed(0)
+    img, _ = GenerateCaptcha().generate()
+    gray = cv2.resize(np.array(img), (WIDTH, HEIGHT))
+    ok, buf = cv2.imencode('.png', cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.fixture(scope='session')
+def onnx_model(tmp_path_factory) -> str:
+    """The shipped ONNX model, or a randomly initialised CaptchaCNN with the same graph."""
+    from thsr_ticket.ml import captcha_solver
+
+    if os.path.exists(captcha_solver.MODEL_PATH):
+        return captcha_solver.MODEL_PATH
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('onnx')
+    from thsr_ticket.ml.train.export_onnx import export
+    from thsr_ticket.ml.train.model import CaptchaCNN
+
+    out_dir = tmp_path_factory.mktemp('model')
+    checkpoint = str(out_dir / 'captcha_cnn.pt')
+    torch.manual_seed(0)
+    torch.save(CaptchaCNN().state_dict(), checkpoint)
+    path = str(out_dir / 'thsrc_captcha.onnx')
+    export(checkpoint, path)
+    return path
+
+
+@pytest.fixture(scope='session')
+def char_onnx_model(tmp_path_factory) -> str:
+    """The shipped per-character model, or a randomly initialised CharCNN."""
+    from thsr_ticket.ml import captcha_solver
+
+    if os.path.exists(captcha_solver.CHAR_MODEL_PATH):
+        return captcha_solver.CHAR_MODEL_PATH
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('onnx')
+    from thsr_ticket.ml.train.char_model import CharCNN
+    from thsr_ticket.ml.train.train_chars import export_char_model
+
+    torch.manual_seed(0)
+    path = str(tmp_path_factory.mktemp('model') / 'thsrc_char.onnx')
+    export_char_model(CharCNN(), path)
+    return path
+
+
+@pytest.fixture
+def solver(onnx_model, char_onnx_model, monkeypatch):
+    from thsr_ticket.ml import captcha_solver
+
+    monkeypatch.setattr(captcha_solver, 'MODEL_PATH', onnx_model)
+    monkeypatch.setattr(captcha_solver, 'CHAR_MODEL_PATH', char_onnx_model)
+    monkeypatch.setattr(captcha_solver, '_models', {})
+    return captcha_solver
+
+
+@pytest.fixture
+def standin():
+    from thsr_ticket.remote.standin_server import StandInConfig, StandInServer
+
+    with StandInServer(StandInConfig(seed=0)) as server:
+        yield server
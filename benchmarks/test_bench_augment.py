@@ -0,0 +1,33 @@
+"""BatchAugment throughput: one call per collated batch vs one call per sample."""
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from thsr_ticket.ml.train.augment import BatchAugment  # noqa: E402
+from thsr_ticket.ml.train.config import HEIGHT, NUM_CHANNELS, WIDTH  # noqa: E402
+
+BATCH = 64
+
+
+@pytest.fixture(scope='module')
+def batch():
+    torch.manual_seed(0)
+    return (torch.rand(BATCH, HEIGHT, WIDTH, NUM_CHANNELS) > 0.8).float()
+
+
+@pytest.fixture(scope='module')
+def augment():
+    return BatchAugment(arc_prob=0.5, generator=torch.Generator().manual_seed(0))
+
+
+def test_per_sample(benchmark, batch, augment):
+    benchmark(lambda: torch.cat([augment(batch[i:i + 1]) for i in range(BATCH)]))
+    if benchmark.stats:  # None under --benchmark-disable
+        benchmark.extra_info['samples_per_second'] = BATCH / benchmark.stats.stats.mean
+
+
+def test_batched(benchmark, batch, augment):
+    benchmark(augment, batch)
+    if benchmark.stats:  # None under --benchmark-disable
+        benchmark.extra_info['samples_per_second'] = BATCH / benchmark.stats.stats.mean
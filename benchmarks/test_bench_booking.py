@@ -0,0 +1,105 @@
+"""Full simulated booking (booking page -> S1 -> S2 -> S3) against the local stand-in server."""
+
+from datetime import date, timedelta
+
+import pytest
+
+from thsr_ticket.controller import first_page_flow
+from thsr_ticket.controller.booking_flow import CliOptions
+from thsr_ticket.controller.confirm_ticket_flow import ConfirmTicketFlow
+from thsr_ticket.controller.confirm_train_flow import ConfirmTrainFlow
+from thsr_ticket.controller.first_page_flow import FirstPageFlow
+from thsr_ticket.remote.http_request import HTTPRequest, SharedPool
+from thsr_ticket.view_model.booking_result import BookingResult
+
+
+def _opts() -> CliOptions:
+    return CliOptions(
+        from_station=2,
+        to_station=12,
+        date=(date.today() + timedelta(days=1)).strftime('%Y/%m/%d'),
+        time_id=10,
+        adult_count=1,
+        student_count=0,
+        personal_id='A123456789',
+        phone='0912345678',
+        seat_prefer=0,
+        class_type=0,
+    )
+
+
+def test_full_booking(benchmark, standin, monkeypatch):
+    monkeypatch.setattr(first_page_flow, '_solve_captcha', lambda img, auto_captcha=False, solver_mode='cnn': 'A2C4')
+
+    def book():
+        client = HTTPRequest(base_url=standin.url)
+        book_resp, _, _ = FirstPageFlow(client=client, opts=_opts()).run()
+        train_resp, _ = ConfirmTrainFlow(client, book_resp, auto_select=True).run()
+        ticket_resp, _ = ConfirmTicketFlow(
+            client, train_resp, use_membership=True, personal_id='A123456789', phone='0912345678',
+        ).run()
+        return BookingResult().parse(ticket_resp.content)[0]
+
+    ticket = benchmark(book)
+    assert ticket.train_id == '803'
+
+
+@pytest.mark.parametrize('shared', [False, True], ids=['private-pool', 'shared-pool'])
+def test_retry_session(benchmark, standin, shared):
+    # What BookingFlow does per captcha retry: a new session fetching page + captcha.
+    pool = SharedPool() if shared else None
+
+    def retry():
+        client = HTTPRequest(base_url=standin.url, pool=pool)
+        page = client.request_booking_page()
+        client.request_security_code_img(page.content)
+        client.close()
+
+    benchmark(retry)
+    if pool is not None:
+        pool.close()
+
+
+@pytest.fixture(scope='module')
+def slow_link():
+    # ~60 KB booking page (like the real one) trickling in 8 KB every 5 ms after 10 ms latency
+    from thsr_ticket.remote.standin_server import StandInConfig, StandInServer
+
+    config = StandInConfig(seed=0, latency=0.01, chunk_size=8192, chunk_delay=0.005, page_tail=60000)
+    with StandInServer(config) as server:
+        yield server
+
+
+@pytest.mark.parametrize('prefetch', [False, True], ids=['sequential', 'prefetch'])
+def test_first_hop(benchmark, slow_link, prefetch):
+    # Booking page + captcha; with prefetch the captcha GET starts once its <img> tag streamed in.
+    pool = SharedPool()
+
+    def first_hop():
+        client = HTTPRequest(base_url=slow_link.url, pool=pool)
+        if prefetch:
+            client.request_booking_page_and_captcha()
+        else:
+            page = client.request_booking_page()
+            client.request_security_code_img(page.content)
+
+    benchmark(first_hop)
+    pool.close()
+
+
+@pytest.mark.parametrize('early_exit', [False, True], ids=['full-body', 'early-exit'])
+def test_rejected_submit(benchmark, early_exit):
+    # The S1 POST of a snatch loop round that THSR rejects, over the slow link of `slow_link`.
+    from thsr_ticket.remote.http_request import HTTPOptions
+    from thsr_ticket.remote.standin_server import StandInConfig, StandInServer
+    from thsr_ticket.view_model.error_feedback import ErrorFeedback
+
+    config = StandInConfig(seed=0, captcha_accept_rate=0.0, latency=0.01, chunk_size=8192, chunk_delay=0.005,
+                           page_tail=60000)
+    with StandInServer(config) as server:
+        client = HTTPRequest(base_url=server.url, options=HTTPOptions(early_exit=early_exit))
+        client.request_booking_page()
+        params = {'homeCaptcha:securityCode': 'A2C4'}
+
+        errors = benchmark(lambda: ErrorFeedback().parse(client.submit_booking_form(params).content))
+        assert errors
@@ -0,0 +1,98 @@
+"""Whole-image CaptchaCNN ('cnn') vs segmented glyphs + CharCNN ('char').
+
+Accuracy is recorded in extra_info; it is only meaningful when trained models
+are installed (otherwise conftest falls back to randomly initialised ones).
+Set THSR_BENCH_CHAR_MODEL / THSR_BENCH_CNN_MODEL to compare other model files.
+"""
+
+import os
+import random
+
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+ort = pytest.importorskip('onnxruntime')
+
+from thsr_ticket.ml import captcha_solver as cs  # noqa: E402
+from thsr_ticket.ml.image_process import segment  # noqa: E402
+
+ACCURACY_SAMPLES = 100
+
+
+@pytest.fixture(scope='module')
+def stages(captcha_bytes):
+    img_bgr = cv2.imdecode(np.frombuffer(captcha_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    img_bgr = cv2.resize(img_bgr, (cs.WIDTH, cs.HEIGHT))
+    return {'bgr': img_bgr, 'preprocessed': cv2.cvtColor(cs._preprocess(img_bgr), cv2.COLOR_GRAY2BGR)}
+
+
+@pytest.fixture(scope='module')
+def labeled_captchas():
+    from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+
+    random.seed(1)
+    np.random.seed(1)
+    generator = GenerateCaptcha()
+    out = []
+    for _ in range(ACCURACY_SAMPLES):
+        img, chars = generator.generate()
+        gray = cv2.resize(np.array(img), (cs.WIDTH, cs.HEIGHT))
+        ok, buf = cv2.imencode('.png', cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+        out.append((buf.tobytes(), ''.join(chars)))
+    return out
+
+
+@pytest.fixture
+def models(solver, monkeypatch):
+    for attr, env in (('MODEL_PATH', 'THSR_BENCH_CNN_MODEL'), ('CHAR_MODEL_PATH', 'THSR_BENCH_CHAR_MODEL')):
+        if os.environ.get(env):
+            monkeypatch.setattr(solver, attr, os.environ[env])
+    return {'cnn': solver.MODEL_PATH, 'char': solver.CHAR_MODEL_PATH}
+
+
+def _try(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except cs.LowConfidenceError:
+        return None
+
+
+@pytest.mark.parametrize('mode', cs.MODES)
+def test_cold_start(benchmark, models, mode):
+    benchmark.extra_info['model_kb'] = round(os.path.getsize(models[mode]) / 1024, 1)
+    benchmark(ort.InferenceSession, models[mode], providers=['CPUExecutionProvider'])
+
+
+def test_inference_cnn(benchmark, models, stages):
+    _try(cs._predict, stages['preprocessed'])
+    benchmark(_try, cs._predict, stages['preprocessed'])
+
+
+def test_inference_char(benchmark, models, stages):
+    glyphs = segment(stages['bgr'], cs.NUM_DIGITS, cs.GLYPH_SIZE)
+    if glyphs is None:
+        pytest.skip('benchmark captcha does not segment into 4 glyphs')
+    _try(cs._predict_chars, glyphs)
+    benchmark(_try, cs._predict_chars, glyphs)
+
+
+def test_segment(benchmark, stages):
+    benchmark(segment, stages['bgr'], cs.NUM_DIGITS, cs.GLYPH_SIZE)
+
+
+@pytest.mark.parametrize('mode', cs.MODES)
+def test_solve(benchmark, models, captcha_bytes, mode):
+    _try(cs.solve, captcha_bytes, mode=mode)
+    benchmark(_try, cs.solve, captcha_bytes, mode=mode)
+
+
+@pytest.mark.parametrize('mode', cs.MODES)
+def test_accuracy(benchmark, models, labeled_captchas, mode):
+    def run():
+        return [_try(cs.solve, img, mode=mode) for img, _ in labeled_captchas]
+
+    predictions = benchmark.pedantic(run, rounds=1, iterations=1)
+    correct = sum(p == label for p, (_, label) in zip(predictions, labeled_captchas))
+    benchmark.extra_info['accuracy'] = correct / len(labeled_captchas)
+    benchmark.extra_info['low_confidence'] = predictions.count(None) / len(labeled_captchas)
@@ -0,0 +1,44 @@
+"""Per-attempt form-building cost: JSON round trip vs direct alias encoding vs cached template."""
+
+import json
+from datetime import date, timedelta
+from itertools import cycle
+
+import pytest
+
+from thsr_ticket.configs.web.param_schema import BookingModel
+from thsr_ticket.remote.form_encoder import BOOKING_FORM
+
+CODES = cycle(['A2C4', 'Z9Y7', 'KM3P', 'QRTV'])
+
+
+@pytest.fixture(scope='module')
+def models():
+    tomorrow = (date.today() + timedelta(days=1)).strftime('%Y/%m/%d')
+    return [
+        BookingModel(
+            start_station=2, dest_station=12, outbound_date=tomorrow, outbound_time='1000A',
+            seat_prefer='radio17', types_of_trip=0, search_by='radio31', security_code=code,
+        )
+        for code in ['A2C4', 'Z9Y7', 'KM3P', 'QRTV']
+    ]
+
+
+def test_json_round_trip(benchmark, models):
+    it = cycle(models)
+    benchmark(lambda: json.loads(next(it).json(by_alias=True)))
+
+
+def test_direct_dict(benchmark, models):
+    it = cycle(models)
+    benchmark(lambda: BOOKING_FORM.to_dict(next(it)))
+
+
+def test_template_encode(benchmark, models):
+    it = cycle(models)
+    benchmark(lambda: BOOKING_FORM.encode(next(it)))
+
+
+def test_template_fill(benchmark, models):
+    tmpl = BOOKING_FORM.template(models[0])
+    benchmark(lambda: tmpl.fill(next(CODES)))
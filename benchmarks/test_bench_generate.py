@@ -0,0 +1,41 @@
+"""Synthetic captcha rendering: one PIL image at a time vs generate_batch."""
+
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from thsr_ticket.ml.generate_captcha import GenerateCaptcha  # noqa: E402
+
+K = 256
+
+
+@pytest.fixture(scope='module')
+def generator():
+    np.random.seed(0)
+    gen = GenerateCaptcha()
+    gen.generate_batch(1)  # warm the glyph cache
+    return gen
+
+
+def _report(benchmark):
+    if benchmark.stats:  # None under --benchmark-disable
+        benchmark.extra_info['captchas_per_second'] = K / benchmark.stats.stats.mean
+
+
+def test_generate_loop(benchmark, generator):
+    def run():
+        out = np.empty((K, generator._height, generator._width), dtype=np.uint8)
+        for i in range(K):
+            img, _ = generator.generate()
+            out[i] = cv2.resize(np.asarray(img), (generator._width, generator._height))
+        return out
+
+    benchmark.pedantic(run, rounds=5)
+    _report(benchmark)
+
+
+def test_generate_batch(benchmark, generator):
+    out = np.empty((K, generator._height, generator._width), dtype=np.uint8)
+    benchmark.pedantic(generator.generate_batch, args=(K, out), rounds=5)
+    _report(benchmark)
@@ -0,0 +1,53 @@
+"""HTTP/1.1 (requests) vs HTTP/2 (httpx) against the stand-in servers.
+
+Each round runs what BookingFlow and the captcha collector do per retry:
+a new session fetching the booking page and its captcha. With `latency` set,
+the sessions that share a one-connection pool queue behind each other over
+HTTP/1.1, while over HTTP/2 their streams overlap on the one connection.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('httpx')
+pytest.importorskip('h2')
+
+from thsr_ticket.remote.http_request import HTTPOptions, HTTPRequest, SharedPool  # noqa: E402
+from thsr_ticket.remote.standin_h2 import StandInH2Server  # noqa: E402
+from thsr_ticket.remote.standin_server import StandInConfig, StandInServer  # noqa: E402
+
+LATENCY = 0.01
+SESSIONS = 4
+
+
+@pytest.fixture(params=['http1', 'http2'])
+def transport(request):
+    http2 = request.param == 'http2'
+    server_cls = StandInH2Server if http2 else StandInServer
+    with server_cls(StandInConfig(seed=0, latency=LATENCY)) as server:
+        pool = SharedPool(HTTPOptions(pool_maxsize=1, http2=http2))
+        yield server, pool
+        pool.close()
+
+
+def _retry(server, pool) -> None:
+    client = HTTPRequest(base_url=server.url, pool=pool)
+    page = client.request_booking_page()
+    client.request_security_code_img(page.content)
+    client.close()
+
+
+def test_retry_session(benchmark, transport):
+    server, pool = transport
+    benchmark(_retry, server, pool)
+
+
+def test_concurrent_sessions(benchmark, transport):
+    server, pool = transport
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        def run():
+            list(executor.map(lambda _: _retry(server, pool), range(SESSIONS)))
+
+        benchmark(run)
+    assert server.app.stats.requests['security_code_img'] >= SESSIONS
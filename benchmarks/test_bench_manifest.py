@@ -0,0 +1,40 @@
+"""Saving a captcha into a raw directory that already holds a few thousand."""
+
+import hashlib
+import itertools
+import os
+
+import pytest
+
+from thsr_ticket.ml.train.manifest import RawManifest
+
+EXISTING = 3000
+
+
+@pytest.fixture
+def raw(tmp_path):
+    d = tmp_path / 'raw'
+    d.mkdir()
+    for i in range(1, EXISTING + 1):
+        (d / f'{i:05d}_A2C4_{i:012x}.png').write_bytes(b'')
+    return d
+
+
+def _listdir_save(raw_dir: str, img_bytes: bytes) -> None:
+    # What BookingFlow._save_captcha did before the manifest
+    img_hash = hashlib.md5(img_bytes).hexdigest()[:12]
+    existing = [f for f in os.listdir(raw_dir) if f.endswith('.png')]
+    next_num = max((int(f.split('_')[0]) for f in existing if f[0].isdigit()), default=0) + 1
+    with open(os.path.join(raw_dir, f'{next_num:05d}_captcha_{img_hash}.png'), 'wb') as f:
+        f.write(img_bytes)
+
+
+def test_listdir_save(benchmark, raw):
+    counter = itertools.count()
+    benchmark(lambda: _listdir_save(str(raw), str(next(counter)).encode()))
+
+
+def test_manifest_save(benchmark, raw):
+    manifest = RawManifest(str(raw))
+    counter = itertools.count()
+    benchmark(lambda: manifest.add(str(next(counter)).encode(), source='bench'))
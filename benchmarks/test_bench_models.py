@@ -0,0 +1,68 @@
+"""BookingModel construction/serialization and ParamDB operations."""
+
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from thsr_ticket.configs.web.param_schema import BookingModel, ConfirmTicketModel
+from thsr_ticket.model.db import ParamDB
+
+TOMORROW = (date.today() + timedelta(days=1)).strftime('%Y/%m/%d')
+BOOKING_FIELDS = dict(
+    start_station=2,
+    dest_station=12,
+    outbound_date=TOMORROW,
+    outbound_time='1000A',
+    adult_ticket_num='1F',
+    college_ticket_num='0P',
+    seat_prefer='radio17',
+    class_type=0,
+    types_of_trip=0,
+    search_by='radio31',
+    security_code='A2C4',
+)
+
+
+@pytest.fixture(scope='module')
+def booking_model():
+    return BookingModel(**BOOKING_FIELDS)
+
+
+def test_booking_model_construct(benchmark):
+    benchmark(lambda: BookingModel(**BOOKING_FIELDS))
+
+
+def test_booking_model_json(benchmark, booking_model):
+    benchmark(lambda: json.loads(booking_model.json(by_alias=True)))
+
+
+@pytest.fixture
+def param_db(tmp_path):
+    return ParamDB(db_path=str(tmp_path / 'history.json'))
+
+
+def _ticket(idx: int) -> ConfirmTicketModel:
+    return ConfirmTicketModel(personal_id=f'A1{idx:08d}', phone_num='0912345678', member_radio='radio60')
+
+
+def test_param_db_save(benchmark, param_db, booking_model):
+    counter = iter(range(10 ** 9))
+    benchmark(lambda: param_db.save(booking_model, _ticket(next(counter))))
+
+
+def test_param_db_get_history(benchmark, param_db, booking_model):
+    for idx in range(50):
+        param_db.save(booking_model, _ticket(idx))
+    hist = benchmark(param_db.get_history)
+    assert len(hist) == 50
+
+
+def test_param_db_delete(benchmark, param_db, booking_model):
+    counter = iter(range(10 ** 9))
+
+    def setup():
+        param_db.save(booking_model, _ticket(next(counter)))
+        return (0,), {}
+
+    benchmark.pedantic(param_db.delete, setup=setup, rounds=50)
@@ -0,0 +1,34 @@
+"""View-model parsers on fixture HTML from the stand-in server templates."""
+
+import pytest
+
+from thsr_ticket.remote import standin_pages as pages
+from thsr_ticket.view_model.avail_trains import AvailTrains
+from thsr_ticket.view_model.booking_result import BookingResult
+from thsr_ticket.view_model.error_feedback import ErrorFeedback
+
+BOOKING_PAGE = pages.booking_page('0123456789ABCDEF', 1)
+CAPTCHA_ERROR_PAGE = pages.booking_page('0123456789ABCDEF', 1, errors=[pages.CAPTCHA_ERROR_MSG])
+TRAINS_PAGE = pages.trains_page()
+RESULT_PAGE = pages.result_page('00000001', pages.DEFAULT_TRAINS[0], '2026/10/20')
+
+
+@pytest.mark.parametrize('html', [BOOKING_PAGE, CAPTCHA_ERROR_PAGE, TRAINS_PAGE], ids=['ok', 'error', 'trains'])
+def test_error_feedback(benchmark, html):
+    benchmark(lambda: ErrorFeedback().parse(html))
+
+
+def test_avail_trains(benchmark):
+    trains = benchmark(lambda: AvailTrains().parse(TRAINS_PAGE))
+    assert len(trains) == len(pages.DEFAULT_TRAINS)
+
+
+def test_booking_result(benchmark):
+    tickets = benchmark(lambda: BookingResult().parse(RESULT_PAGE))
+    assert tickets[0].id == '00000001'
+
+
+def test_security_img_url(benchmark):
+    from thsr_ticket.remote.http_request import parse_security_img_url
+
+    benchmark(parse_security_img_url, BOOKING_PAGE)
@@ -0,0 +1,59 @@
+"""Validating legacy form params against BOOKING_SCHEMA."""
+
+from datetime import date, timedelta
+
+import jsonschema
+import pytest
+
+from thsr_ticket.configs.web.param_schema import BOOKING_SCHEMA
+from thsr_ticket.model.web import schema_validator
+from thsr_ticket.model.web.booking_form.booking_form import BookingForm
+
+TOMORROW = (date.today() + timedelta(days=1)).strftime('%Y/%m/%d')
+
+
+@pytest.fixture(scope='module')
+def form():
+    form = BookingForm()
+    form.start_station = 2
+    form.dest_station = 12
+    form.search_by = 'radio31'
+    form.seat_prefer = 'radio17'
+    form.outbound_date = TOMORROW
+    form.outbound_time = '1000A'
+    form.security_code = 'A2C4'
+    return form
+
+
+@pytest.fixture(scope='module')
+def params(form):
+    return form.get_params(val=False)
+
+
+def test_jsonschema_validate(benchmark, params):
+    benchmark(jsonschema.validate, params, schema=BOOKING_SCHEMA)
+
+
+def test_compiled_jsonschema(benchmark, params, monkeypatch):
+    monkeypatch.setattr(schema_validator, 'fastjsonschema', None)
+    validate = schema_validator._build(BOOKING_SCHEMA)
+    benchmark(validate, params)
+
+
+def test_compiled_fastjsonschema(benchmark, params):
+    if schema_validator.fastjsonschema is None:
+        pytest.skip('fastjsonschema not installed')
+    benchmark(schema_validator._build(BOOKING_SCHEMA), params)
+
+
+def test_get_params_unchanged(benchmark, form):
+    form.get_params()
+    benchmark(form.get_params)
+
+
+def test_get_params_no_cache(benchmark, form):
+    form.cache_validation = False
+    try:
+        benchmark(form.get_params)
+    finally:
+        form.cache_validation = True
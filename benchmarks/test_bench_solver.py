@@ -0,0 +1,88 @@
+"""captcha_solver: decode, each preprocessing stage, inference and the full solve()."""
+
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from thsr_ticket.ml import captcha_solver as cs  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def stages(captcha_bytes):
+    img_bgr = cv2.imdecode(np.frombuffer(captcha_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    img_bgr = cv2.resize(img_bgr, (cs.WIDTH, cs.HEIGHT))
+    denoised = cs._denoise(img_bgr)
+    thresh = cs._threshold_inv(denoised)
+    regr = cs._find_regression(thresh)
+    gray = cs._remove_curve(thresh, regr)
+    return {
+        'bgr': img_bgr,
+        'denoised': denoised,
+        'thresh': thresh,
+        'regr': regr,
+        'preprocessed': cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR),
+    }
+
+
+def test_decode(benchmark, captcha_bytes):
+    benchmark(lambda: cv2.imdecode(np.frombuffer(captcha_bytes, dtype=np.uint8), cv2.IMREAD_COLOR))
+
+
+def test_resize(benchmark, stages):
+    benchmark(cv2.resize, stages['bgr'], (cs.WIDTH, cs.HEIGHT))
+
+
+def test_denoise(benchmark, stages):
+    benchmark(cs._denoise, stages['bgr'])
+
+
+def test_threshold(benchmark, stages):
+    benchmark(cs._threshold_inv, stages['denoised'])
+
+
+def test_find_regression(benchmark, stages):
+    benchmark(cs._find_regression, stages['thresh'])
+
+
+def test_remove_curve(benchmark, stages):
+    benchmark(cs._remove_curve, stages['thresh'], stages['regr'])
+
+
+def test_preprocess(benchmark, stages):
+    benchmark(cs._preprocess, stages['bgr'])
+
+
+def _predict(solver, img):
+    try:
+        return solver._predict(img)
+    except solver.LowConfidenceError:
+        return None
+
+
+def test_inference(benchmark, solver, stages):
+    _predict(solver, stages['preprocessed'])  # load the session outside the timed loop
+    benchmark(_predict, solver, stages['preprocessed'])
+
+
+def test_solve(benchmark, solver, captcha_bytes):
+    def run():
+        try:
+            return solver.solve(captcha_bytes)
+        except solver.LowConfidenceError:
+            return None
+
+    run()
+    benchmark(run)
+
+
+def test_preprocess_legacy(benchmark, stages):
+    benchmark(cs._preprocess_legacy, stages['bgr'])
+
+
+@pytest.mark.parametrize('interval', [0.0, 2.0], ids=['stat-every-call', 'default'])
+def test_model_watch(benchmark, solver, monkeypatch, interval):
+    # Per-solve cost of the hot-reload check; 0.0 stats the model file on every call.
+    monkeypatch.setattr(solver, 'WATCH_INTERVAL', interval)
+    solver._get_model('cnn')
+    benchmark(solver._get_model, 'cnn')
@@ -0,0 +1,33 @@
+"""One CaptchaCNN training step per train.py configuration (fp32/bf16, NCHW/channels_last)."""
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from thsr_ticket.ml.train.config import HEIGHT, NUM_CHANNELS, NUM_CLASSES, NUM_DIGITS, WIDTH  # noqa: E402
+from thsr_ticket.ml.train.model import CaptchaCNN  # noqa: E402
+from thsr_ticket.ml.train.train import _train_one_epoch, prepare_model  # noqa: E402
+
+BATCH = 64
+STEPS = 4
+
+
+@pytest.mark.parametrize('bf16', [False, True], ids=['fp32', 'bf16'])
+@pytest.mark.parametrize('channels_last', [False, True], ids=['nchw', 'channels_last'])
+def test_train_steps(benchmark, bf16, channels_last):
+    torch.manual_seed(0)
+    batches = [
+        (torch.rand(BATCH, HEIGHT, WIDTH, NUM_CHANNELS), torch.randint(0, NUM_CLASSES, (BATCH, NUM_DIGITS)))
+        for _ in range(STEPS)
+    ]
+    model = prepare_model(CaptchaCNN(), channels_last=channels_last)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    criterion = torch.nn.CrossEntropyLoss()
+    device = torch.device('cpu')
+
+    _train_one_epoch(model, batches[:1], optimizer, criterion, device, bf16)  # warm-up
+    benchmark.pedantic(
+        _train_one_epoch, args=(model, batches, optimizer, criterion, device, bf16), rounds=3,
+    )
+    if benchmark.stats:  # None under --benchmark-disable
+        benchmark.extra_info['samples_per_second'] = BATCH * STEPS / benchmark.stats.stats.mean
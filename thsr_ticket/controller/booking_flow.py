@@ -1,9 +1,7 @@
-import hashlib
-import os
 import time
 from dataclasses import dataclass
 from datetime import date as date_cls, timedelta
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from requests.models import Response
 from rich.rule import Rule
@@ -17,7 +15,15 @@ from thsr_ticket.view.web.show_error_msg import ShowErrorMsg
 from thsr_ticket.view.web.show_booking_result import ShowBookingResult
 from thsr_ticket.view.common import history_info
 from thsr_ticket.model.db import ParamDB, Record
-from thsr_ticket.remote.http_request import HTTPRequest
+from thsr_ticket.metrics import (
+    BOOKING_ATTEMPTS,
+    BOOKING_STATUS,
+    CAPTCHA_LOW_CONFIDENCE,
+    CAPTCHA_RESULTS,
+    NO_TRAINS_ROUNDS,
+)
+from thsr_ticket.remote.capture import Recorder
+from thsr_ticket.remote.http_request import HTTPOptions, HTTPRequest, SharedPool
 import questionary
 from thsr_ticket.view.console import console, QUESTIONARY_STYLE
 
@@ -45,14 +51,36 @@ class CliOptions:
     snatch_interval: Optional[int] = None  # seconds between rounds (both modes)
     snatch_select_train: bool = False  # show train list on first attempt, then lock in
     dry_run: bool = False             # simulate mode: stop before final ticket submission
+    base_url: Optional[str] = None    # talk to a local stand-in server instead of irs.thsrc.com.tw
+    capture_path: Optional[str] = None  # record redacted request/response pairs into this cassette
+    archive_captchas: bool = True     # save captchas for training (background thread); off for lowest latency
+    solver_mode: str = 'cnn'          # captcha_solver mode: 'cnn' (whole image) or 'char' (segmented glyphs)
+    http_pool_size: int = 4           # connections per host, shared by every session (retry) of this run
+    http_keep_alive: bool = True
+    http_retries: int = 3             # connection errors, and 429/5xx on GETs
+    http_backoff: float = 0.5         # urllib3 Retry backoff_factor
+    http_timeouts: Optional[Dict[str, List[float]]] = None  # endpoint -> [connect, read] seconds
+    http2: bool = False               # HTTP/2 through httpx (optional dependency)
 
 
 class BookingFlow:
     def __init__(self, **kwargs) -> None:
-        self.client = HTTPRequest()
+        self.opts = CliOptions(**kwargs)
+        self.recorder = Recorder(self.opts.capture_path) if self.opts.capture_path else None
+        self.archiver = self._new_archiver() if self.opts.archive_captchas else None
+        # Each captcha retry starts a new session (cookie jar); the shared pool lets it
+        # reuse an open connection instead of connecting and handshaking again.
+        self.http_pool = SharedPool(HTTPOptions(
+            pool_maxsize=self.opts.http_pool_size,
+            keep_alive=self.opts.http_keep_alive,
+            retries=self.opts.http_retries,
+            backoff_factor=self.opts.http_backoff,
+            timeouts={k: tuple(v) for k, v in (self.opts.http_timeouts or {}).items()},
+            http2=self.opts.http2,
+        ))
+        self.client = self._new_client()
         self.db = ParamDB()
         self.record = Record()
-        self.opts = CliOptions(**kwargs)
 
         self.error_feedback = ErrorFeedback()
         self.show_error_msg = ShowErrorMsg()
@@ -87,15 +115,16 @@ class BookingFlow:
             round_num += 1
             if is_snatch and round_num > 1:
                 console.print(f"\n[dim]── 第 {round_num} 輪 ──[/dim]")
-                self.client = HTTPRequest()
+                self.client = self._new_client()
 
             for attempt_date in dates_to_try:
                 if attempt_date is not None:
                     self.opts.date = attempt_date
-                    self.client = HTTPRequest()
+                    self.client = self._new_client()
                     console.print(f"\n[dim]嘗試 {attempt_date}...[/dim]")
 
                 status, result = self._book_one_date(snatch_mode=is_snatch)
+                BOOKING_STATUS.inc(status=status)
 
                 if status == 'success':
                     return result
@@ -107,7 +136,10 @@ class BookingFlow:
                     return result  # None or error Response
 
             # All dates exhausted in this round
-            if not is_snatch or not self.opts.snatch_interval:
+            if not is_snatch:
+                break
+            NO_TRAINS_ROUNDS.inc()
+            if not self.opts.snatch_interval:
                 break
 
             seconds = self.opts.snatch_interval
@@ -139,21 +171,23 @@ class BookingFlow:
         book_model = None
 
         for attempt in range(1, max_attempts + 1):
+            BOOKING_ATTEMPTS.inc()
             try:
                 resp, model, captcha_img = FirstPageFlow(
                     client=self.client, record=self.record, opts=self.opts
                 ).run()
             except LowConfidenceError as e:
+                CAPTCHA_LOW_CONFIDENCE.inc()
                 console.print(f"[dim][{attempt}/{max_attempts}] 跳過：{e}[/dim]")
                 if attempt < max_attempts:
-                    self.client = HTTPRequest()
+                    self.client = self._new_client()
                     continue
                 console.print("[bold red]✗[/bold red]  已達最大嘗試次數")
                 return 'error', None
             except Exception as e:
                 console.print(f"[dim][{attempt}/{max_attempts}] 連線失敗：{e}[/dim]")
                 if attempt < max_attempts:
-                    self.client = HTTPRequest()
+                    self.client = self._new_client()
                     time.sleep(2)
                     continue
                 console.print("[bold red]✗[/bold red]  已達最大嘗試次數")
@@ -163,13 +197,18 @@ class BookingFlow:
             self._fill_opts_from_model(model)
 
             errors = self.error_feedback.parse(resp.content)
+            is_captcha_error = any('檢測碼' in e.msg for e in errors)
+            # Only a page without errors proves the captcha passed
+            if not errors:
+                CAPTCHA_RESULTS.inc(result='accepted')
+            else:
+                CAPTCHA_RESULTS.inc(result='rejected' if is_captcha_error else 'other_error')
             if not errors:
                 self._save_captcha(captcha_img, label=model.security_code)
                 book_resp, book_model = resp, model
                 break
 
             error_msgs = ', '.join(e.msg.strip() for e in errors)
-            is_captcha_error = any('檢測碼' in e.msg for e in errors)
 
             if not is_captcha_error:
                 is_no_trains = any('查無' in e.msg for e in errors)
@@ -181,7 +220,7 @@ class BookingFlow:
             if attempt < max_attempts:
                 self._save_captcha(captcha_img)
                 console.print(f"[dim][{attempt}/{max_attempts}] {error_msgs}，重試中...[/dim]")
-                self.client = HTTPRequest()
+                self.client = self._new_client()
                 time.sleep(1)
             else:
                 self._save_captcha(captcha_img)
@@ -220,7 +259,7 @@ class BookingFlow:
             return 'error', book_resp
         except Exception as e:
             console.print(f"[dim]確認班次失敗：{e}，重試中...[/dim]")
-            self.client = HTTPRequest()
+            self.client = self._new_client()
             return 'no_trains', None
         if self.show_error(train_resp.content):
             return 'error', train_resp
@@ -245,6 +284,9 @@ class BookingFlow:
         self.db.save(book_model, ticket_model)
         return 'success', ticket_resp
 
+    def _new_client(self) -> HTTPRequest:
+        return HTTPRequest(base_url=self.opts.base_url, recorder=self.recorder, pool=self.http_pool)
+
     def _build_snatch_dates(self) -> Optional[list]:
         """Build list of date strings from opts.date to opts.snatch_end (inclusive)."""
         if not self.opts.snatch_end:
@@ -363,24 +405,18 @@ class BookingFlow:
                 self.opts.snatch_select_train = True
 
     @staticmethod
-    def _save_captcha(img_bytes: bytes, label: str = None) -> None:
-        """Save captcha to training data directory.
+    def _new_archiver():
+        from thsr_ticket.ml.train.archive import CaptchaArchiver
+        return CaptchaArchiver()
+
+    def _save_captcha(self, img_bytes: bytes, label: str = None) -> None:
+        """Queue captcha for saving to the training data directory (see CaptchaArchiver).
 
         label=None  → unlabeled (NNN_captcha_hash.png), needs manual labeling
         label='XXXX' → auto-labeled (NNN_XXXX_hash.png), confirmed correct by THSR
         """
-        raw_dir = os.path.join(
-            os.path.dirname(__file__), '..', 'ml', 'train', 'data', 'raw',
-        )
-        os.makedirs(raw_dir, exist_ok=True)
-        img_hash = hashlib.md5(img_bytes).hexdigest()[:12]
-        existing = [f for f in os.listdir(raw_dir) if f.endswith('.png')]
-        next_num = max((int(f.split('_')[0]) for f in existing if f[0].isdigit()), default=0) + 1
-        middle = label if label else 'captcha'
-        filepath = os.path.join(raw_dir, f'{next_num:05d}_{middle}_{img_hash}.png')
-        if not os.path.exists(filepath):
-            with open(filepath, 'wb') as f:
-                f.write(img_bytes)
+        if self.archiver is not None:
+            self.archiver.submit(img_bytes, label=label, source='booking', verified=label is not None)
 
     def show_error(self, html: bytes) -> bool:
         errors = self.error_feedback.parse(html)
@@ -1,4 +1,3 @@
-import json
 import re
 import questionary
 from typing import Optional, Tuple
@@ -8,6 +7,7 @@ from requests.models import Response
 from thsr_ticket.configs.web.param_schema import ConfirmTicketModel
 
 from thsr_ticket.model.db import Record
+from thsr_ticket.remote.form_encoder import CONFIRM_TICKET_FORM
 from thsr_ticket.remote.http_request import HTTPRequest
 from thsr_ticket.view.console import console, QUESTIONARY_STYLE
 
@@ -71,14 +71,11 @@ class ConfirmTicketFlow:
                 phone_num=phone_num,
                 member_radio=member_radio,
             )
-            dict_params = json.loads(ticket_model.json(by_alias=True))
-            if extra_params:
-                dict_params.update(extra_params)
-            if early_bird_params:
-                dict_params.update(early_bird_params)
+            extra = {**(extra_params or {}), **(early_bird_params or {})}
+            params = CONFIRM_TICKET_FORM.encode(ticket_model, extra)
 
             with console.status("[bold cyan]確認乘客資訊...[/bold cyan]", spinner="dots"):
-                resp = self.client.submit_ticket(dict_params)
+                resp = self.client.submit_ticket(params)
 
             if use_membership:
                 from thsr_ticket.view_model.error_feedback import ErrorFeedback
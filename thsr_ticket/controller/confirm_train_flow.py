@@ -1,9 +1,9 @@
-import json
 import questionary
 from typing import List, Optional, Tuple
 
 from requests.models import Response
 
+from thsr_ticket.remote.form_encoder import CONFIRM_TRAIN_FORM
 from thsr_ticket.remote.http_request import HTTPRequest
 from thsr_ticket.view_model.avail_trains import AvailTrains
 from thsr_ticket.configs.web.param_schema import Train, ConfirmTrainModel
@@ -36,10 +36,8 @@ class ConfirmTrainFlow:
         confirm_model = ConfirmTrainModel(
             selected_train=self.select_available_trains(trains),
         )
-        json_params = confirm_model.json(by_alias=True)
-        dict_params = json.loads(json_params)
         with console.status("[bold cyan]確認班次中...[/bold cyan]", spinner="dots"):
-            resp = self.client.submit_train(dict_params)
+            resp = self.client.submit_train(CONFIRM_TRAIN_FORM.encode(confirm_model))
         return resp, confirm_model
 
     def select_available_trains(self, trains: List[Train]) -> Train:
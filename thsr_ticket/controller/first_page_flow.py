@@ -1,5 +1,4 @@
 import io
-import json
 import re
 import questionary
 from PIL import Image
@@ -10,6 +9,7 @@ from bs4 import BeautifulSoup
 from requests.models import Response
 
 from thsr_ticket.model.db import Record
+from thsr_ticket.remote.form_encoder import BOOKING_FORM
 from thsr_ticket.remote.http_request import HTTPRequest
 from thsr_ticket.configs.web.param_schema import BookingModel
 from thsr_ticket.configs.web.parse_html_element import BOOKING_PAGE
@@ -58,8 +58,8 @@ class FirstPageFlow:
 
     def run(self) -> Tuple[Response, BookingModel, bytes]:
         with console.status("[bold cyan]連線中...[/bold cyan]", spinner="dots"):
-            book_page = self.client.request_booking_page().content
-            img_resp = self.client.request_security_code_img(book_page).content
+            page_resp, captcha_resp = self.client.request_booking_page_and_captcha()
+            book_page, img_resp = page_resp.content, captcha_resp.content
         page = BeautifulSoup(book_page, features='html.parser')
 
         start_station = self.select_station('啟程', self.opts.from_station if self.opts else None)
@@ -109,7 +109,11 @@ class FirstPageFlow:
             if self.opts.class_type is None:
                 self.opts.class_type = class_type
 
-        security_code = _solve_captcha(img_resp, self.opts.auto_captcha if self.opts else False)
+        security_code = _solve_captcha(
+            img_resp,
+            self.opts.auto_captcha if self.opts else False,
+            self.opts.solver_mode if self.opts else 'cnn',
+        )
 
         with console.status("[bold cyan]提交訂票資訊...[/bold cyan]", spinner="dots"):
             book_model = BookingModel(
@@ -125,9 +129,7 @@ class FirstPageFlow:
                 search_by=search_by,
                 security_code=security_code,
             )
-            json_params = book_model.json(by_alias=True)
-            dict_params = json.loads(json_params)
-            resp = self.client.submit_booking_form(dict_params)
+            resp = self.client.submit_booking_form(BOOKING_FORM.encode(book_model))
         return resp, book_model, img_resp
 
     def select_station(self, travel_type: str, cli_value: int = None, default_value: int = StationMapping.Taipei.value) -> int:
@@ -265,11 +267,12 @@ def _parse_search_by(page: BeautifulSoup) -> str:
     return tag.attrs['value']
 
 
-def _solve_captcha(img_resp: bytes, auto_captcha: bool = False) -> str:
+def _solve_captcha(img_resp: bytes, auto_captcha: bool = False, solver_mode: str = 'cnn') -> str:
     if auto_captcha:
-        from thsr_ticket.ml.captcha_solver import solve, LowConfidenceError  # noqa: F401
-        code = solve(img_resp)
-        console.print(f"[dim]自動辨識驗證碼：[/dim][bold yellow]{code}[/bold yellow]")
+        from thsr_ticket.ml.captcha_solver import solve, model_version, LowConfidenceError  # noqa: F401
+        code = solve(img_resp, mode=solver_mode)
+        version = model_version(solver_mode) or model_version('cnn')
+        console.print(f"[dim]自動辨識驗證碼：[/dim][bold yellow]{code}[/bold yellow] [dim]（模型 {version}）[/dim]")
         return code
 
     console.print("\n[bold cyan]◆ 驗證碼[/bold cyan]  [dim]（圖片即將開啟）[/dim]")
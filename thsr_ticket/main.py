@@ -63,11 +63,29 @@ def _load_config() -> dict:
         return {}
 
 
+def _check_solver_model(mode: str) -> str:
+    """Pick a solver mode whose model file exists, before any request is sent.
+
+    A missing model would otherwise surface on the first solve() as an error
+    that BookingFlow retries like a failed connection.
+    """
+    from thsr_ticket.ml.captcha_solver import CHAR_MODEL_PATH, MODEL_PATH, model_available
+    if mode == 'char' and not model_available('char'):
+        console.print(f"[bold yellow]⚠[/bold yellow]  找不到逐字模型 {CHAR_MODEL_PATH}，改用 cnn 模式")
+        mode = 'cnn'
+    if not model_available('cnn'):
+        console.print(f"[bold red]✗[/bold red]  找不到驗證碼模型 {MODEL_PATH}；請先訓練模型，或加上 -C 手動輸入驗證碼")
+        raise SystemExit(1)
+    return mode
+
+
 # CLI arg names that map directly to config file keys
 _CONFIG_KEYS = {
     'from_station', 'to_station', 'date', 'time', 'adult_count',
     'student_count', 'personal_id', 'phone', 'seat_prefer', 'class_type',
-    'snatch_end', 'snatch_interval', 'snatch_single',
+    'snatch_end', 'snatch_interval', 'snatch_single', 'metrics_port', 'no_archive',
+    'solver_mode', 'http_pool_size', 'no_keep_alive', 'http_retries', 'http_backoff', 'http_timeouts',
+    'http2',
 }
 
 
@@ -99,8 +117,21 @@ def main():
 
     # Feature flags
     parser.add_argument('-C', '--no-auto-captcha', action='store_true', help='停用自動辨識驗證碼（改為手動輸入）')
+    parser.add_argument('--solver-mode', choices=['cnn', 'char'], default='cnn',
+                        help='驗證碼辨識模式 cnn:整張圖片模型 char:切割單字元小模型（需 thsrc_char.onnx）')
     parser.add_argument('-m', '--use-membership', action='store_true', help='使用高鐵會員身分')
     parser.add_argument('--dry-run', action='store_true', help='模擬模式：完整執行流程但不實際送出訂位')
+    parser.add_argument('--capture', metavar='FILE', help='將請求／回應（已遮蔽個資）記錄至 JSONL 檔，供離線重播')
+    parser.add_argument('--base-url', metavar='URL', help='改連線至本機模擬伺服器（thsr_ticket.remote.standin_server）')
+    parser.add_argument('--no-archive', action='store_true', help='不儲存驗證碼圖片供訓練使用（搶票時減少延遲）')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', help='於本機此埠提供 Prometheus 監控指標 (/metrics)')
+
+    # HTTP connections
+    parser.add_argument('--http-pool-size', type=int, default=4, metavar='N', help='每個主機保持的連線數，所有重試共用（預設 4）')
+    parser.add_argument('--no-keep-alive', action='store_true', help='每個請求後關閉連線')
+    parser.add_argument('--http-retries', type=int, default=3, metavar='N', help='連線錯誤及 429/5xx（僅 GET）重試次數（預設 3）')
+    parser.add_argument('--http-backoff', type=float, default=0.5, metavar='SECONDS', help='重試退避係數（預設 0.5）')
+    parser.add_argument('--http2', action='store_true', help='改用 HTTP/2（httpx）；需安裝 thsr-ticket[http2]')
 
     # Info commands
     parser.add_argument('--list-station', action='store_true', help='列出所有車站')
@@ -121,6 +152,14 @@ def main():
         list_time_table()
         return
 
+    if not args.no_auto_captcha:
+        args.solver_mode = _check_solver_model(args.solver_mode)
+
+    if args.metrics_port:
+        from thsr_ticket.metrics import start_metrics_server
+        start_metrics_server(args.metrics_port)
+        console.print(f"[dim]監控指標：http://127.0.0.1:{args.metrics_port}/metrics[/dim]")
+
     flow = BookingFlow(
         auto_captcha=not args.no_auto_captcha,
         use_membership=args.use_membership,
@@ -139,6 +178,16 @@ def main():
         snatch_end=args.snatch_end,
         snatch_interval=args.snatch_interval,
         dry_run=args.dry_run,
+        base_url=args.base_url,
+        capture_path=args.capture,
+        archive_captchas=not args.no_archive,
+        solver_mode=args.solver_mode,
+        http_pool_size=args.http_pool_size,
+        http_keep_alive=not args.no_keep_alive,
+        http_retries=args.http_retries,
+        http_backoff=args.http_backoff,
+        http_timeouts=getattr(args, 'http_timeouts', None),  # config file only
+        http2=args.http2,
     )
     try:
         flow.run()
@@ -0,0 +1,274 @@
+"""Minimal Prometheus/OpenMetrics exporter for long snatch runs.
+
+Metrics are always collected in-process (a few dict updates per event); the
+HTTP endpoint is only started when `start_metrics_server` is called, e.g. via
+`thsr-ticket --metrics-port 9100`.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Sequence, Tuple, TypeVar
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: expected labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def _header(self) -> List[str]:
+        return [f'# TYPE {self.name} {self.kind}', f'# HELP {self.name} {self.documentation}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def remove(self, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            state[idx] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0.0
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, state in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, state):
+                cumulative += n
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {int(cumulative)}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{labels} {int(state[-1])}')
+        return lines
+
+
+M = TypeVar('M', bound=_Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f'Duplicated metric name: {metric.name}')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> bytes:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        lines.append('# EOF')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+REGISTRY = Registry()
+
+BOOKING_ATTEMPTS = REGISTRY.register(Counter(
+    'thsr_booking_attempts', 'First-page submissions (one per captcha attempt).',
+))
+BOOKING_STATUS = REGISTRY.register(Counter(
+    'thsr_booking_status', "Results of BookingFlow date attempts ('success'/'no_trains'/'error').", ['status'],
+))
+NO_TRAINS_ROUNDS = REGISTRY.register(Counter(
+    'thsr_no_trains_rounds', 'Snatch rounds in which every date had no available train.',
+))
+CAPTCHA_RESULTS = REGISTRY.register(Counter(
+    'thsr_captcha_results', "Captcha answers by THSR's reply ('accepted'/'rejected'/'other_error').", ['result'],
+))
+CAPTCHA_LOW_CONFIDENCE = REGISTRY.register(Counter(
+    'thsr_captcha_low_confidence', 'Sessions dropped because of LowConfidenceError.',
+))
+CAPTCHA_ARCHIVE_DROPPED = REGISTRY.register(Counter(
+    'thsr_captcha_archive_dropped', 'Captchas not archived because the writer queue was full or the write failed.',
+))
+CAPTCHA_ARCHIVE_FSYNC_ERRORS = REGISTRY.register(Counter(
+    'thsr_captcha_archive_fsync_errors', 'Archived captcha batches whose fsync failed (written, maybe not durable).',
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'thsr_http_request_seconds', 'Latency of HTTPRequest calls per endpoint.', ['endpoint'],
+))
+SOLVER_SECONDS = REGISTRY.register(Histogram(
+    'thsr_solver_seconds', 'Latency of captcha_solver.solve.',
+))
+SOLVER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'thsr_solver_queue_depth', 'Captcha solves currently waiting or running.',
+))
+SOLVER_MODEL_INFO = REGISTRY.register(Gauge(
+    'thsr_solver_model_info', 'Captcha model in use (value 1), by mode and md5 prefix.', ['mode', 'version'],
+))
+SOLVER_MODEL_RELOADS = REGISTRY.register(Counter(
+    'thsr_solver_model_reloads',
+    "Model file changes picked up while running ('swapped'/'unchanged'/'failed').", ['mode', 'result'],
+))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:  # type: ignore[no-untyped-def]
+        pass  # keep the console clean during snatch runs
+
+
+def start_metrics_server(
+    port: int,
+    addr: str = '127.0.0.1',
+    registry: Registry = REGISTRY,
+) -> ThreadingHTTPServer:
+    """Serve `registry` on http://addr:port/metrics from a daemon thread."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((addr, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='thsr-metrics', daemon=True)
+    thread.start()
+    return server
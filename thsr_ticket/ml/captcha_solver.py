@@ -1,23 +1,177 @@
-import os
+import hashlib
 import io
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Set, Tuple
 
 import cv2
 import numpy as np
 import onnxruntime as ort
 
+from thsr_ticket.metrics import SOLVER_MODEL_INFO, SOLVER_MODEL_RELOADS, SOLVER_QUEUE_DEPTH, SOLVER_SECONDS
+
 WIDTH = 140
 HEIGHT = 48
 ALLOWED_CHARS = '2345679ACDFGHKMNPQRTVWYZ'
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'thsrc_captcha.onnx')
-
-_session = None
+CHAR_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'thsrc_char.onnx')
+NUM_DIGITS = 4
+GLYPH_SIZE = 24
+
+# 'cnn': CaptchaCNN on the whole image. 'char': CharCNN on the 4 glyphs from
+# image_process.segment, falling back to 'cnn' when segmentation fails.
+MODES = ('cnn', 'char')
+
+# How often (at most) solve() stats the model files to pick up a new model.
+WATCH_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel(NamedTuple):
+    session: ort.InferenceSession
+    path: str
+    version: str  # first 12 hex digits of the model file's md5
+    key: tuple  # _file_key(path) when loaded
+    thresholds: Tuple[float, ...]
+
+
+# mode -> LoadedModel. Entries are replaced as a whole, never mutated, so a
+# solve that picked one up keeps a consistent session + thresholds.
+_models: Dict[str, LoadedModel] = {}
+_load_lock = threading.Lock()
+_watch_lock = threading.Lock()
+_last_check: Dict[str, float] = {}
+_reloading: Set[str] = set()
+_failed: Dict[str, tuple] = {}  # mode -> (path, key) that could not be loaded
+_published: Dict[str, str] = {}  # mode -> version exported in SOLVER_MODEL_INFO
+
+
+def _model_path(mode: str) -> str:
+    return CHAR_MODEL_PATH if mode == 'char' else MODEL_PATH
+
+
+def _file_key(path: str) -> tuple:
+    """Changes whenever the model or its thresholds file is replaced or rewritten."""
+    st = os.stat(path)
+    try:
+        thresholds_mtime = os.stat(thresholds_path(path)).st_mtime_ns
+    except OSError:
+        thresholds_mtime = None
+    return st.st_ino, st.st_size, st.st_mtime_ns, thresholds_mtime
+
+
+def _load(path: str, previous: Optional[LoadedModel] = None) -> LoadedModel:
+    key = _file_key(path)  # taken first: a replace during the load shows up on the next check
+    with open(path, 'rb') as f:
+        data = f.read()
+    md5 = hashlib.md5(data).hexdigest()
+    thresholds = _load_thresholds(path, md5)
+    if previous is not None and previous.version == md5[:12]:
+        return previous._replace(path=path, key=key, thresholds=thresholds)  # touched, or new thresholds
+    session = ort.InferenceSession(data, providers=['CPUExecutionProvider'])
+    return LoadedModel(session, path, md5[:12], key, thresholds)
+
+
+def _publish(mode: str, model: LoadedModel) -> None:
+    _models[mode] = model
+    old = _published.get(mode)
+    if old != model.version:
+        if old is not None:
+            SOLVER_MODEL_INFO.remove(mode=mode, version=old)
+            logger.info('captcha %s model %s -> %s (%s)', mode, old, model.version, model.path)
+        SOLVER_MODEL_INFO.set(1, mode=mode, version=model.version)
+        _published[mode] = model.version
+
+
+def _get_model(mode: str = 'cnn') -> LoadedModel:
+    model = _models.get(mode)
+    if model is None:
+        with _load_lock:
+            model = _models.get(mode)
+            if model is None:
+                model = _load(_model_path(mode))
+                _publish(mode, model)
+        return model
+    _watch(mode, model)
+    return model
+
+
+def _watch(mode: str, model: LoadedModel) -> None:
+    """Stat the model file every WATCH_INTERVAL; if it changed, load it in the background.
+
+    Solves keep using `model` until the new one is ready, so a swap never
+    stalls a booking.
+    """
+    now = time.monotonic()
+    with _watch_lock:
+        if mode in _reloading or now - _last_check.get(mode, -WATCH_INTERVAL) < WATCH_INTERVAL:
+            return
+        _last_check[mode] = now
+        path = _model_path(mode)
+        try:
+            key = _file_key(path)
+        except OSError:
+            return  # being replaced or removed: keep the current model
+        if (path, key) == (model.path, model.key) or _failed.get(mode) == (path, key):
+            return
+        _reloading.add(mode)
+    threading.Thread(
+        target=_reload, args=(mode, path, key, model), name=f'thsr-model-reload-{mode}', daemon=True,
+    ).start()
+
+
+def _reload(mode: str, path: str, key: tuple, previous: LoadedModel) -> None:
+    try:
+        model = _load(path, previous)
+    except Exception as e:  # e.g. a half-written file; retried once it changes again
+        _failed[mode] = (path, key)
+        SOLVER_MODEL_RELOADS.inc(mode=mode, result='failed')
+        logger.warning('captcha %s model %s not loaded, keeping %s: %s', mode, path, previous.version, e)
+        return
+    finally:
+        with _watch_lock:
+            _reloading.discard(mode)
+    with _load_lock:
+        if _models.get(mode) is not previous:
+            return  # reload_model() or another reload got there first
+        _publish(mode, model)
+    SOLVER_MODEL_RELOADS.inc(mode=mode, result='swapped' if model.version != previous.version else 'unchanged')
 
 
 def _get_session() -> ort.InferenceSession:
-    global _session
-    if _session is None:
-        _session = ort.InferenceSession(MODEL_PATH, providers=['CPUExecutionProvider'])
-    return _session
+    return _get_model('cnn').session
+
+
+def _get_char_session() -> ort.InferenceSession:
+    return _get_model('char').session
+
+
+def model_version(mode: str = 'cnn') -> Optional[str]:
+    """Version of the loaded model for `mode`, None before the first solve."""
+    model = _models.get(mode)
+    return model.version if model is not None else None
+
+
+def model_available(mode: str = 'cnn') -> bool:
+    """Whether the model file for `mode` exists; not every checkout ships both."""
+    return os.path.exists(_model_path(mode))
+
+
+def reload_model() -> None:
+    """Drop the loaded models so the next solve() loads MODEL_PATH / CHAR_MODEL_PATH right away.
+
+    Replacing the model file is enough for running processes: solve() notices
+    within WATCH_INTERVAL and swaps it in without blocking.
+    """
+    with _load_lock:
+        _models.clear()
+    with _watch_lock:
+        _last_check.clear()
+        _failed.clear()
 
 
 def _poly_features_deg2(x: np.ndarray) -> np.ndarray:
@@ -78,6 +232,20 @@ def _preprocess(img_bgr: np.ndarray) -> np.ndarray:
     return result
 
 
+def _preprocess_legacy(img_bgr: np.ndarray) -> np.ndarray:
+    """image_process line elimination, inverted to the same white-on-black layout as _preprocess."""
+    from thsr_ticket.ml.image_process import clean_img
+    return 255 - clean_img(cv2.resize(img_bgr, (WIDTH, HEIGHT)))
+
+
+# The shipped model is trained on 'regression' output; other strategies need
+# a model trained on their own output.
+PREPROCESSORS = {
+    'regression': _preprocess,
+    'legacy': _preprocess_legacy,
+}
+
+
 MIN_CONFIDENCE = 0.8
 
 
@@ -85,21 +253,63 @@ class LowConfidenceError(Exception):
     pass
 
 
-def _predict(img_bgr_48x140: np.ndarray) -> str:
+def thresholds_path(model_path: str) -> str:
+    """Where calibrate stores per-position thresholds for `model_path`."""
+    return os.path.splitext(model_path)[0] + '.thresholds.json'
+
+
+def _load_thresholds(model_path: str, model_md5: Optional[str] = None) -> Tuple[float, ...]:
+    """Thresholds calibrated for this exact model file, else MIN_CONFIDENCE everywhere."""
+    default = (MIN_CONFIDENCE,) * NUM_DIGITS
+    try:
+        with open(thresholds_path(model_path)) as f:
+            data = json.load(f)
+        if model_md5 is None:
+            with open(model_path, 'rb') as f:
+                model_md5 = hashlib.md5(f.read()).hexdigest()
+    except (OSError, ValueError):
+        return default
+    thresholds = data.get('thresholds', [])
+    if data.get('model_md5') != model_md5 or len(thresholds) != NUM_DIGITS:
+        return default  # calibrated for a model that has since been replaced
+    return tuple(float(t) for t in thresholds)
+
+
+def _get_thresholds(mode: str = 'cnn') -> Tuple[float, ...]:
+    return _get_model(mode).thresholds
+
+
+def _probs(img_bgr_48x140: np.ndarray, session: Optional[ort.InferenceSession] = None) -> np.ndarray:
+    """[NUM_DIGITS, len(ALLOWED_CHARS)] softmax outputs of the whole-image model."""
     normalized = img_bgr_48x140.astype(np.float32) / 255.0
     batch = np.expand_dims(normalized, axis=0)
 
-    session = _get_session()
+    if session is None:
+        session = _get_session()
     input_name = session.get_inputs()[0].name
     output_names = [o.name for o in session.get_outputs()]
     predictions = session.run(output_names, {input_name: batch})
 
+    return np.stack([pred[0] for pred in predictions])
+
+
+def _char_probs(glyphs: np.ndarray, session: Optional[ort.InferenceSession] = None) -> np.ndarray:
+    """glyphs: [4, 24, 24] uint8 from image_process.segment."""
+    batch = glyphs[..., np.newaxis].astype(np.float32) / 255.0
+    if session is None:
+        session = _get_char_session()
+    (probs,) = session.run(None, {session.get_inputs()[0].name: batch})
+    return probs
+
+
+def _decode(probs, thresholds: Optional[Sequence[float]] = None) -> str:
+    if thresholds is None:
+        thresholds = (MIN_CONFIDENCE,) * len(probs)
     result = ''
-    for i, pred in enumerate(predictions):
-        prob = pred[0]
+    for i, prob in enumerate(probs):
         char_idx = np.argmax(prob)
         confidence = prob[char_idx]
-        if confidence < MIN_CONFIDENCE:
+        if confidence < thresholds[i]:
             raise LowConfidenceError(
                 f'字元 {i+1} 信心度過低 ({confidence:.2f}), 可能包含模型不認識的字元'
             )
@@ -107,18 +317,79 @@ def _predict(img_bgr_48x140: np.ndarray) -> str:
     return result
 
 
-def solve(img_bytes: bytes, debug: bool = False) -> str:
+def _predict(img_bgr_48x140: np.ndarray) -> str:
+    model = _get_model('cnn')
+    return _decode(_probs(img_bgr_48x140, model.session), model.thresholds)
+
+
+def _predict_chars(glyphs: np.ndarray) -> str:
+    model = _get_model('char')
+    return _decode(_char_probs(glyphs, model.session), model.thresholds)
+
+
+class Prediction(NamedTuple):
+    probs: np.ndarray  # [NUM_DIGITS, len(ALLOWED_CHARS)]
+    mode: str  # the model actually used: 'char' falls back to 'cnn'
+    timings: Dict[str, float]  # seconds spent in 'decode', 'preprocess' and 'inference'
+    version: str = ''  # LoadedModel.version of the model used
+    thresholds: Optional[Tuple[float, ...]] = None  # that model's thresholds
+
+    @property
+    def text(self) -> str:
+        return ''.join(ALLOWED_CHARS[i] for i in self.probs.argmax(axis=1))
+
+    @property
+    def confidences(self) -> np.ndarray:
+        return self.probs.max(axis=1)
+
+
+def predict(img_bytes: bytes, debug: bool = False, preprocess: str = 'regression', mode: str = 'cnn') -> Prediction:
+    """Run the solver without the confidence check; used by solve(), evaluate and calibrate."""
+    t0 = time.perf_counter()
     img_array = np.frombuffer(img_bytes, dtype=np.uint8)
     img_bgr = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
     img_bgr = cv2.resize(img_bgr, (WIDTH, HEIGHT))
+    t1 = time.perf_counter()
 
     if debug:
         cv2.imwrite('/tmp/captcha_raw.jpg', img_bgr)
 
-    gray = _preprocess(img_bgr)
+    if mode == 'char':
+        from thsr_ticket.ml.image_process import segment
+        glyphs = segment(img_bgr, NUM_DIGITS, GLYPH_SIZE)
+        if glyphs is not None:
+            t2 = time.perf_counter()
+            model = _get_model('char')
+            probs = _char_probs(glyphs, model.session)
+            timings = _timings(t0, t1, t2, time.perf_counter())
+            return Prediction(probs, 'char', timings, model.version, model.thresholds)
+
+    gray = PREPROCESSORS[preprocess](img_bgr)
     preprocessed_bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    t2 = time.perf_counter()
 
     if debug:
         cv2.imwrite('/tmp/captcha_preprocessed.jpg', gray)
 
-    return _predict(preprocessed_bgr)
+    model = _get_model('cnn')
+    probs = _probs(preprocessed_bgr, model.session)
+    timings = _timings(t0, t1, t2, time.perf_counter())
+    return Prediction(probs, 'cnn', timings, model.version, model.thresholds)
+
+
+def _timings(t0: float, t1: float, t2: float, t3: float) -> Dict[str, float]:
+    return {'decode': t1 - t0, 'preprocess': t2 - t1, 'inference': t3 - t2}
+
+
+def solve(img_bytes: bytes, debug: bool = False, preprocess: str = 'regression', mode: str = 'cnn') -> str:
+    SOLVER_QUEUE_DEPTH.inc()
+    try:
+        with SOLVER_SECONDS.time():
+            return _solve(img_bytes, debug=debug, preprocess=preprocess, mode=mode)
+    finally:
+        SOLVER_QUEUE_DEPTH.dec()
+
+
+def _solve(img_bytes: bytes, debug: bool = False, preprocess: str = 'regression', mode: str = 'cnn') -> str:
+    prediction = predict(img_bytes, debug=debug, preprocess=preprocess, mode=mode)
+    return _decode(prediction.probs, prediction.thresholds)
@@ -1,43 +1,127 @@
+import math
 import os
 import random
 import time
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import cv2
 import numpy as np
 from PIL import Image, ImageFont
 from PIL.ImageDraw import Draw
 
 from thsr_ticket.ml.train.config import ALLOWED_CHARS, HEIGHT, WIDTH
 
+# Largest random offset of a character on its own canvas.
+MAX_OFFSET = 6
+
+
+def load_font(size: int) -> ImageFont.FreeTypeFont:
+    candidates = [
+        "calibri.ttf",
+        "/System/Library/Fonts/Supplemental/Arial.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    ]
+    for path in candidates:
+        try:
+            return ImageFont.truetype(path, size=size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+class GlyphAtlas:
+    """Pre-rendered rasters and font bboxes of every captcha character at one font size.
+
+    Each raster is the character drawn in black at (MAX_OFFSET, MAX_OFFSET)
+    on a white canvas of (font_size - 6 + MAX_OFFSET)^2, so the canvas
+    GenerateCaptcha starts from for an offset (dx, dy) is a crop of it
+    (see `glyph`), including glyphs with a negative left bearing.
+    """
+
+    def __init__(
+        self,
+        font_size: int,
+        rasters: Dict[str, np.ndarray],
+        bboxes: Dict[str, Tuple[int, int, int, int]],
+    ) -> None:
+        self.font_size = font_size
+        self.rasters = rasters
+        self.bboxes = bboxes
+
+    @classmethod
+    def build(cls, font_size: int, chars: str = ALLOWED_CHARS) -> "GlyphAtlas":
+        font = load_font(font_size)
+        side = font_size - 6 + MAX_OFFSET
+        rasters = {}
+        bboxes = {}
+        for c in chars:
+            im = Image.new("L", (side, side), color=255)
+            Draw(im).text((MAX_OFFSET, MAX_OFFSET), c, font=font, fill=0)
+            rasters[c] = np.asarray(im)
+            bboxes[c] = tuple(int(v) for v in font.getbbox(c))
+        return cls(font_size, rasters, bboxes)
+
+    def glyph(self, c: str, dx: int, dy: int) -> np.ndarray:
+        """`c` drawn at (dx, dy) on a (font_size - 6 + dx, font_size - 6 + dy) canvas."""
+        return self.rasters[c][MAX_OFFSET - dy:, MAX_OFFSET - dx:]
+
+    def save(self, path: str) -> None:
+        chars = list(self.rasters)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                font_size=np.array(self.font_size),
+                chars=np.array(chars),
+                rasters=np.stack([self.rasters[c] for c in chars]),
+                bboxes=np.array([self.bboxes[c] for c in chars]),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "GlyphAtlas":
+        with np.load(path) as data:
+            chars = [str(c) for c in data["chars"]]
+            return cls(
+                int(data["font_size"]),
+                dict(zip(chars, data["rasters"])),
+                {c: tuple(int(v) for v in b) for c, b in zip(chars, data["bboxes"])},
+            )
+
+
+_ATLASES: Dict[int, GlyphAtlas] = {}
+
+
+def glyph_atlas(font_size: int, path: Optional[str] = None) -> GlyphAtlas:
+    """The shared atlas for `font_size`: loaded from `path` if it exists,
+    otherwise rendered once (and written to `path` when given)."""
+    atlas = _ATLASES.get(font_size)
+    if atlas is None:
+        if path and os.path.exists(path):
+            atlas = GlyphAtlas.load(path)
+            if atlas.font_size != font_size:
+                raise ValueError(f"{path} holds font size {atlas.font_size}, not {font_size}")
+        else:
+            atlas = GlyphAtlas.build(font_size)
+            if path:
+                atlas.save(path)
+        _ATLASES[font_size] = atlas
+    return atlas
+
 
 class GenerateCaptcha:
     def __init__(
             self,
             width: int = WIDTH,
             height: int = HEIGHT,
-            font_size: int = 50
+            font_size: int = 50,
+            atlas_path: Optional[str] = None,
         ) -> None:
         self._width = width
         self._height = height
         self._font_size = font_size
         self._mode = "L"  # 8-bit pixel
-        self._font = self._load_font(font_size)
+        self._atlas = glyph_atlas(font_size, atlas_path)
         self._chars = list(ALLOWED_CHARS)
 
-    @staticmethod
-    def _load_font(size: int) -> ImageFont.FreeTypeFont:
-        candidates = [
-            "calibri.ttf",
-            "/System/Library/Fonts/Supplemental/Arial.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        ]
-        for path in candidates:
-            try:
-                return ImageFont.truetype(path, size=size)
-            except OSError:
-                continue
-        return ImageFont.load_default()
-
     def generate(self) -> Tuple[Image.Image, List[str]]:
         image = Image.new(self._mode, (self._width, self._height), color=255)
         c_list = list(np.random.choice(self._chars, size=4, replace=True))
@@ -81,10 +165,9 @@ class GenerateCaptcha:
     def _draw_character(self, img: Image.Image, c: str) -> Image.Image:
         w, h = self._font_size - 6, self._font_size - 6
 
-        dx = random.randint(0, 6)
-        dy = random.randint(0, 6)
-        im = Image.new(self._mode, (w + dx, h + dy), color=255)
-        Draw(im).text((dx, dy), c, font=self._font, fill=0)
+        dx = random.randint(0, MAX_OFFSET)
+        dy = random.randint(0, MAX_OFFSET)
+        im = Image.fromarray(self._atlas.glyph(c, dx, dy))
 
         # rotate
         bbox = im.getbbox()
@@ -124,7 +207,7 @@ class GenerateCaptcha:
 
         table = [150 for _ in range(256)]
         for idx, im in enumerate(images):
-            bbox = self._font.getbbox(chars[idx])
+            bbox = self._atlas.bboxes[chars[idx]]
             w = bbox[2] - bbox[0]
             h = bbox[3] - bbox[1]
             mask = im.point(table)
@@ -136,9 +219,127 @@ class GenerateCaptcha:
         arr = np.where(arr < 255, 0, 255)
         return Image.fromarray(arr.astype(np.uint8))
 
+    def _glyph_transform(self, w1: int, h1: int, angle: float, quad: np.ndarray) -> np.ndarray:
+        """3x3 matrix doing _draw_character's rotate, resize and QUAD warp at once
+        on a w1 x h1 character canvas."""
+        w = h = self._font_size - 6
 
-def generate_captcha(num_caps: int, save_path: str = None) -> None:
-    captcha = GenerateCaptcha()
+        # rotate about the centre, expanding the canvas like Image.rotate(expand=1)
+        a = math.radians(angle)
+        cos, sin = math.cos(a), math.sin(a)
+        nw = math.ceil(abs(w1 * cos) + abs(h1 * sin))
+        nh = math.ceil(abs(w1 * sin) + abs(h1 * cos))
+        rot = np.array([
+            [cos, sin, nw / 2 - cos * w1 / 2 - sin * h1 / 2],
+            [-sin, cos, nh / 2 + sin * w1 / 2 - cos * h1 / 2],
+            [0, 0, 1],
+        ])
+
+        x1, y1, x2, y2 = quad
+        w2 = w + abs(x1) + abs(x2)
+        h2 = h + abs(y1) + abs(y2)
+        scale = np.diag([w2 / nw, h2 / nh, 1.0])
+        src = np.float32([[x1, y1], [-x1, h2 - y2], [w2 + x2, h2 + y2], [w2 - x2, -y1]])
+        dst = np.float32([[0, 0], [0, h], [w, h], [w, 0]])
+        warp = cv2.getPerspectiveTransform(src, dst)
+        return warp @ scale @ rot
+
+    def _render_text(self, chars: List[str], params: np.ndarray, out: np.ndarray) -> int:
+        """Draw `chars` like draw_characters, resize the cropped result into `out`.
+
+        Returns the width of the crop before resizing.
+        """
+        w = h = self._font_size - 6
+        canvas = np.full((self._height, self._width), 255, dtype=np.uint8)
+        rand = int(0.1 * w)
+        offset = int(w * 0.1)
+        bw = 0
+        for c, (angle, dx, dy, fx1, fy1, fx2, fy2, step) in zip(chars, params):
+            raster = self._atlas.glyph(c, int(dx), int(dy))
+            bbox = self._atlas.bboxes[c]
+            bw, bh = bbox[2] - bbox[0], bbox[3] - bbox[1]
+            quad = np.array([fx1 * w, fy1 * h, fx2 * w, fy2 * h]).astype(int)
+            glyph = cv2.warpPerspective(
+                raster, self._glyph_transform(raster.shape[1], raster.shape[0], angle, quad), (w, h),
+                flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=255,
+            )
+            top = (self._height - bh) // 2
+            x0, y0 = max(offset, 0), max(top, 0)
+            x1, y1 = min(offset + w, self._width), min(top + h, self._height)
+            if x1 > x0 and y1 > y0:
+                region = canvas[y0:y1, x0:x1]
+                np.minimum(region, glyph[y0 - top:y1 - top, x0 - offset:x1 - offset], out=region)
+            offset += bw + int(step * (rand + 1)) - rand
+
+        h_offset = 4
+        crop = canvas[h_offset:-h_offset, :max(offset + bw // 3, 1)]
+        crop = np.where(crop < 255, 0, 255).astype(np.uint8)
+        out[...] = cv2.resize(crop, (self._width, self._height), interpolation=cv2.INTER_NEAREST)
+        return crop.shape[1]
+
+    def _add_arcs(self, batch: np.ndarray, widths: np.ndarray) -> None:
+        """Vectorised add_arc; `widths` are the pre-resize widths the arc is defined on."""
+        k, height, width = batch.shape
+        start = np.random.randint(20, 26, size=k).astype(np.float64)
+        diff = np.random.randint(15, 19, size=k)
+        mid = np.random.randint(32, 39, size=k).astype(np.float64)
+        px = np.stack([np.zeros(k), mid, widths.astype(np.float64)], axis=1)
+        py = np.stack([start, start - diff // 2, start - diff], axis=1)
+
+        # quadratic through the three points (Lagrange form), at every output column
+        x = np.arange(width)[None, :] * (widths[:, None] / width)
+        yy = np.zeros((k, width))
+        for i in range(3):
+            term = py[:, i:i + 1]
+            for j in range(3):
+                if j != i:
+                    term = term * (x - px[:, j:j + 1]) / (px[:, i:i + 1] - px[:, j:j + 1])
+            yy += term
+        yy = np.round(yy)[:, None, :]
+
+        rows = np.arange(height)[None, :, None] * ((height - 8) / height)
+        mask = (rows >= yy - 2) & (rows < yy + 2)
+        np.copyto(batch, np.where(batch < 128, 255, 0).astype(np.uint8), where=mask)
+
+    @staticmethod
+    def _add_noise_batch(batch: np.ndarray, color_bound: int = 80, prob: float = 0.03) -> None:
+        """add_noise followed by add_sp_noise over the whole batch."""
+        # bright pixels lose at most color_bound, dark ones gain at most that: no uint8 wrap-around
+        noise = np.random.randint(0, color_bound + 1, size=batch.shape, dtype=np.uint8)
+        np.copyto(batch, np.where(batch > color_bound, batch - noise, batch + noise))
+        flip = np.random.random(batch.shape) < prob
+        np.copyto(batch, np.where(batch > 128, 0, 255).astype(np.uint8), where=flip)
+
+    def generate_batch(self, k: int, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[str]]:
+        """Render `k` captchas into a [k, height, width] uint8 array.
+
+        Same drawing steps as `generate`, but each character's rotate/resize/warp is a single cv2.warpPerspective, and
+        arcs and noise are applied to the whole batch at once at the final
+        size (generate() leaves the resize to the caller).
+        """
+        if out is None:
+            out = np.empty((k, self._height, self._width), dtype=np.uint8)
+        labels = np.random.choice(self._chars, size=(k, 4), replace=True)
+
+        # per character: angle, dx, dy, quad offsets as fractions of w/h, spacing step in [0, 1)
+        mag = np.random.uniform(0.1, 0.2, size=(k, 4, 4))
+        params = np.concatenate([
+            np.random.uniform(-10, 5, size=(k, 4, 1)),
+            np.random.randint(0, MAX_OFFSET + 1, size=(k, 4, 2)),
+            np.random.uniform(-1, 1, size=(k, 4, 4)) * mag,
+            np.random.random(size=(k, 4, 1)),
+        ], axis=2)
+
+        widths = np.empty(k, dtype=np.int64)
+        for i in range(k):
+            widths[i] = self._render_text(list(labels[i]), params[i], out[i])
+        self._add_arcs(out, widths)
+        self._add_noise_batch(out)
+        return out, [''.join(row) for row in labels]
+
+
+def generate_captcha(num_caps: int, save_path: str = None, atlas_path: str = None) -> None:
+    captcha = GenerateCaptcha(atlas_path=atlas_path)
     for i in range(num_caps):
         img, c_list = captcha.generate()
         if save_path is not None:
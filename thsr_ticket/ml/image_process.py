@@ -1,13 +1,9 @@
 import cv2
-import imutils
 import numpy as np
-import matplotlib.pyplot as plt
-
-from sklearn.linear_model import Ridge
-from sklearn.preprocessing import PolynomialFeatures
 
 
 def show(data):
+    import matplotlib.pyplot as plt
     plt.imshow(data)
     plt.show()
 
@@ -26,68 +22,88 @@ def find_start_end(img):
 
 def linear_func(sy, ey, length=122):
     delta = (ey-sy)/length
-    func = lambda x: delta*x + sy
-    return [np.round(func(i)).astype('int') for i in range(length)]
+    return np.round(delta*np.arange(length) + sy).astype('int')
+
+def _gray(img):
+    return np.average(img, axis=2) if img.ndim == 3 else img.astype('float')
+
+def _bound_table(avg, low_b, up_b):
+    """Offset of the boundary from the window centre: column i, window centred on row c -> table[c, i]."""
+    h = avg.shape[0]
+    rows = (np.arange(h)[:, None] + np.arange(low_b, up_b)[None, :]) % h  # negative rows wrap, like img[rr]
+    diff = np.abs(np.diff(avg[rows], axis=1))                            # [h, len(rr)-1, w]
+    return np.where(diff.max(axis=1) > 50, diff.argmax(axis=1) + low_b, 0)
 
-def _find_bound(img, sy, ey, up_b=3):
+def _find_bound(img, sy, ey, up_b=3, table=None):
     y = linear_func(sy, ey, img.shape[1])
     low_b = -2
     impt = 0.9
-    for i in range(1, img.shape[1]):
-        y_center = np.round(impt*y[i-1] + (1-impt)*y[i]).astype('int')
-        rr = range(y_center+low_b, y_center+up_b)
-        chunk = np.average(img[rr, i], axis=1)
-        diff = [abs(chunk[i]-chunk[i-1]) for i in range(1, len(chunk))]
-        max_diff = max(diff)
-        max_idx = diff.index(max_diff) if max_diff>50 else -low_b
-        yi = max_idx + rr[0]
-        y[i] = min(y[i], yi)
-    return y
+    if table is None:
+        table = _bound_table(_gray(img), low_b, up_b)
+    h = table.shape[0]
+    # Each column's window is centred on the previous column's result, so only
+    # this lookup stays sequential.
+    out = y.tolist()
+    for i in range(1, len(out)):
+        y_center = round(impt*out[i-1] + (1-impt)*float(y[i]))
+        out[i] = min(out[i], y_center + int(table[y_center % h, i]))
+    return np.array(out)
 
 def find_bound(img, sy, ey):
-    result = []
-    for up_b in range(1, 4):
-        result.append(_find_bound(img, sy, ey, up_b=up_b))
+    avg = _gray(img)
+    result = [_find_bound(img, sy, ey, up_b, _bound_table(avg, -2, up_b)) for up_b in range(1, 4)]
 
     end_ys = [abs(y[-1]-ey) for y in result]
-    #end_ys.reverse()
-    #min_diff = len(result)-end_ys.index(min(end_ys))-1
     min_diff = end_ys.index(min(end_ys))-1
     return result[min_diff]
 
 def adjust_line(img, y):
-    yy = y.copy()
     toler = 2
     th = 150
-    for i in range(len(y)):
-        for ii in range(1, toler+1):
-            last_v = np.average(img[yy[i], i])
-            cur_v = np.average(img[yy[i]+ii, i])
-            if abs(cur_v-last_v) > th:
-                yy[i] = yy[i]+ii
-                break
-    return yy
+    avg = _gray(img)
+    h = avg.shape[0]
+    y = np.asarray(y)
+    cols = np.arange(len(y))
+    base = avg[y % h, cols]
+    steps = np.arange(1, toler+1)
+    cur = avg[(y[:, None] + steps[None, :]) % h, cols[:, None]]
+    jump = np.abs(cur - base[:, None]) > th
+    return y + np.where(jump.any(axis=1), jump.argmax(axis=1) + 1, 0)
+
+def ridge_fit_predict(x, y, alpha=1.0):
+    """sklearn Ridge(alpha).fit(x, y).predict(x) in closed form (intercept not penalised)."""
+    x = np.asarray(x, dtype='float')
+    y = np.asarray(y, dtype='float')
+    x_mean, y_mean = x.mean(axis=0), y.mean()
+    xc = x - x_mean
+    w = np.linalg.solve(xc.T @ xc + alpha*np.eye(x.shape[1]), xc.T @ (y - y_mean))
+    return xc @ w + y_mean
 
 def find_line(img, y):
-    rx = np.arange(len(y))
-    x = PolynomialFeatures(degree=2).fit_transform(rx[:, np.newaxis])
-    model = Ridge().fit(x, y)
-    yy = np.round(model.predict(x)).astype('int')
+    rx = np.arange(len(y), dtype='float')
+    x = np.column_stack([rx, rx**2])
+    yy = np.round(ridge_fit_predict(x, y)).astype('int')
     return adjust_line(img, yy)
 
+def _invert_rows(img, top, bottom):
+    """img[top[i]:bottom[i], i] = 255 - img[top[i]:bottom[i], i] for every column at once."""
+    h = img.shape[0]
+    start = np.where(top < 0, np.maximum(top + h, 0), np.minimum(top, h))
+    stop = np.where(bottom < 0, np.maximum(bottom + h, 0), np.minimum(bottom, h))
+    rows = np.arange(h)[:, None]
+    band = (rows >= start[None, :]) & (rows < stop[None, :])
+    return np.where(band, 255 - img, img).astype(img.dtype)
+
 def eliminate_line(image):
     dst = cv2.fastNlMeansDenoisingColored(image, None, 30, 30 , 7 , 21)
     sy, ey = find_start_end(dst)
     fdst = np.where(dst<150, 0, dst)
     y = find_bound(fdst, sy, ey)
-    x = np.arange(fdst.shape[1])
     dy = find_line(fdst, y)
 
     img = cv2.cvtColor(dst, cv2.COLOR_BGR2GRAY)
-    yy = adjust_line(img, np.array(dy)-4)
-    for i in range(len(dy)):
-        img[yy[i]:dy[i], i] = 255 - img[yy[i]:dy[i], i]
-    return img
+    yy = adjust_line(img, dy-4)
+    return _invert_rows(img, yy, dy)
 
 def clean_img(img):
     img = eliminate_line(img.copy())
@@ -103,43 +119,82 @@ def draw_contour(cnt, img_shape):
     img[y, x] = 255
     return img
 
-def extract(img):
+def _split_counts(regions, n):
+    """How many glyphs each region holds: widest-per-glyph regions are split first,
+    and a small fragment is dropped in favour of splitting a wide region."""
+    counts = [1]*len(regions)
+    while sum(counts) < n:
+        i = max(range(len(regions)), key=lambda k: regions[k][2]/counts[k])
+        counts[i] += 1
+    for _ in range(n):
+        j = min(range(len(regions)), key=lambda k: regions[k][2]*regions[k][3])
+        i = max(range(len(regions)), key=lambda k: regions[k][2]/counts[k])
+        if i == j or counts[j] > 1 or regions[j][2] >= 0.5*regions[i][2]/counts[i]:
+            break
+        counts[i] += 1
+        del regions[j], counts[j]
+    return regions, counts
+
+def _split_region(letters, region, k):
+    """Cut a region holding k glyphs at the emptiest column near each even split, then trim rows."""
+    x, y, w, h = region
+    cols = (letters[y:y+h, x:x+w] > 0).sum(axis=0)
+    edges = [0]
+    for e in np.linspace(0, w, k+1)[1:-1]:
+        r = max(1, int(w/k/4))
+        lo, hi = max(edges[-1]+1, int(e)-r), min(w-1, int(e)+r)
+        edges.append(lo + int(np.argmin(cols[lo:hi+1])) if hi >= lo else int(e))
+    edges.append(w)
+    out = []
+    for a, b in zip(edges[:-1], edges[1:]):
+        rows = np.flatnonzero((letters[y:y+h, x+a:x+b] > 0).any(axis=1))
+        top, bot = (rows[0], rows[-1]+1) if len(rows) else (0, h)
+        out.append((x+a, y+top, b-a, bot-top))
+    return out
+
+def extract(img, n=4):
     '''
     Original from: https://github.com/uranus4ever/Captcha-Crack/blob/master/captcha_generator.py#L56
-    extract the 4 codes from img
+    extract the n codes from img
     :param img: cv2 imread BGR Image
-    :return: regions contains (x, y, w, h)
+    :return: regions contains (x, y, w, h) left to right, and the letter crops
+             (white on black) from clean_img
     '''
-    clean = clean_img(img)
+    letters = 255 - clean_img(img)  # glyphs white, as findContours expects
 
     # find the contours (continuous blobs of pixels) the image
-    contours, _ = cv2.findContours(clean.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    letter_image_regions = []
-    for contour in contours:
-        # Get the rectangle that contains the contour
-        (x, y, w, h) = cv2.boundingRect(contour)
-
-        if (w < 10) or (h < 10):
-            continue
-
-        if (x == 0) and (y == 0):
-            remove = np.where(contour[:,0,0]==0)[0]
-            contour = np.delete(contour, remove, axis=0)
-            remove = np.where(contour[:,0,0]==clean.shape[1]-1)
-            contour = np.delete(contour, remove, axis=0)
-            (x, y, w, h) = cv2.boundingRect(contour)
-
-        letter_image_regions.append((x, y, w, h))
-
-    letter_image_regions = sorted(letter_image_regions, key=lambda x: x[2]*x[3], reverse=True)[:4]
-
-    letters = []
-    for region in letter_image_regions:
-        x, y, w, h = region
-        image = clean[y:y+h, x:x+w]
-        letters.append(image)
-
-    return letter_image_regions, letters
+    contours, _ = cv2.findContours(letters, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = [cv2.boundingRect(contour) for contour in contours]
+    regions = [r for r in regions if r[2]*r[3] >= 60 and r[3] >= 8]
+    regions = sorted(regions, key=lambda r: r[2]*r[3], reverse=True)[:n]
+    if not regions:
+        return [], []
+
+    # touching glyphs share one contour: split the widest ones
+    regions, counts = _split_counts(regions, n)
+    letter_image_regions = sorted(r for region, k in zip(regions, counts) for r in _split_region(letters, region, k))
+
+    letters_out = [letters[y:y+h, x:x+w] for x, y, w, h in letter_image_regions]
+    return letter_image_regions, letters_out
+
+def to_glyph(letter, size=24):
+    """Centre a letter crop in a square and resize it to size x size."""
+    h, w = letter.shape
+    side = max(h, w)
+    square = np.zeros((side, side), dtype=np.uint8)
+    top, left = (side-h)//2, (side-w)//2
+    square[top:top+h, left:left+w] = letter
+    return cv2.resize(square, (size, size), interpolation=cv2.INTER_AREA)
+
+def segment(img, n=4, size=24):
+    """n glyphs [n, size, size] uint8 (white on black) left to right, or None if segmentation fails."""
+    try:
+        regions, letters = extract(img, n)
+    except IndexError:
+        return None  # find_start_end found no line to eliminate
+    if len(letters) != n:
+        return None
+    return np.stack([to_glyph(letter, size) for letter in letters])
 
 if __name__ == "__main__":
     image = cv2.imread("captcha8.png")
@@ -0,0 +1,122 @@
+"""Background archiving of booking captchas into the raw training directory.
+
+CaptchaArchiver hands captchas to a single writer thread through a bounded
+queue, so BookingFlow never waits on hashing or disk I/O between retries.
+The writer drains whatever is queued, saves it through the RawManifest and
+then fsyncs the whole batch (images, manifest and directory) at once. If
+the queue is full the captcha is dropped and counted, never blocking the
+booking. Errors are logged and counted; the writer keeps running.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from typing import List, Optional, Tuple
+
+from thsr_ticket.metrics import CAPTCHA_ARCHIVE_DROPPED, CAPTCHA_ARCHIVE_FSYNC_ERRORS
+from thsr_ticket.ml.train.manifest import RawManifest, manifest_for
+
+QUEUE_SIZE = 64
+_STOP = object()
+
+_Item = Tuple[bytes, Optional[str], str, bool]
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CaptchaArchiver:
+    """Saves captchas from a daemon writer thread; started lazily on first submit."""
+
+    def __init__(self, manifest: Optional[RawManifest] = None, maxsize: int = QUEUE_SIZE, fsync: bool = True):
+        self._manifest = manifest
+        self.fsync = fsync
+        self._queue: 'queue.Queue' = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, img_bytes: bytes, label: Optional[str] = None, source: str = '', verified: bool = False) -> bool:
+        """Queue a captcha for saving; False if it was dropped because the queue is full."""
+        self._start()
+        try:
+            self._queue.put_nowait((img_bytes, label, source, verified))
+        except queue.Full:
+            CAPTCHA_ARCHIVE_DROPPED.inc()
+            return False
+        return True
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='thsr-captcha-archive', daemon=True)
+                thread.start()
+                atexit.register(self.close)
+                self._thread = thread
+
+    def _run(self) -> None:
+        manifest = self._manifest
+        while True:
+            batch: List[object] = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            items = [item for item in batch if item is not _STOP]
+            try:
+                if manifest is None and items:
+                    manifest = manifest_for()
+                self._write(manifest, items)  # type: ignore[arg-type]
+            except Exception:
+                # e.g. an unusable raw directory or a corrupt manifest line; the
+                # writer must outlive it or every later submit finds the queue full.
+                logger.exception('captcha archive: %d captchas not saved', len(items))
+                CAPTCHA_ARCHIVE_DROPPED.inc(len(items))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(items) != len(batch):
+                return
+
+    def _write(self, manifest: RawManifest, items: List[_Item]) -> None:
+        paths = []
+        for img_bytes, label, source, verified in items:
+            try:
+                paths.append(manifest.add(img_bytes, label=label, source=source, verified=verified))
+            except OSError:
+                CAPTCHA_ARCHIVE_DROPPED.inc()
+        if self.fsync and paths:
+            try:
+                for path in paths + [manifest.path, manifest.raw_dir]:
+                    _fsync(path)
+            except OSError as e:
+                # e.g. ENOSPC, or a filesystem that cannot fsync a directory
+                logger.warning('captcha archive: fsync failed, %d captchas may not be durable: %s', len(paths), e)
+                CAPTCHA_ARCHIVE_FSYNC_ERRORS.inc()
+
+    def flush(self) -> None:
+        """Block until everything submitted so far is on disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Write out what is queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        atexit.unregister(self.close)
+        with self._start_lock:
+            self._thread = None  # a later submit starts a new writer
@@ -0,0 +1,104 @@
+"""Batched data augmentation on collated training tensors.
+
+BatchAugment works on whole [B, 48, 140, C] float batches (the
+CaptchaDataset / SyntheticCaptchaDataset format) after collation, on
+whatever device they already live on, instead of per-sample PIL work in
+the dataset:
+
+    - affine jitter: small random rotation, scale and shift (affine_grid + grid_sample)
+    - arc overlay: a random quadratic band XOR-ed into the image, like the
+      curve left over when _remove_curve misses part of the arc
+    - salt-and-pepper: flips a fraction of pixels to 0 or 1
+"""
+
+import math
+from typing import Optional
+
+import torch
+import torch.nn.functional as F
+
+
+class BatchAugment:
+    """Callable applying random augmentations to an NHWC float batch in [0, 1].
+
+    `background` is the value exposed by the affine jitter at the borders:
+    0.0 for preprocessed (white-on-black) images, 1.0 for raw ones.
+    """
+
+    def __init__(
+        self,
+        max_rotate: float = 5.0,
+        max_scale: float = 0.05,
+        max_shift: float = 0.05,
+        arc_prob: float = 0.3,
+        arc_width: int = 3,
+        sp_prob: float = 0.01,
+        background: float = 0.0,
+        generator: Optional[torch.Generator] = None,
+    ):
+        self.max_rotate = max_rotate
+        self.max_scale = max_scale
+        self.max_shift = max_shift
+        self.arc_prob = arc_prob
+        self.arc_width = arc_width
+        self.sp_prob = sp_prob
+        self.background = background
+        self.generator = generator
+
+    def _uniform(self, n: int, bound: float, device: torch.device) -> torch.Tensor:
+        return (torch.rand(n, generator=self.generator).to(device) * 2 - 1) * bound
+
+    def affine(self, images: torch.Tensor) -> torch.Tensor:
+        b, h, w, _ = images.shape
+        device = images.device
+        angle = self._uniform(b, math.radians(self.max_rotate), device)
+        scale = 1 + self._uniform(b, self.max_scale, device)
+        tx = self._uniform(b, 2 * self.max_shift, device)
+        ty = self._uniform(b, 2 * self.max_shift, device)
+
+        # normalised coordinates are anisotropic (w != h): rotate in pixel units
+        aspect = w / h
+        cos, sin = torch.cos(angle) / scale, torch.sin(angle) / scale
+        theta = torch.stack([
+            torch.stack([cos, -sin / aspect, tx], dim=1),
+            torch.stack([sin * aspect, cos, ty], dim=1),
+        ], dim=1)
+
+        nchw = images.permute(0, 3, 1, 2) - self.background  # view; zero padding == background
+        grid = F.affine_grid(theta.to(images.dtype), list(nchw.shape), align_corners=False)
+        out = F.grid_sample(nchw, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+        return (out + self.background).permute(0, 2, 3, 1)
+
+    def arcs(self, images: torch.Tensor) -> torch.Tensor:
+        b, h, w, _ = images.shape
+        device = images.device
+        apply = (torch.rand(b, generator=self.generator) < self.arc_prob).to(device)
+        if not apply.any():
+            return images
+
+        # y = a (x - x0)^2 + y0 in pixels, with the vertex somewhere over the image
+        x0 = torch.rand(b, generator=self.generator).to(device) * w
+        y0 = (0.2 + 0.6 * torch.rand(b, generator=self.generator)).to(device) * h
+        a = self._uniform(b, 4.0 * h / (w * w), device)
+        xs = torch.arange(w, device=device, dtype=images.dtype)
+        ys = torch.arange(h, device=device, dtype=images.dtype)
+        centre = a[:, None] * (xs[None, :] - x0[:, None]) ** 2 + y0[:, None]          # [B, W]
+        band = (ys[None, :, None] - centre[:, None, :]).abs() < self.arc_width / 2    # [B, H, W]
+        band &= apply[:, None, None]
+        return torch.where(band[..., None], 1 - images, images)
+
+    def salt_and_pepper(self, images: torch.Tensor) -> torch.Tensor:
+        b, h, w, _ = images.shape
+        noise = torch.rand(b, h, w, 1, generator=self.generator).to(images.device)
+        # noise < sp_prob / 2 -> salt (1), sp_prob / 2 <= noise < sp_prob -> pepper (0)
+        value = (noise < self.sp_prob / 2).to(images.dtype)
+        return torch.where(noise < self.sp_prob, value, images)
+
+    def __call__(self, images: torch.Tensor) -> torch.Tensor:
+        if self.max_rotate or self.max_scale or self.max_shift:
+            images = self.affine(images)
+        if self.arc_prob:
+            images = self.arcs(images)
+        if self.sp_prob:
+            images = self.salt_and_pepper(images)
+        return images.clamp(0.0, 1.0)
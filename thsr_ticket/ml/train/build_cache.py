@@ -0,0 +1,154 @@
+"""Build the preprocessed captcha cache in parallel.
+
+Usage:
+    python -m thsr_ticket.ml.train.build_cache [--workers 8] [--chunk-size 64]
+
+Labeled files that are not cached yet are split into chunks and
+preprocessed on a process pool. Each finished chunk is written straight
+into the staging array (one contiguous file, see
+PreprocessedCache.staging) and recorded in build.json; after Ctrl-C,
+running the command again resumes from the completed chunks.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+
+from thsr_ticket.ml.train.cache import PREPROCESS_VERSION, PreprocessedCache, Sample, load_preprocessed
+from thsr_ticket.ml.train.config import CACHE_DIR, RAW_DIR
+
+PROGRESS_FILE = 'build.json'
+CHUNK_SIZE = 64
+
+
+def _init_worker() -> None:
+    # Ctrl-C is handled by the parent; one OpenCV thread per process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+
+
+def _preprocess_chunk(idx: int, paths: Sequence[str]) -> Tuple[int, np.ndarray]:
+    return idx, np.stack([load_preprocessed(p) for p in paths])
+
+
+def _load_progress(path: str, hashes: List[str], chunk_size: int) -> Set[int]:
+    try:
+        with open(path) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if progress.get('version') != PREPROCESS_VERSION or progress.get('hashes') != hashes:
+        return set()
+    # Chunk indices only map back to the same rows with the same chunk size
+    if progress.get('chunk_size') != chunk_size:
+        return set()
+    return set(progress.get('done', []))
+
+
+def _save_progress(path: str, hashes: List[str], chunk_size: int, done: Set[int]) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({
+            'version': PREPROCESS_VERSION, 'hashes': hashes, 'chunk_size': chunk_size, 'done': sorted(done),
+        }, f)
+    os.replace(tmp, path)
+
+
+def _report(processed: int, completed: int, total: int, elapsed: float) -> None:
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    eta = (total - completed) / rate if rate > 0 else 0.0
+    print(f'\r  {completed}/{total} ({completed / total:.0%}) | {rate:.1f} img/s | ETA {eta:.0f}s ',
+          end='', flush=True)
+
+
+def build(
+    samples: Sequence[Sample],
+    cache_dir: str = CACHE_DIR,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    report: Callable[[int, int, int, float], None] = _report,
+) -> PreprocessedCache:
+    """Preprocess every uncached sample on a process pool and commit the cache."""
+    cache = PreprocessedCache(cache_dir)
+    pending = cache.pending(samples)
+    if pending:
+        hashes = list(pending)
+        progress_path = os.path.join(cache_dir, PROGRESS_FILE)
+        done = _load_progress(progress_path, hashes, chunk_size)
+        try:
+            out = cache.staging(len(hashes), resume=bool(done))
+        except (OSError, ValueError):
+            done = set()
+            out = cache.staging(len(hashes))
+
+        paths = [pending[h][0] for h in hashes]
+        chunks = [
+            (i, paths[start:start + chunk_size])
+            for i, start in enumerate(range(0, len(paths), chunk_size))
+            if i not in done
+        ]
+        completed = len(paths) - sum(len(p) for _, p in chunks)
+        processed = 0
+        t0 = time.perf_counter()
+
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        try:
+            futures = [pool.submit(_preprocess_chunk, i, p) for i, p in chunks]
+            for fut in as_completed(futures):
+                idx, images = fut.result()
+                start = len(cache) + idx * chunk_size
+                out[start:start + len(images)] = images
+                out.flush()
+                done.add(idx)
+                _save_progress(progress_path, hashes, chunk_size, done)
+                processed += len(images)
+                completed += len(images)
+                report(processed, completed, len(paths), time.perf_counter() - t0)
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            out.flush()
+            del out
+        pool.shutdown()
+
+        cache.commit(hashes, [pending[h][1] for h in hashes])
+        os.remove(progress_path)
+
+    cache.sync(samples)  # picks up relabeled files; nothing left to preprocess
+    return cache
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Build the preprocessed captcha cache in parallel')
+    parser.add_argument('--data-dir', default=RAW_DIR)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of preprocessing processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Files per work unit (default: {CHUNK_SIZE})')
+    args = parser.parse_args()
+
+    from thsr_ticket.ml.train.dataset import CaptchaDataset
+    samples = sorted(CaptchaDataset(data_dir=args.data_dir, cache_dir=None).samples)
+    print(f'Labeled samples: {len(samples)}')
+
+    t0 = time.perf_counter()
+    try:
+        cache = build(samples, args.cache_dir, args.workers, args.chunk_size)
+    except KeyboardInterrupt:
+        print('\nInterrupted. Run the same command again to resume from the last completed chunk.')
+        sys.exit(130)
+    print(f'\nCache ready: {len(cache)} images in {args.cache_dir} ({time.perf_counter() - t0:.1f}s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Preprocessed captcha cache for training.
+
+`_preprocess` (fastNlMeans denoise + curve removal) dominates the cost of
+loading a sample, and CaptchaDataset used to redo it for every sample in
+every epoch. The cache keeps its output in one uint8 array of shape
+[N, HEIGHT, WIDTH] plus an int64 label array of shape [N, NUM_DIGITS],
+keyed by the MD5 of each source PNG and by PREPROCESS_VERSION.
+
+Layout of the cache directory:
+    images.npy   uint8 [N, 48, 140], opened with np.load(mmap_mode=...)
+    labels.npy   int64 [N, 4]
+    index.json   {"version": ..., "rows": {md5: row}}
+
+`sync` only preprocesses files whose hash is not cached yet and appends
+them; existing rows never move.
+"""
+
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from thsr_ticket.ml.captcha_solver import _preprocess
+from thsr_ticket.ml.train.config import CACHE_DIR, HEIGHT, NUM_DIGITS, WIDTH
+
+# Bump whenever captcha_solver._preprocess changes its output.
+PREPROCESS_VERSION = 1
+
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.npy'
+INDEX_FILE = 'index.json'
+STAGING_FILE = 'images.npy.tmp'
+
+Sample = Tuple[str, Sequence[int]]
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def load_preprocessed(path: str) -> np.ndarray:
+    """Read a captcha PNG and return the [HEIGHT, WIDTH] uint8 preprocessed image."""
+    img_bgr = cv2.imread(path)
+    if img_bgr is None:
+        raise ValueError(f'Cannot read image: {path}')
+    return _preprocess(cv2.resize(img_bgr, (WIDTH, HEIGHT)))
+
+
+def open_images(cache_dir: str = CACHE_DIR, mode: str = 'c') -> np.ndarray:
+    """Memory-map the cached images.
+
+    The default copy-on-write mode gives writable row views (so
+    torch.from_numpy does not complain) without ever touching the file.
+    """
+    return np.load(os.path.join(cache_dir, IMAGES_FILE), mmap_mode=mode)
+
+
+def _save_npy(path: str, arr: np.ndarray) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+class PreprocessedCache:
+    """Content-addressed store of preprocessed captcha images."""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.rows: Dict[str, int] = {}
+        self.labels = np.zeros((0, NUM_DIGITS), dtype=np.int64)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self) -> None:
+        try:
+            with open(self._path(INDEX_FILE)) as f:
+                index = json.load(f)
+            images = open_images(self.cache_dir, mode='r')
+            labels = np.load(self._path(LABELS_FILE))
+        except (OSError, ValueError):
+            return
+        rows = index.get('rows', {})
+        if (
+            index.get('version') != PREPROCESS_VERSION
+            or images.shape[1:] != (HEIGHT, WIDTH)
+            or len(images) < len(rows)
+            or len(labels) < len(rows)
+        ):
+            return  # stale or partial cache: rebuild from scratch
+        self.rows = rows
+        self.labels = labels[:len(rows)].copy()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _pending(self, hashes: Sequence[str], samples: Sequence[Sample]) -> Dict[str, Sample]:
+        new: Dict[str, Sample] = {}
+        for h, sample in zip(hashes, samples):
+            if h not in self.rows and h not in new:
+                new[h] = sample
+        return new
+
+    def pending(self, samples: Sequence[Sample]) -> Dict[str, Sample]:
+        """Samples whose image is not cached yet, keyed by file hash."""
+        return self._pending([file_hash(path) for path, _ in samples], samples)
+
+    def sync(
+        self,
+        samples: Sequence[Sample],
+        preprocess_fn: Callable[[str], np.ndarray] = load_preprocessed,
+    ) -> List[int]:
+        """Cache every sample that is not cached yet; return the row of each sample."""
+        hashes = [file_hash(path) for path, _ in samples]
+        new = self._pending(hashes, samples)
+        if new:
+            images = (preprocess_fn(path) for path, _ in new.values())
+            self.append(list(new), [label for _, label in new.values()], images)
+
+        # Labels come from filenames, so a relabeled file keeps its row.
+        rows = [self.rows[h] for h in hashes]
+        labels = np.array([label for _, label in samples], dtype=np.int64).reshape(-1, NUM_DIGITS)
+        if not np.array_equal(self.labels[rows], labels):
+            self.labels[rows] = labels
+            _save_npy(self._path(LABELS_FILE), self.labels)
+        return rows
+
+    def append(
+        self,
+        hashes: Sequence[str],
+        labels: Sequence[Sequence[int]],
+        images: Iterable[np.ndarray],
+    ) -> None:
+        """Append rows for `hashes`; `images` yields one [HEIGHT, WIDTH] array per hash."""
+        out = self.staging(len(hashes))
+        for row, img in enumerate(images, start=len(self.rows)):
+            out[row] = img
+        out.flush()
+        del out
+        self.commit(hashes, labels)
+
+    def staging(self, n_new: int, resume: bool = False) -> np.ndarray:
+        """Open the staging array: the cached rows followed by `n_new` empty ones.
+
+        With `resume`, an existing staging file of the right shape is reopened
+        as is, so rows written before an interruption are kept.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(STAGING_FILE)
+        shape = (len(self.rows) + n_new, HEIGHT, WIDTH)
+        if resume:
+            out = np.lib.format.open_memmap(path, mode='r+')
+            if out.shape != shape or out.dtype != np.uint8:
+                raise ValueError(f'Staging file has shape {out.shape}, expected {shape}')
+            return out
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+        if self.rows:
+            out[:len(self.rows)] = open_images(self.cache_dir, mode='r')[:len(self.rows)]
+        return out
+
+    def commit(self, hashes: Sequence[str], labels: Sequence[Sequence[int]]) -> None:
+        """Swap a fully written staging file in as the cache and record its new rows.
+
+        Images, labels and then the index are each replaced atomically, so an
+        interruption at any point leaves the previous cache usable.
+        """
+        os.replace(self._path(STAGING_FILE), self._path(IMAGES_FILE))
+        n_old = len(self.rows)
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=np.int64).reshape(-1, NUM_DIGITS)])
+        _save_npy(self._path(LABELS_FILE), self.labels)
+        for row, h in enumerate(hashes, start=n_old):
+            self.rows[h] = row
+        self._write_index()
+
+    def _write_index(self) -> None:
+        tmp = self._path(INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': PREPROCESS_VERSION, 'rows': self.rows}, f)
+        os.replace(tmp, self._path(INDEX_FILE))
@@ -0,0 +1,195 @@
+"""Calibrate per-position confidence thresholds for captcha_solver.
+
+Usage:
+    python -m thsr_ticket.ml.train.calibrate [--mode cnn] [--verified-only]
+
+BookingFlow handles a solved captcha in one of two ways:
+
+- some position is below its threshold (LowConfidenceError): it starts a new
+  session and fetches a new captcha (`--fetch-seconds`)
+- every position clears its threshold: it submits (`--submit-seconds`); a
+  wrong answer costs the retry delay (`--retry-delay`) plus a new session
+
+Over the labeled captchas this tool picks the thresholds t[0..3] that
+minimise the expected time until THSR accepts a captcha:
+
+    E[seconds per attempt] / P(all positions >= t and the answer is right)
+
+The result is written next to the model (captcha_solver.thresholds_path)
+together with the model's md5, so the solver ignores thresholds that were
+calibrated for another model. Captchas THSR accepted while booking are
+labeled and verified automatically; rejected ones are saved unlabeled and
+count here once they are labeled with label_captchas.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Dict, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from thsr_ticket.ml import captcha_solver as cs
+from thsr_ticket.ml.train.config import RAW_DIR
+from thsr_ticket.ml.train.evaluate import load_labeled, predict_samples
+
+GRID = np.round(np.arange(0.0, 1.0, 0.01), 2)
+MIN_SAMPLES = 50
+MAX_ROUNDS = 10
+
+
+class Costs(NamedTuple):
+    fetch: float  # new session + captcha image
+    submit: float  # booking form POST
+    retry_delay: float  # BookingFlow sleeps this long after a rejected captcha
+    solve: float  # captcha_solver time, measured
+
+
+def expected_seconds(
+    confidences: np.ndarray,
+    correct: np.ndarray,
+    thresholds: Sequence[float],
+    costs: Costs,
+) -> float:
+    """Expected time to an accepted captcha; inf if these thresholds never get one.
+
+    confidences: [N, NUM_DIGITS] top-1 probabilities, correct: [N] whole answer right.
+    """
+    accepted = (confidences >= np.asarray(thresholds)).all(axis=1)
+    success = (accepted & correct).mean()
+    if success == 0:
+        return float('inf')
+    wrong = (accepted & ~correct).mean()
+    per_attempt = costs.fetch + costs.solve + accepted.mean() * costs.submit + wrong * costs.retry_delay
+    return float(per_attempt / success)
+
+
+def optimise(
+    confidences: np.ndarray,
+    correct: np.ndarray,
+    costs: Costs,
+    start: Sequence[float],
+) -> Tuple[Tuple[float, ...], float]:
+    """Coordinate descent over GRID, one position at a time, from `start`."""
+    thresholds = [float(t) for t in start]
+    best = expected_seconds(confidences, correct, thresholds, costs)
+    for _ in range(MAX_ROUNDS):
+        improved = False
+        for i in range(len(thresholds)):
+            others = np.delete(confidences, i, axis=1) >= np.delete(np.asarray(thresholds), i)
+            base = others.all(axis=1)
+            accepted = base[:, None] & (confidences[:, i, None] >= GRID[None, :])  # [N, len(GRID)]
+            success = (accepted & correct[:, None]).mean(axis=0)
+            wrong = (accepted & ~correct[:, None]).mean(axis=0)
+            per_attempt = costs.fetch + costs.solve + accepted.mean(axis=0) * costs.submit + wrong * costs.retry_delay
+            with np.errstate(divide='ignore'):
+                seconds = np.where(success > 0, per_attempt / np.maximum(success, 1e-12), np.inf)
+            k = int(np.argmin(seconds))
+            if seconds[k] < best - 1e-9:
+                best, thresholds[i], improved = float(seconds[k]), float(GRID[k]), True
+        if not improved:
+            break
+    return tuple(thresholds), best
+
+
+def _summary(confidences: np.ndarray, correct: np.ndarray, thresholds: Sequence[float],
+             costs: Costs, max_attempts: int) -> Dict[str, object]:
+    accepted = (confidences >= np.asarray(thresholds)).all(axis=1)
+    success = float((accepted & correct).mean())
+    return {
+        'thresholds': [round(float(t), 2) for t in thresholds],
+        'expected_seconds': round(expected_seconds(confidences, correct, thresholds, costs), 3),
+        'accepted': round(float(accepted.mean()), 4),
+        'accepted_accuracy': round(float(correct[accepted].mean()), 4) if accepted.any() else None,
+        'success_per_attempt': round(success, 4),
+        'success_within_max_attempts': round(1 - (1 - success) ** max_attempts, 6),
+    }
+
+
+def calibrate(
+    labels: Sequence[str],
+    predictions: Sequence[cs.Prediction],
+    costs: Costs,
+    max_attempts: int,
+) -> Dict[str, object]:
+    confidences = np.stack([p.confidences for p in predictions])
+    correct = np.array([p.text == label for p, label in zip(predictions, labels)])
+    baseline = (cs.MIN_CONFIDENCE,) * cs.NUM_DIGITS
+    thresholds, _ = optimise(confidences, correct, costs, baseline)
+    return {
+        'samples': len(predictions),
+        'costs': costs._asdict(),
+        'baseline': _summary(confidences, correct, baseline, costs, max_attempts),
+        'calibrated': _summary(confidences, correct, thresholds, costs, max_attempts),
+    }
+
+
+def save(model_path: str, result: Dict[str, object]) -> str:
+    """Write the thresholds next to `model_path` (atomically); return the file path."""
+    with open(model_path, 'rb') as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    path = cs.thresholds_path(model_path)
+    data = {
+        'model_md5': md5,
+        'thresholds': result['calibrated']['thresholds'],  # type: ignore[index]
+        'created': time.time(),
+        **result,
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Calibrate per-position captcha confidence thresholds')
+    parser.add_argument('--data-dir', default=RAW_DIR, help='Directory containing labeled captchas')
+    parser.add_argument('--mode', choices=cs.MODES, default='cnn')
+    parser.add_argument('--model', default=None, help='ONNX model to calibrate (default: the one for --mode)')
+    parser.add_argument('--verified-only', action='store_true',
+                        help='Only use captchas THSR accepted while booking or collecting')
+    parser.add_argument('--fetch-seconds', type=float, default=1.2,
+                        help='New session + captcha download (default: 1.2)')
+    parser.add_argument('--submit-seconds', type=float, default=0.6,
+                        help='Booking form submission (default: 0.6)')
+    parser.add_argument('--retry-delay', type=float, default=1.0,
+                        help='Pause after a rejected captcha (default: 1.0)')
+    parser.add_argument('--max-attempts', type=int, default=30,
+                        help='Attempts per booking, as MAX_CAPTCHA_RETRY (default: 30)')
+    parser.add_argument('--dry-run', action='store_true', help='Print the result without saving it')
+    args = parser.parse_args()
+
+    model_path = args.model or (cs.CHAR_MODEL_PATH if args.mode == 'char' else cs.MODEL_PATH)
+    if not os.path.exists(model_path):
+        parser.error(f'model not found: {model_path}')
+    if args.mode == 'char':
+        cs.CHAR_MODEL_PATH = model_path
+    else:
+        cs.MODEL_PATH = model_path
+    cs.reload_model()
+
+    samples = load_labeled(args.data_dir, verified_only=args.verified_only)
+    labels, predictions, _ = predict_samples(samples, mode=args.mode)
+    # In char mode only captchas the char model actually solved say anything about its thresholds.
+    kept = [(l, p) for l, p in zip(labels, predictions) if p.mode == args.mode]
+    if len(kept) < MIN_SAMPLES:
+        parser.error(f'{len(kept)} usable labeled captchas, need at least {MIN_SAMPLES}')
+    labels, predictions = [l for l, _ in kept], [p for _, p in kept]
+
+    solve = float(np.mean([sum(p.timings.values()) for p in predictions]))
+    costs = Costs(args.fetch_seconds, args.submit_seconds, args.retry_delay, round(solve, 4))
+    result = calibrate(labels, predictions, costs, args.max_attempts)
+
+    for name in ('baseline', 'calibrated'):
+        r = result[name]
+        print(f"{name:>10}: thresholds={r['thresholds']} expected={r['expected_seconds']}s "
+              f"accepted={r['accepted']} accepted_accuracy={r['accepted_accuracy']}")
+    if not args.dry_run:
+        print(f'Saved {save(model_path, result)}')
+
+
+if __name__ == '__main__':
+    main()
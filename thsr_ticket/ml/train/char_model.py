@@ -0,0 +1,46 @@
+"""Tiny CNN classifying one segmented captcha glyph.
+
+Architecture:
+    - Input: [batch, 24, 24, 1] (HWC, white glyph on black, from image_process.segment)
+    - 3 conv blocks (8 -> 16 -> 32 channels) with batch norm
+    - Global average pooling and one linear layer
+    - ~6.8K parameters, ~30KB ONNX (CaptchaCNN: ~1.8M, ~7MB)
+"""
+
+import torch
+import torch.nn as nn
+
+from thsr_ticket.ml.train.config import NUM_CLASSES
+
+
+class CharCNN(nn.Module):
+
+    def __init__(self, num_classes: int = NUM_CLASSES):
+        super().__init__()
+        self.num_classes = num_classes
+
+        self.features = nn.Sequential(
+            # [24, 24] -> [12, 12]
+            nn.Conv2d(1, 8, kernel_size=3, padding=1),
+            nn.BatchNorm2d(8),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+
+            # [12, 12] -> [6, 6]
+            nn.Conv2d(8, 16, kernel_size=3, padding=1),
+            nn.BatchNorm2d(16),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+
+            nn.Conv2d(16, 32, kernel_size=3, padding=1),
+            nn.BatchNorm2d(32),
+            nn.ReLU(inplace=True),
+            nn.AdaptiveAvgPool2d(1),
+        )
+        self.head = nn.Linear(32, num_classes)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """x: [batch, 24, 24, 1]. Logits in training mode, softmax probabilities in eval mode."""
+        x = self.features(x.permute(0, 3, 1, 2)).flatten(1)
+        logits = self.head(x)
+        return logits if self.training else torch.softmax(logits, dim=1)
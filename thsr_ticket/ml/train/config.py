@@ -5,6 +5,7 @@ import os
 # Paths
 TRAIN_DIR = os.path.join(os.path.dirname(__file__), 'data')
 RAW_DIR = os.path.join(TRAIN_DIR, 'raw')
+CACHE_DIR = os.path.join(TRAIN_DIR, 'cache')
 MODEL_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), '..', 'models')
 
 # Image dimensions (must match captcha_solver.py)
@@ -29,3 +30,7 @@ WEIGHT_DECAY = 1e-4
 ONNX_INPUT_NAME = 'input'
 ONNX_OUTPUT_NAMES = ['digit1', 'digit2', 'digit3', 'digit4']
 ONNX_OPSET_VERSION = 13
+
+# Per-character model (image_process.segment glyphs)
+GLYPH_SIZE = 24
+CHAR_ONNX_OUTPUT_NAME = 'char'
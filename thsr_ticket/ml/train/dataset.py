@@ -4,8 +4,7 @@ Labeled images use filename convention: NNN_XXXX_hash.png
 where NNN is a sequential number and XXXX is the 4-char captcha label.
 """
 
-import os
-from typing import Tuple
+from typing import Optional, Tuple
 
 import cv2
 import numpy as np
@@ -13,9 +12,11 @@ import torch
 from torch.utils.data import Dataset
 
 from thsr_ticket.ml.captcha_solver import _preprocess
+from thsr_ticket.ml.train.cache import PreprocessedCache, open_images
 from thsr_ticket.ml.train.config import (
-    ALLOWED_CHARS, HEIGHT, NUM_DIGITS, RAW_DIR, WIDTH,
+    ALLOWED_CHARS, CACHE_DIR, HEIGHT, NUM_CHANNELS, NUM_DIGITS, RAW_DIR, WIDTH,
 )
+from thsr_ticket.ml.train.manifest import manifest_for
 
 
 class CaptchaDataset(Dataset):
@@ -24,6 +25,9 @@ class CaptchaDataset(Dataset):
     Each sample returns:
         image: float32 tensor [48, 140, 3] (HWC, normalized to [0, 1])
         labels: int64 tensor [4] (character indices into ALLOWED_CHARS)
+
+    With preprocessing on and a cache_dir, images are preprocessed once into
+    a PreprocessedCache and each worker memory-maps it on first access.
     """
 
     def __init__(
@@ -31,32 +35,38 @@ class CaptchaDataset(Dataset):
         data_dir: str = RAW_DIR,
         allowed_chars: str = ALLOWED_CHARS,
         preprocess: bool = True,
+        cache_dir: Optional[str] = CACHE_DIR,
     ):
         self.data_dir = data_dir
         self.allowed_chars = allowed_chars
         self.char_to_idx = {c: i for i, c in enumerate(allowed_chars)}
         self.preprocess = preprocess
+        self.cache_dir = cache_dir if preprocess else None
 
         self.samples: list = []
         self._scan_labeled_files()
 
+        self._rows: Optional[list] = None
+        self._images: Optional[np.ndarray] = None
+        if self.cache_dir and self.samples:
+            self._rows = PreprocessedCache(self.cache_dir).sync(self.samples)
+
+    def __getstate__(self) -> dict:
+        # Workers open their own memmap instead of receiving a pickled copy.
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
     def _scan_labeled_files(self) -> None:
-        """Find labeled files: NNN_XXXX_hash.png (skip files with '_captcha_')."""
-        for filename in os.listdir(self.data_dir):
-            if not filename.endswith('.png') or '_captcha_' in filename:
-                continue
-            # Extract label: NNN_XXXX_hash.png -> XXXX
-            parts = filename.split('_', 2)  # ['NNN', 'XXXX', 'hash.png']
-            if len(parts) < 2:
-                continue
-            label_str = parts[1][:NUM_DIGITS]
+        """Labeled files (NNN_XXXX_hash.png) from the raw manifest, in sequence order."""
+        for filepath, label in manifest_for(self.data_dir).labeled():
+            label_str = label[:NUM_DIGITS]
             if len(label_str) != NUM_DIGITS:
                 continue
             try:
                 indices = [self.char_to_idx[c] for c in label_str]
             except KeyError:
                 continue
-            filepath = os.path.join(self.data_dir, filename)
             self.samples.append((filepath, indices))
 
     def __len__(self) -> int:
@@ -64,6 +74,14 @@ class CaptchaDataset(Dataset):
 
     def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
         filepath, indices = self.samples[idx]
+        label_tensor = torch.tensor(indices, dtype=torch.long)  # [4]
+
+        if self._rows is not None:
+            if self._images is None:
+                self._images = open_images(self.cache_dir)
+            gray = torch.from_numpy(self._images[self._rows[idx]])  # [48, 140] uint8
+            image_tensor = gray.float().div_(255.0).unsqueeze(-1).expand(-1, -1, NUM_CHANNELS)
+            return image_tensor, label_tensor
 
         img_bgr = cv2.imread(filepath)
         img_bgr = cv2.resize(img_bgr, (WIDTH, HEIGHT))
@@ -75,6 +93,5 @@ class CaptchaDataset(Dataset):
         image = img_bgr.astype(np.float32) / 255.0
 
         image_tensor = torch.from_numpy(image)                  # [48, 140, 3]
-        label_tensor = torch.tensor(indices, dtype=torch.long)  # [4]
 
         return image_tensor, label_tensor
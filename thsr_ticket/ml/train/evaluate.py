@@ -0,0 +1,243 @@
+"""Offline evaluation of captcha_solver on the labeled raw captchas.
+
+Usage:
+    python -m thsr_ticket.ml.train.evaluate [--mode cnn] [--output report.json]
+
+Runs captcha_solver.predict over every labeled captcha in the manifest and
+reports, as JSON:
+
+- whole-string and per-position accuracy
+- the per-character confusion matrix
+- confidence calibration: reliability bins, ECE, and how many captchas
+  MIN_CONFIDENCE accepts (and how many of the rejected ones were right)
+- decode / preprocess / inference latency percentiles
+
+Keep the report of the current model around and diff it against a new one.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from thsr_ticket.ml import captcha_solver as cs
+from thsr_ticket.ml.train.config import RAW_DIR
+from thsr_ticket.ml.train.manifest import manifest_for
+
+CALIBRATION_BINS = 10
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+STAGES = ('decode', 'preprocess', 'inference')
+
+
+def load_labeled(
+    data_dir: str = RAW_DIR,
+    limit: Optional[int] = None,
+    verified_only: bool = False,
+) -> List[Tuple[str, str]]:
+    """(path, label) of labeled captchas whose label the solver can produce."""
+    samples = [
+        (path, label) for path, label in manifest_for(data_dir).labeled(verified_only)
+        if len(label) == cs.NUM_DIGITS and all(c in cs.ALLOWED_CHARS for c in label)
+    ]
+    return samples[:limit] if limit else samples
+
+
+def _rate(hits: np.ndarray) -> Optional[float]:
+    return round(float(hits.mean()), 4) if hits.size else None
+
+
+def _confusion(labels: Sequence[str], texts: Sequence[str]) -> Dict[str, object]:
+    n = len(cs.ALLOWED_CHARS)
+    matrix = np.zeros((n, n), dtype=int)
+    for label, text in zip(labels, texts):
+        for true, pred in zip(label, text):
+            matrix[cs.ALLOWED_CHARS.index(true), cs.ALLOWED_CHARS.index(pred)] += 1
+    errors = [
+        (cs.ALLOWED_CHARS[i], cs.ALLOWED_CHARS[j], int(matrix[i, j]))
+        for i, j in zip(*np.nonzero(matrix)) if i != j
+    ]
+    return {
+        'labels': cs.ALLOWED_CHARS,
+        'matrix': matrix.tolist(),  # rows: true char, columns: predicted char
+        'top_errors': sorted(errors, key=lambda e: -e[2])[:20],
+    }
+
+
+def _calibration(
+    confidences: np.ndarray,
+    correct: np.ndarray,
+    thresholds: Optional[Sequence[float]] = None,
+) -> Dict[str, object]:
+    """confidences / correct: [N, NUM_DIGITS] top-1 probability and whether it was right;
+    thresholds: the per-position ones the solver uses, if calibrated."""
+    conf, hit = confidences.ravel(), correct.ravel()
+    edges = np.linspace(0.0, 1.0, CALIBRATION_BINS + 1)
+    which = np.clip(np.digitize(conf, edges) - 1, 0, CALIBRATION_BINS - 1)
+    bins, ece = [], 0.0
+    for b in range(CALIBRATION_BINS):
+        mask = which == b
+        if not mask.any():
+            continue
+        gap = abs(conf[mask].mean() - hit[mask].mean())
+        ece += gap * mask.sum() / conf.size
+        bins.append({
+            'range': [round(edges[b], 2), round(edges[b + 1], 2)],
+            'count': int(mask.sum()),
+            'confidence': round(float(conf[mask].mean()), 4),
+            'accuracy': round(float(hit[mask].mean()), 4),
+        })
+
+    # A captcha is submitted only if every position clears its threshold.
+    captcha_hit = correct.all(axis=1)
+
+    def at(threshold) -> Dict[str, object]:
+        accepted = (confidences >= np.asarray(threshold)).all(axis=1)
+        return {
+            'threshold': threshold,
+            'accepted': _rate(accepted),
+            'accepted_accuracy': _rate(captcha_hit[accepted]),
+            'rejected_but_correct': _rate(captcha_hit[~accepted]),
+        }
+
+    report = {
+        'ece': round(float(ece), 4),
+        'bins': bins,
+        'min_confidence': at(cs.MIN_CONFIDENCE),
+        'sweep': [at(t) for t in THRESHOLDS],
+    }
+    if thresholds is not None and any(t != cs.MIN_CONFIDENCE for t in thresholds):
+        report['calibrated'] = at(list(thresholds))
+    return report
+
+
+def _latency(timings: Sequence[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Milliseconds per stage (and in total)."""
+    series = {stage: np.array([t[stage] for t in timings]) * 1000 for stage in STAGES}
+    series['total'] = sum(series.values())
+    return {
+        name: {
+            'mean': round(float(ms.mean()), 3),
+            'p50': round(float(np.percentile(ms, 50)), 3),
+            'p90': round(float(np.percentile(ms, 90)), 3),
+            'p99': round(float(np.percentile(ms, 99)), 3),
+            'max': round(float(ms.max()), 3),
+        }
+        for name, ms in series.items()
+    }
+
+
+def summarize(
+    labels: Sequence[str],
+    predictions: Sequence[cs.Prediction],
+    thresholds: Optional[Sequence[float]] = None,
+) -> Dict[str, object]:
+    """The metrics part of the report for already computed predictions."""
+    texts = [p.text for p in predictions]
+    correct = np.array([[a == b for a, b in zip(label, text)] for label, text in zip(labels, texts)])
+    confidences = np.stack([p.confidences for p in predictions])
+    return {
+        'accuracy': _rate(correct.all(axis=1)),
+        'position_accuracy': [_rate(correct[:, i]) for i in range(cs.NUM_DIGITS)],
+        'char_accuracy': _rate(correct),
+        'confusion': _confusion(labels, texts),
+        'calibration': _calibration(confidences, correct, thresholds),
+        'latency_ms': _latency([p.timings for p in predictions]),
+        'modes': {m: sum(p.mode == m for p in predictions) for m in cs.MODES},
+    }
+
+
+def _model_info(path: str) -> Dict[str, object]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    return {'path': path, 'size': len(data), 'md5': hashlib.md5(data).hexdigest()}
+
+
+def predict_samples(
+    samples: Sequence[Tuple[str, str]],
+    mode: str = 'cnn',
+    preprocess: str = 'regression',
+) -> Tuple[List[str], List[cs.Prediction], List[str]]:
+    """Labels and predictions of the readable samples, plus a note for each unreadable one."""
+    labels, predictions, unreadable = [], [], []
+    for path, label in samples:
+        with open(path, 'rb') as f:
+            img_bytes = f.read()
+        try:
+            predictions.append(cs.predict(img_bytes, preprocess=preprocess, mode=mode))
+        except cv2.error as e:
+            unreadable.append(f'{os.path.basename(path)}: {e}')
+            continue
+        labels.append(label)
+    return labels, predictions, unreadable
+
+
+def evaluate(
+    samples: Sequence[Tuple[str, str]],
+    mode: str = 'cnn',
+    preprocess: str = 'regression',
+) -> Dict[str, object]:
+    t0 = time.perf_counter()
+    models = {'cnn': _model_info(cs.MODEL_PATH)}
+    cs._get_session()
+    if mode == 'char':
+        models['char'] = _model_info(cs.CHAR_MODEL_PATH)
+        cs._get_char_session()
+    session_load = time.perf_counter() - t0
+
+    labels, predictions, unreadable = predict_samples(samples, mode, preprocess)
+
+    report: Dict[str, object] = {
+        'mode': mode,
+        'preprocess': preprocess,
+        'models': models,
+        'min_confidence': cs.MIN_CONFIDENCE,
+        'samples': len(predictions),
+        'unreadable': unreadable,
+        'session_load_ms': round(session_load * 1000, 3),
+    }
+    if predictions:
+        report.update(summarize(labels, predictions, cs._get_thresholds(mode)))
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Evaluate the captcha solver on labeled captchas')
+    parser.add_argument('--data-dir', default=RAW_DIR, help='Directory containing labeled captchas')
+    parser.add_argument('--mode', choices=cs.MODES, default='cnn')
+    parser.add_argument('--preprocess', choices=sorted(cs.PREPROCESSORS), default='regression')
+    parser.add_argument('--model', default=cs.MODEL_PATH, help='Whole-image ONNX model')
+    parser.add_argument('--char-model', default=cs.CHAR_MODEL_PATH, help='Per-character ONNX model')
+    parser.add_argument('--limit', type=int, default=None, help='Evaluate only the first N captchas')
+    parser.add_argument('--output', default='-', help="JSON report path ('-': stdout)")
+    args = parser.parse_args()
+
+    samples = load_labeled(args.data_dir, args.limit)
+    if not samples:
+        parser.error(f'no labeled captchas in {args.data_dir}')
+    for path in [args.model] + ([args.char_model] if args.mode == 'char' else []):
+        if not os.path.exists(path):
+            parser.error(f'model not found: {path}')
+    cs.MODEL_PATH, cs.CHAR_MODEL_PATH = args.model, args.char_model
+    cs.reload_model()
+
+    report = evaluate(samples, mode=args.mode, preprocess=args.preprocess)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == '-':
+        print(text)
+        return
+    with open(args.output, 'w') as f:
+        f.write(text + '\n')
+    latency = report.get('latency_ms', {}).get('total', {})
+    print(f"{report['samples']} captchas | accuracy={report.get('accuracy')} "
+          f"char_accuracy={report.get('char_accuracy')} | p50={latency.get('p50')}ms "
+          f"p99={latency.get('p99')}ms -> {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,10 +15,16 @@ from thsr_ticket.ml.train.model import CaptchaCNN
 def export(checkpoint_path: str, output_path: str) -> None:
     model = CaptchaCNN(num_classes=NUM_CLASSES)
     model.load_state_dict(torch.load(checkpoint_path, map_location='cpu', weights_only=True))
+    export_model(model, output_path)
+
+
+def export_model(model: CaptchaCNN, output_path: str) -> None:
+    """Export an in-memory model; it is left in eval mode."""
     model.eval()  # softmax will be included in the ONNX graph
 
     # Dummy input matching the ONNX contract: [batch, 48, 140, 3]
-    dummy_input = torch.randn(1, HEIGHT, WIDTH, NUM_CHANNELS)
+    device = next(model.parameters()).device
+    dummy_input = torch.randn(1, HEIGHT, WIDTH, NUM_CHANNELS, device=device)
 
     torch.onnx.export(
         model,
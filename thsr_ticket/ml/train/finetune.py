@@ -0,0 +1,139 @@
+"""In-process incremental fine-tuning.
+
+IncrementalTrainer keeps the model, optimizer and the cached dataset in
+memory. Each `finetune` call rescans the raw directory (only new files
+are preprocessed, see PreprocessedCache), trains on the samples the
+checkpoint has not seen plus a random replay buffer of old ones, and
+`publish` exports and verifies the ONNX model, writes the checkpoint and
+swaps the model in with os.replace -- all without spawning new interpreters.
+
+The checkpoint's training set is recorded next to it in `<checkpoint>.json`
+so a later run knows which samples are new.
+"""
+
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Set
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+
+from thsr_ticket.ml import captcha_solver
+from thsr_ticket.ml.train.config import (
+    BATCH_SIZE, CACHE_DIR, MODEL_OUTPUT_DIR, NUM_CLASSES, RAW_DIR, WEIGHT_DECAY,
+)
+from thsr_ticket.ml.train.dataset import CaptchaDataset
+from thsr_ticket.ml.train.export_onnx import export_model
+from thsr_ticket.ml.train.model import CaptchaCNN
+from thsr_ticket.ml.train.train import _train_one_epoch, _validate
+from thsr_ticket.ml.train.verify_onnx import verify
+
+CHECKPOINT_PATH = os.path.join(MODEL_OUTPUT_DIR, 'captcha_cnn.pt')
+ONNX_PATH = os.path.join(MODEL_OUTPUT_DIR, 'thsrc_captcha.onnx')
+REPLAY_SIZE = 512
+
+
+class IncrementalTrainer:
+    def __init__(
+        self,
+        checkpoint: str = CHECKPOINT_PATH,
+        onnx_path: str = ONNX_PATH,
+        data_dir: str = RAW_DIR,
+        cache_dir: Optional[str] = CACHE_DIR,
+        lr: float = 1e-4,
+        batch_size: int = BATCH_SIZE,
+        replay_size: int = REPLAY_SIZE,
+        device: Optional[torch.device] = None,
+    ):
+        self.checkpoint = checkpoint
+        self.onnx_path = onnx_path
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.replay_size = replay_size
+        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+        self.model = CaptchaCNN(num_classes=NUM_CLASSES).to(self.device)
+        if os.path.exists(checkpoint):
+            self.model.load_state_dict(torch.load(checkpoint, map_location=self.device, weights_only=True))
+        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=lr, weight_decay=WEIGHT_DECAY)
+        self.criterion = nn.CrossEntropyLoss()
+
+        self.trained: Set[str] = self._load_trained()
+        self.dataset: Optional[CaptchaDataset] = None
+
+    @property
+    def _trained_path(self) -> str:
+        return self.checkpoint + '.json'
+
+    def _load_trained(self) -> Set[str]:
+        try:
+            with open(self._trained_path) as f:
+                return set(json.load(f)['samples'])
+        except (OSError, ValueError, KeyError):
+            return set()  # unknown history: every sample counts as new
+
+    def refresh(self) -> List[int]:
+        """Rescan the raw directory; return dataset indices of samples not trained on yet."""
+        self.dataset = CaptchaDataset(data_dir=self.data_dir, cache_dir=self.cache_dir)
+        return [
+            i for i, (path, _) in enumerate(self.dataset.samples)
+            if os.path.basename(path) not in self.trained
+        ]
+
+    def _loader(self, indices: List[int], shuffle: bool) -> DataLoader:
+        assert self.dataset is not None
+        return DataLoader(Subset(self.dataset, indices), batch_size=self.batch_size, shuffle=shuffle)
+
+    def finetune(self, epochs: int) -> Optional[Dict[str, float]]:
+        """Train on new samples plus a replay buffer; None if there is nothing new."""
+        new = self.refresh()
+        if not new:
+            return None
+        assert self.dataset is not None
+        new_set = set(new)
+        old = [i for i in range(len(self.dataset)) if i not in new_set]
+        random.shuffle(old)
+        replay = old[:self.replay_size]
+        holdout = old[self.replay_size:2 * self.replay_size]
+
+        loader = self._loader(new + replay, shuffle=True)
+        result: Dict[str, float] = {'new': len(new), 'replay': len(replay)}
+        for epoch in range(1, epochs + 1):
+            t0 = time.time()
+            loss, acc = _train_one_epoch(self.model, loader, self.optimizer, self.criterion, self.device)
+            print(f'Epoch {epoch:3d}/{epochs} | train_loss={loss:.4f} train_acc={acc:.4f} '
+                  f'| {time.time() - t0:.1f}s')
+            result.update(train_loss=loss, train_acc=acc)
+        if holdout:
+            result['holdout_loss'], result['holdout_acc'] = _validate(
+                self.model, self._loader(holdout, shuffle=False), self.criterion, self.device,
+            )
+        self.trained.update(os.path.basename(self.dataset.samples[i][0]) for i in new)
+        return result
+
+    def publish(self) -> None:
+        """Export + verify ONNX, save the checkpoint, then atomically replace the solver's model."""
+        tmp_onnx = self.onnx_path + '.tmp'
+        try:
+            export_model(self.model, tmp_onnx)
+            verify(tmp_onnx)
+        except BaseException:
+            if os.path.exists(tmp_onnx):
+                os.remove(tmp_onnx)
+            raise
+
+        tmp_pt = self.checkpoint + '.tmp'
+        torch.save(self.model.state_dict(), tmp_pt)
+        os.replace(tmp_pt, self.checkpoint)
+        tmp_json = self._trained_path + '.tmp'
+        with open(tmp_json, 'w') as f:
+            json.dump({'samples': sorted(self.trained)}, f)
+        os.replace(tmp_json, self._trained_path)
+
+        os.replace(tmp_onnx, self.onnx_path)
+        if os.path.abspath(self.onnx_path) == os.path.abspath(captcha_solver.MODEL_PATH):
+            captcha_solver.reload_model()
@@ -6,159 +6,159 @@ Usage:
 Flow:
     1. Download captchas from THSR and predict with current model
     2. Submit to THSR to verify — only label if THSR accepts
-    3. Resume training from existing checkpoint
-    4. Export updated ONNX model
+    3. Fine-tune the existing checkpoint on new samples plus a replay buffer
+    4. Export, verify and swap in the updated ONNX model (same process)
 """
 
 import argparse
-import hashlib
-import json
-import os
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Optional, Tuple
 
-from thsr_ticket.ml.train.config import MODEL_OUTPUT_DIR, RAW_DIR
+from thsr_ticket.ml.train.config import RAW_DIR
 
 
-def _next_num(raw_dir: str) -> int:
-    existing = [f for f in os.listdir(raw_dir) if f.endswith('.png') and f[0].isdigit()]
-    return max((int(f.split('_')[0]) for f in existing), default=0) + 1
+def _outbound_date(days_ahead: int = 1) -> str:
+    """A date inside THSR's booking window, for the throw-away verification form."""
+    return (date.today() + timedelta(days=days_ahead)).strftime('%Y/%m/%d')
 
 
-def _save(raw_dir: str, num: int, img_bytes: bytes, label: str = None) -> None:
-    img_hash = hashlib.md5(img_bytes).hexdigest()[:12]
-    middle = label if label else 'captcha'
-    filepath = os.path.join(raw_dir, f'{num:05d}_{middle}_{img_hash}.png')
-    if not os.path.exists(filepath):
-        with open(filepath, 'wb') as f:
-            f.write(img_bytes)
+def _verify_one(limiter, base_url: Optional[str] = None, pool=None) -> Tuple[str, Optional[str], bytes, str]:
+    """Fetch one captcha, predict it and submit a booking form to check the prediction.
 
-
-def collect_and_label(count: int, delay: float = 1.5) -> tuple:
-    """Download captchas, predict, and verify by submitting to THSR.
-
-    Only auto-labels captchas that THSR confirms as correct.
-    Returns (verified_count, failed_count, skipped_count).
+    Returns (status, prediction, img_bytes, detail) with status 'verified',
+    'rejected' or 'low_confidence'. Every HTTP request takes a token from
+    `limiter` first. `pool` is a SharedPool the session sends through.
     """
     from thsr_ticket.ml.captcha_solver import LowConfidenceError, solve
     from thsr_ticket.remote.http_request import HTTPRequest
     from thsr_ticket.configs.web.param_schema import BookingModel
     from thsr_ticket.configs.web.parse_html_element import BOOKING_PAGE, ERROR_FEEDBACK
+    from thsr_ticket.remote.form_encoder import BOOKING_FORM
     from bs4 import BeautifulSoup
 
-    os.makedirs(RAW_DIR, exist_ok=True)
-    num = _next_num(RAW_DIR)
+    client = HTTPRequest(base_url=base_url, pool=pool)
+    limiter.acquire()
+    book_page = client.request_booking_page().content
+    limiter.acquire()
+    img_bytes = client.request_security_code_img(book_page).content
+
+    try:
+        prediction = solve(img_bytes)
+    except LowConfidenceError:
+        return 'low_confidence', None, img_bytes, ''
+
+    # Build minimal booking form to verify captcha
+    page = BeautifulSoup(book_page, features='html.parser')
+
+    # Parse required hidden fields
+    trip_tag = page.find('input', {'name': 'tripCon:typesoftrip'})
+    types_of_trip = int(trip_tag['value']) if trip_tag else 0
+
+    search_tag = page.find('input', {'name': 'bookingMethod', 'checked': True})
+    search_by = search_tag['value'] if search_tag else '1'
+
+    seat_tag = page.find(**BOOKING_PAGE["seat_prefer_radio"])
+    seat_val = seat_tag.find_next(selected='selected')['value'] if seat_tag else '0'
+
+    book_model = BookingModel(
+        start_station=2,   # Taipei
+        dest_station=7,    # Taichung
+        outbound_date=_outbound_date(),
+        outbound_time='1000A',
+        adult_ticket_num='1F',
+        college_ticket_num='0P',
+        seat_prefer=seat_val,
+        class_type=0,
+        types_of_trip=types_of_trip,
+        search_by=search_by,
+        security_code=prediction,
+    )
 
-    verified = 0
-    failed = 0
-    skipped = 0
+    limiter.acquire()
+    resp = client.submit_booking_form(BOOKING_FORM.encode(book_model))
 
-    for i in range(1, count + 1):
-        try:
-            client = HTTPRequest()
-            book_page_resp = client.request_booking_page()
-            book_page = book_page_resp.content
-            img_bytes = client.request_security_code_img(book_page).content
-
-            try:
-                prediction = solve(img_bytes)
-            except LowConfidenceError:
-                _save(RAW_DIR, num, img_bytes)
-                print(f'[{i}/{count}] low confidence, saved unlabeled')
-                skipped += 1
-                num += 1
-                if i < count:
-                    time.sleep(delay)
-                continue
-
-            # Build minimal booking form to verify captcha
-            page = BeautifulSoup(book_page, features='html.parser')
-
-            # Parse required hidden fields
-            trip_tag = page.find('input', {'name': 'tripCon:typesoftrip'})
-            types_of_trip = int(trip_tag['value']) if trip_tag else 0
-
-            search_tag = page.find('input', {'name': 'bookingMethod', 'checked': True})
-            search_by = search_tag['value'] if search_tag else '1'
-
-            seat_tag = page.find(**BOOKING_PAGE["seat_prefer_radio"])
-            seat_val = seat_tag.find_next(selected='selected')['value'] if seat_tag else '0'
-
-            book_model = BookingModel(
-                start_station=2,   # Taipei
-                dest_station=7,    # Taichung
-                outbound_date='2026/03/15',
-                outbound_time='1000A',
-                adult_ticket_num='1F',
-                college_ticket_num='0H',
-                seat_prefer=seat_val,
-                class_type=0,
-                types_of_trip=types_of_trip,
-                search_by=search_by,
-                security_code=prediction,
-            )
-
-            dict_params = json.loads(book_model.json(by_alias=True))
-            resp = client.submit_booking_form(dict_params)
-
-            # Check if captcha was accepted
-            resp_page = BeautifulSoup(resp.content, features='html.parser')
-            errors = resp_page.find_all(**ERROR_FEEDBACK)
-
-            if not errors:
-                # THSR accepted → captcha is correct
-                _save(RAW_DIR, num, img_bytes, label=prediction)
-                print(f'[{i}/{count}] {prediction} (verified)')
-                verified += 1
-            else:
-                error_text = errors[0].text.strip()
-                _save(RAW_DIR, num, img_bytes)
-                print(f'[{i}/{count}] {prediction} rejected: {error_text}')
-                failed += 1
-            num += 1
+    # Check if captcha was accepted
+    resp_page = BeautifulSoup(resp.content, features='html.parser')
+    errors = resp_page.find_all(**ERROR_FEEDBACK)
+    if errors:
+        return 'rejected', prediction, img_bytes, errors[0].text.strip()
+    return 'verified', prediction, img_bytes, ''
 
+
+def collect_and_label(
+    count: int,
+    rate: float = 2.0,
+    workers: int = 4,
+    base_url: Optional[str] = None,
+) -> tuple:
+    """Download captchas, predict, and verify by submitting to THSR.
+
+    Up to `workers` captchas are in flight at once, while all of them share
+    one limit of `rate` requests per second. Only captchas THSR accepts are
+    labeled (and marked verified in the raw manifest).
+    Returns (verified_count, failed_count, skipped_count).
+    """
+    from thsr_ticket.ml.train.manifest import manifest_for
+    from thsr_ticket.remote.http_request import HTTPOptions, SharedPool
+    from thsr_ticket.remote.rate_limit import TokenBucket
+
+    manifest = manifest_for(RAW_DIR)
+    limiter = TokenBucket(rate)
+    # Every captcha is its own session, but they all reuse up to `workers` connections.
+    http_pool = SharedPool(HTTPOptions(pool_maxsize=workers))
+    lock = threading.Lock()
+    state = {'done': 0, 'verified': 0, 'failed': 0, 'skipped': 0}
+
+    def record(key: str, message: str) -> None:
+        with lock:
+            state[key] += 1
+            state['done'] += 1
+            print(f"[{state['done']}/{count}] {message}")
+
+    def work(_: int) -> None:
+        try:
+            status, prediction, img_bytes, detail = _verify_one(limiter, base_url, http_pool)
         except Exception as e:
-            print(f'[{i}/{count}] error: {e}')
-            skipped += 1
+            record('skipped', f'error: {e}')
+            return
 
-        if i < count:
-            time.sleep(delay)
+        if status == 'low_confidence':
+            manifest.add(img_bytes, source='incremental')
+            record('skipped', 'low confidence, saved unlabeled')
+        elif status == 'rejected':
+            manifest.add(img_bytes, source='incremental')
+            record('failed', f'{prediction} rejected: {detail}')
+        else:
+            manifest.add(img_bytes, label=prediction, source='incremental', verified=True)
+            record('verified', f'{prediction} (verified)')
 
-    return verified, failed, skipped
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(work, range(count)))
+    finally:
+        http_pool.close()
+
+    return state['verified'], state['failed'], state['skipped']
 
 
 def retrain(epochs: int, lr: float) -> None:
-    """Resume training from existing checkpoint."""
-    import subprocess
-    import sys
-
-    pt_path = os.path.join(MODEL_OUTPUT_DIR, 'captcha_cnn.pt')
-    onnx_path = os.path.join(MODEL_OUTPUT_DIR, 'thsrc_captcha.onnx')
-
-    # Train
-    train_cmd = [
-        sys.executable, '-m', 'thsr_ticket.ml.train.train',
-        '--resume', pt_path,
-        '--epochs', str(epochs),
-        '--lr', str(lr),
-        '--output', pt_path,
-    ]
-    print(f'\n=== 開始增量訓練 ({epochs} epochs, lr={lr}) ===')
-    subprocess.run(train_cmd, check=True)
+    """Fine-tune the existing checkpoint in-process on new samples plus a replay buffer."""
+    from thsr_ticket.ml.train.finetune import IncrementalTrainer
 
-    # Export ONNX
-    export_cmd = [
-        sys.executable, '-m', 'thsr_ticket.ml.train.export_onnx',
-        pt_path, '--output', onnx_path,
-    ]
-    print('\n=== 匯出 ONNX ===')
-    subprocess.run(export_cmd, check=True)
+    trainer = IncrementalTrainer(lr=lr)
+    print(f'\n=== 開始增量訓練 ({epochs} epochs, lr={lr}) ===')
+    result = trainer.finetune(epochs)
+    if result is None:
+        print('沒有新的已標記 captcha，略過訓練')
+        return
+    print(f"新樣本: {result['new']:.0f}, 重播樣本: {result['replay']:.0f}")
+    if 'holdout_acc' in result:
+        print(f"保留集準確率: {result['holdout_acc']:.4f}")
 
-    # Verify
-    verify_cmd = [
-        sys.executable, '-m', 'thsr_ticket.ml.train.verify_onnx',
-        onnx_path,
-    ]
-    subprocess.run(verify_cmd, check=True)
+    print('\n=== 匯出並驗證 ONNX ===')
+    trainer.publish()
 
 
 def main() -> None:
@@ -171,8 +171,12 @@ def main() -> None:
                         help='訓練 epochs (預設: 10)')
     parser.add_argument('--lr', type=float, default=1e-4,
                         help='學習率 (預設: 0.0001)')
-    parser.add_argument('--delay', type=float, default=1.5,
-                        help='下載間隔秒數 (預設: 1.5)')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='全部執行緒合計每秒最多請求數 (預設: 2.0)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='同時驗證的 captcha 數量 (預設: 4)')
+    parser.add_argument('--base-url', default=None,
+                        help='改連線至本機模擬伺服器（thsr_ticket.remote.standin_server）')
     parser.add_argument('--collect-only', action='store_true',
                         help='只下載驗證，不訓練')
     parser.add_argument('--train-only', action='store_true',
@@ -181,7 +185,9 @@ def main() -> None:
 
     if not args.train_only:
         print('=== 下載 captcha 並透過高鐵驗證 ===')
-        verified, failed, skipped = collect_and_label(args.count, delay=args.delay)
+        verified, failed, skipped = collect_and_label(
+            args.count, rate=args.rate, workers=args.workers, base_url=args.base_url,
+        )
         print(f'\n驗證通過: {verified}, 驗證失敗: {failed}, 跳過: {skipped}')
 
     if not args.collect_only:
@@ -1,6 +1,6 @@
 """CLI tool for manually labeling collected THSR captchas.
 
-Labeling is done by renaming files:
+Labeling is done by renaming files (through the raw manifest, see manifest.py):
   - Unlabeled:  NNN_captcha_abc123.png
   - Labeled:    NNN_A3K7_abc123.png  (4-char label after number prefix)
   - Uncertain:  NNN_captcha_abc123.png  (unchanged, skipped)
@@ -11,6 +11,7 @@ import os
 import subprocess
 
 from thsr_ticket.ml.train.config import RAW_DIR
+from thsr_ticket.ml.train.manifest import RawManifest
 
 
 _VSCODE_PATHS = [
@@ -34,36 +35,26 @@ def _show_image(filepath: str) -> None:
                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
-def _is_unlabeled(filename: str) -> bool:
-    """Unlabeled files contain '_captcha_' (e.g. 018_captcha_hash.png)."""
-    return '_captcha_' in filename and filename.endswith('.png')
-
-
-def _count_labeled(data_dir: str) -> int:
-    return sum(
-        1 for f in os.listdir(data_dir)
-        if f.endswith('.png') and '_captcha_' not in f
-    )
+def _count_labeled(manifest: RawManifest) -> int:
+    return sum(1 for e in manifest.entries.values() if e['label'] is not None)
 
 
 def label(data_dir: str) -> None:
-    all_images = sorted([
-        f for f in os.listdir(data_dir) if _is_unlabeled(f)
-    ])
-    labeled = _count_labeled(data_dir)
+    manifest = RawManifest(data_dir)
+    pending = manifest.unlabeled()
+    labeled = _count_labeled(manifest)
 
-    print(f'Found {len(all_images)} unlabeled images ({labeled} already labeled)')
+    print(f'Found {len(pending)} unlabeled images ({labeled} already labeled)')
     print("Commands: 4-char label | 's' skip | 'q' quit\n")
 
     saved = 0
 
     try:
-        for i, filename in enumerate(all_images):
-            filepath = os.path.join(data_dir, filename)
-
-            _show_image(filepath)
+        for i, entry in enumerate(pending):
+            filename = entry['file']
+            _show_image(os.path.join(data_dir, filename))
 
-            user_input = input(f'[{i + 1}/{len(all_images)}] {filename}: ').strip().upper()
+            user_input = input(f'[{i + 1}/{len(pending)}] {filename}: ').strip().upper()
 
             if user_input == 'Q':
                 break
@@ -74,13 +65,7 @@ def label(data_dir: str) -> None:
                 continue
 
             # Rename: 018_captcha_hash.png -> 018_A3K7_hash.png
-            # Find '_captcha_' and replace 'captcha' with the label
-            idx = filename.index('_captcha_')
-            prefix = filename[:idx]  # e.g. '018'
-            suffix = filename[idx + len('_captcha_'):]  # e.g. 'hash.png'
-            new_name = f'{prefix}_{user_input}_{suffix}'
-            new_path = os.path.join(data_dir, new_name)
-            os.rename(filepath, new_path)
+            manifest.relabel(entry['seq'], user_input)
             saved += 1
     except KeyboardInterrupt:
         pass
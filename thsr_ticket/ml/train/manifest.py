@@ -0,0 +1,234 @@
+"""Append-only manifest of the raw captcha directory.
+
+Every captcha saved to the raw directory (NNN_XXXX_hash.png, or
+NNN_captcha_hash.png while unlabeled) gets one JSON line in
+`<raw_dir>/manifest.jsonl`:
+
+    {"seq": 12, "file": "00012_A2C4_0123456789ab.png", "md5": "...",
+     "label": "A2C4", "source": "booking", "verified": true}
+
+Relabeling appends a new line for the same seq; the last one wins. The
+in-memory view keeps the next sequence number and the md5 set, so saving
+a captcha costs two stat calls and one append instead of listing and
+parsing the whole directory.
+
+Files added or renamed by hand (cp, mv) make the directory newer than the
+manifest, which triggers a rebuild from disk on the next refresh. The
+rebuild can also be run explicitly:
+
+    python -m thsr_ticket.ml.train.manifest [--data-dir DIR]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from thsr_ticket.ml.train.config import RAW_DIR
+
+MANIFEST_FILE = 'manifest.jsonl'
+UNLABELED = 'captcha'
+_FILENAME = re.compile(r'^(\d+)_([^_]+)_(.+)\.png$')
+
+
+def _filename(seq: int, label: Optional[str], md5: str) -> str:
+    return f'{seq:05d}_{label or UNLABELED}_{md5[:12]}.png'
+
+
+class RawManifest:
+    """Index of the numbered captcha files in `raw_dir`; safe to share between threads."""
+
+    def __init__(self, raw_dir: str = RAW_DIR):
+        self.raw_dir = raw_dir
+        self.path = os.path.join(raw_dir, MANIFEST_FILE)
+        self.entries: Dict[int, dict] = {}
+        self.hashes: Dict[str, int] = {}
+        self.next_seq = 1
+        self._offset = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, md5: str) -> bool:
+        return md5 in self.hashes
+
+    def _apply(self, entry: dict) -> None:
+        self.entries[entry['seq']] = entry
+        self.hashes[entry['md5']] = entry['seq']
+        self.next_seq = max(self.next_seq, entry['seq'] + 1)
+
+    def _stale(self) -> bool:
+        try:
+            manifest_mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return any(_FILENAME.match(f) for f in os.listdir(self.raw_dir))
+        return os.stat(self.raw_dir).st_mtime_ns > manifest_mtime
+
+    def _refresh(self) -> None:
+        """Pick up lines appended by other processes, or rebuild if the directory changed."""
+        if not os.path.isdir(self.raw_dir):
+            return
+        if self._stale():
+            self._reconcile()
+            return
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # another writer is mid-append
+                self._offset += len(line)
+                self._apply(json.loads(line))
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._refresh()
+
+    def _append(self, entry: dict) -> None:
+        # The offset is left alone: the next refresh re-reads this line (harmless)
+        # along with anything another process appended in between.
+        with open(self.path, 'ab') as f:
+            f.write(json.dumps(entry).encode() + b'\n')
+        self._apply(entry)
+
+    def add(
+        self,
+        img_bytes: bytes,
+        label: Optional[str] = None,
+        source: str = '',
+        verified: bool = False,
+    ) -> str:
+        """Save a captcha under the next sequence number; return its path.
+
+        A captcha that is already in the directory is not written again. If it
+        was unlabeled and a label is given now, it is relabeled instead.
+        """
+        md5 = hashlib.md5(img_bytes).hexdigest()
+        with self._lock:
+            os.makedirs(self.raw_dir, exist_ok=True)
+            self._refresh()
+            if md5 in self.hashes:
+                entry = self.entries[self.hashes[md5]]
+                if label and entry['label'] is None:
+                    return self._relabel(entry, label, verified)
+                return os.path.join(self.raw_dir, entry['file'])
+
+            seq = self.next_seq
+            filename = _filename(seq, label, md5)
+            with open(os.path.join(self.raw_dir, filename), 'wb') as f:
+                f.write(img_bytes)
+            self._append({
+                'seq': seq, 'file': filename, 'md5': md5, 'label': label,
+                'source': source, 'verified': verified, 'time': time.time(),
+            })
+            return os.path.join(self.raw_dir, filename)
+
+    def _relabel(self, entry: dict, label: str, verified: bool) -> str:
+        m = _FILENAME.match(entry['file'])
+        filename = f'{m.group(1)}_{label}_{m.group(3)}.png'
+        os.rename(os.path.join(self.raw_dir, entry['file']), os.path.join(self.raw_dir, filename))
+        self._append(dict(entry, file=filename, label=label, verified=verified, time=time.time()))
+        return os.path.join(self.raw_dir, filename)
+
+    def relabel(self, seq: int, label: str, verified: bool = False) -> str:
+        """Rename captcha `seq` to carry `label`; return its new path."""
+        with self._lock:
+            self._refresh()
+            return self._relabel(self.entries[seq], label, verified)
+
+    def labeled(self, verified_only: bool = False) -> List[Tuple[str, str]]:
+        """(path, label) of every labeled captcha, in sequence order.
+
+        verified_only keeps the captchas THSR accepted with that label.
+        """
+        with self._lock:
+            self._refresh()
+            return [
+                (os.path.join(self.raw_dir, e['file']), e['label'])
+                for _, e in sorted(self.entries.items())
+                if e['label'] is not None and (e.get('verified') or not verified_only)
+            ]
+
+    def unlabeled(self) -> List[dict]:
+        with self._lock:
+            self._refresh()
+            return [e for _, e in sorted(self.entries.items()) if e['label'] is None]
+
+    def _reconcile(self) -> None:
+        """Rebuild the manifest from the files on disk, keeping known sources/flags."""
+        known = {e['file']: e for e in self.entries.values()}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'):
+                        entry = json.loads(line)
+                        known[entry['file']] = entry
+
+        self.entries, self.hashes, self.next_seq = {}, {}, 1
+        for filename in sorted(os.listdir(self.raw_dir)):
+            m = _FILENAME.match(filename)
+            if not m:
+                continue
+            seq, middle = int(m.group(1)), m.group(2)
+            prev = known.get(filename)
+            if prev is None:
+                with open(os.path.join(self.raw_dir, filename), 'rb') as f:
+                    md5 = hashlib.md5(f.read()).hexdigest()
+                prev = {'md5': md5, 'source': 'disk', 'verified': False, 'time': None}
+            self._apply(dict(prev, seq=seq, file=filename, label=None if middle == UNLABELED else middle))
+
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                for _, entry in sorted(self.entries.items()):
+                    f.write(json.dumps(entry).encode() + b'\n')
+                self._offset = f.tell()
+            os.replace(tmp, self.path)
+            os.utime(self.path)  # replacing touched the directory: the manifest must stay newer
+        except OSError:
+            self._offset = 0  # read-only directory: keep the in-memory view only
+
+    def reconcile(self) -> None:
+        with self._lock:
+            self._reconcile()
+
+
+_MANIFESTS: Dict[str, RawManifest] = {}
+_MANIFESTS_LOCK = threading.Lock()
+
+
+def manifest_for(raw_dir: str = RAW_DIR) -> RawManifest:
+    """Process-wide RawManifest for `raw_dir`, refreshed on every call."""
+    key = os.path.realpath(raw_dir)
+    with _MANIFESTS_LOCK:
+        manifest = _MANIFESTS.get(key)
+        if manifest is None:
+            manifest = _MANIFESTS[key] = RawManifest(raw_dir)
+            return manifest
+    manifest.refresh()
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Rebuild the raw captcha manifest from disk')
+    parser.add_argument('--data-dir', default=RAW_DIR,
+                        help='Directory containing captcha images')
+    args = parser.parse_args()
+
+    manifest = RawManifest(args.data_dir)
+    manifest.reconcile()
+    labeled = len(manifest.labeled())
+    print(f'{manifest.path}: {len(manifest)} captchas ({labeled} labeled, '
+          f'{len(manifest) - labeled} unlabeled), next seq {manifest.next_seq}')
+
+
+if __name__ == '__main__':
+    main()
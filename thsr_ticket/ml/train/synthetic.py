@@ -0,0 +1,89 @@
+"""Synthetic captchas generated on the fly for (pre)training.
+
+SyntheticCaptchaDataset renders captchas with GenerateCaptcha.generate_batch
+inside the DataLoader worker processes and yields tensors in the same
+format as CaptchaDataset, so nothing is written to disk.
+"""
+
+import random
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from thsr_ticket.ml.captcha_solver import _preprocess
+from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+from thsr_ticket.ml.train.config import ALLOWED_CHARS, HEIGHT, NUM_CHANNELS, WIDTH
+
+
+class SyntheticCaptchaDataset(IterableDataset):
+    """Endless (or `length`-limited) stream of synthetic captchas.
+
+    Each sample returns:
+        image: float32 tensor [48, 140, 3] (HWC, normalized to [0, 1])
+        labels: int64 tensor [4] (character indices into ALLOWED_CHARS)
+
+    Every worker seeds `random` and `np.random` on its own, from `seed` plus
+    the worker id when given, otherwise from the seed DataLoader assigns it,
+    so workers never produce the same stream.
+    """
+
+    def __init__(
+        self,
+        length: Optional[int] = None,
+        preprocess: bool = True,
+        seed: Optional[int] = None,
+        font_size: int = 50,
+        chunk_size: int = 64,
+        atlas_path: Optional[str] = None,
+    ):
+        self.length = length
+        self.preprocess = preprocess
+        self.seed = seed
+        self.font_size = font_size
+        self.chunk_size = chunk_size
+        self.atlas_path = atlas_path
+        self.char_to_idx = {c: i for i, c in enumerate(ALLOWED_CHARS)}
+
+    def __len__(self) -> int:
+        if self.length is None:
+            raise TypeError('SyntheticCaptchaDataset without length is endless')
+        return self.length
+
+    def _worker_share(self) -> Tuple[int, Optional[int]]:
+        info = get_worker_info()
+        worker_id, num_workers = (info.id, info.num_workers) if info else (0, 1)
+        if self.seed is not None:
+            seed = self.seed + worker_id
+        else:
+            seed = info.seed if info else torch.initial_seed()
+        if self.length is None:
+            return seed, None
+        count = self.length // num_workers + (worker_id < self.length % num_workers)
+        return seed, count
+
+    def _to_tensors(self, gray: np.ndarray, chars: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.preprocess:
+            gray = _preprocess(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+
+        image = torch.from_numpy(gray).float().div_(255.0)
+        image_tensor = image.unsqueeze(-1).expand(-1, -1, NUM_CHANNELS)              # [48, 140, 3]
+        label_tensor = torch.tensor([self.char_to_idx[c] for c in chars], dtype=torch.long)  # [4]
+        return image_tensor, label_tensor
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        seed, count = self._worker_share()
+        random.seed(seed)
+        np.random.seed(seed % 2 ** 32)
+
+        generator = GenerateCaptcha(font_size=self.font_size, atlas_path=self.atlas_path)
+        buf = np.empty((self.chunk_size, HEIGHT, WIDTH), dtype=np.uint8)
+        n = 0
+        while count is None or n < count:
+            k = self.chunk_size if count is None else min(self.chunk_size, count - n)
+            images, labels = generator.generate_batch(k, buf[:k])
+            for gray, chars in zip(images, labels):
+                yield self._to_tensors(gray, chars)  # .float() copies out of buf
+            n += k
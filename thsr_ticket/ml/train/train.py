@@ -1,27 +1,91 @@
 """Training loop for THSR captcha CNN."""
 
 import argparse
+import contextlib
 import time
-from typing import Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
 
 import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader, random_split
 
 from thsr_ticket.ml.train.config import (
-    ALLOWED_CHARS, BATCH_SIZE, LEARNING_RATE, NUM_DIGITS,
+    ALLOWED_CHARS, BATCH_SIZE, CACHE_DIR, LEARNING_RATE, NUM_DIGITS,
     NUM_EPOCHS, RAW_DIR, VALIDATION_SPLIT, WEIGHT_DECAY,
 )
+from thsr_ticket.ml.train.augment import BatchAugment
 from thsr_ticket.ml.train.dataset import CaptchaDataset
 from thsr_ticket.ml.train.model import CaptchaCNN
+from thsr_ticket.ml.train.synthetic import SyntheticCaptchaDataset
+
+Batch = Tuple[torch.Tensor, torch.Tensor]
+
+
+def _mixed_batches(
+    real_loader: DataLoader,
+    synthetic: Optional[Iterator[Batch]] = None,
+    steps: Optional[int] = None,
+) -> Iterator[Batch]:
+    """Yield real batches, each extended with a synthetic batch if given.
+
+    Without `steps` one pass over `real_loader` is one epoch; with `steps`
+    the real loader is restarted as often as needed.
+    """
+    real = iter(real_loader)
+    n = 0
+    while steps is None or n < steps:
+        try:
+            images, labels = next(real)
+        except StopIteration:
+            if steps is None:
+                return
+            real = iter(real_loader)
+            images, labels = next(real)
+        if synthetic is not None:
+            syn_images, syn_labels = next(synthetic)
+            images = torch.cat([images, syn_images])
+            labels = torch.cat([labels, syn_labels])
+        yield images, labels
+        n += 1
+
+
+def _autocast(device: torch.device, bf16: bool) -> contextlib.AbstractContextManager:
+    if not bf16:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
+
+def prepare_model(model: nn.Module, channels_last: bool = False, compile: bool = False) -> nn.Module:
+    """Apply memory-format and compilation options; returns the module to call.
+
+    The model takes NHWC input and permutes it to NCHW in forward(). That
+    permute is only a view with channels_last strides, so with the weights
+    in channels_last too the convolutions consume it without the NCHW copy.
+    Checkpoints should still be saved from the original `model`.
+    """
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    if compile:
+        return torch.compile(model)
+    return model
+
+
+def loader_options(num_workers: int, pin_memory: bool, persistent_workers: bool) -> Dict[str, Any]:
+    return {
+        'num_workers': num_workers,
+        'pin_memory': pin_memory,
+        'persistent_workers': persistent_workers and num_workers > 0,
+    }
 
 
 def _train_one_epoch(
-    model: CaptchaCNN,
-    loader: DataLoader,
+    model: nn.Module,
+    loader: Iterable[Batch],
     optimizer: torch.optim.Optimizer,
     criterion: nn.Module,
     device: torch.device,
+    bf16: bool = False,
+    augment: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
 ) -> Tuple[float, float]:
     model.train()
     total_loss = 0.0
@@ -29,16 +93,19 @@ def _train_one_epoch(
     total = 0
 
     for images, labels in loader:
-        images = images.to(device)  # [batch, 48, 140, 3]
-        labels = labels.to(device)  # [batch, 4]
+        images = images.to(device, non_blocking=True)  # [batch, 48, 140, 3]
+        labels = labels.to(device, non_blocking=True)  # [batch, 4]
+        if augment is not None:
+            images = augment(images)
 
         optimizer.zero_grad()
-        outputs = model(images)     # tuple of 4 x [batch, num_classes]
+        with _autocast(device, bf16):
+            outputs = model(images)     # tuple of 4 x [batch, num_classes]
 
-        loss = sum(
-            criterion(outputs[i], labels[:, i])
-            for i in range(NUM_DIGITS)
-        )
+            loss = sum(
+                criterion(outputs[i], labels[:, i])
+                for i in range(NUM_DIGITS)
+            )
 
         loss.backward()
         optimizer.step()
@@ -54,20 +121,21 @@ def _train_one_epoch(
 
 
 def _validate(
-    model: CaptchaCNN,
+    model: nn.Module,
     loader: DataLoader,
     criterion: nn.Module,
     device: torch.device,
+    bf16: bool = False,
 ) -> Tuple[float, float]:
     model.eval()
     total_loss = 0.0
     correct = 0
     total = 0
 
-    with torch.no_grad():
+    with torch.no_grad(), _autocast(device, bf16):
         for images, labels in loader:
-            images = images.to(device)
-            labels = labels.to(device)
+            images = images.to(device, non_blocking=True)
+            labels = labels.to(device, non_blocking=True)
 
             outputs = model(images)
             loss = sum(
@@ -93,13 +161,52 @@ def main() -> None:
                         help='Path to save best model checkpoint')
     parser.add_argument('--resume', default=None,
                         help='Path to checkpoint to resume training from')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help='Preprocessed image cache directory')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Preprocess every image on every epoch instead of using the cache')
+    parser.add_argument('--synthetic-ratio', type=float, default=0.0,
+                        help='Fraction of each training batch drawn from generated captchas (0 <= r < 1)')
+    parser.add_argument('--synthetic-workers', type=int, default=2,
+                        help='DataLoader workers generating synthetic captchas')
+    parser.add_argument('--glyph-atlas', default=None,
+                        help='Glyph atlas file for synthetic captchas; created on first use')
+    parser.add_argument('--steps-per-epoch', type=int, default=None,
+                        help='Training batches per epoch (default: one pass over the real data)')
+    parser.add_argument('--bf16', action='store_true',
+                        help='Run forward/loss under bfloat16 autocast')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='Keep conv weights in channels_last so the NHWC input needs no copy')
+    parser.add_argument('--compile', action='store_true',
+                        help='Wrap the model with torch.compile')
+    parser.add_argument('--num-workers', type=int, default=2,
+                        help='DataLoader workers for the real data (default: 2)')
+    parser.add_argument('--pin-memory', action='store_true',
+                        help='Pin DataLoader batches in page-locked memory')
+    parser.add_argument('--persistent-workers', action='store_true',
+                        help='Keep DataLoader workers alive between epochs')
+    parser.add_argument('--augment', action='store_true',
+                        help='Apply batched augmentation (affine jitter, arcs, salt-and-pepper) to training batches')
+    parser.add_argument('--aug-rotate', type=float, default=5.0,
+                        help='Max rotation in degrees (default: 5)')
+    parser.add_argument('--aug-shift', type=float, default=0.05,
+                        help='Max shift as a fraction of width/height (default: 0.05)')
+    parser.add_argument('--aug-arc-prob', type=float, default=0.3,
+                        help='Probability of an arc overlay per sample (default: 0.3)')
+    parser.add_argument('--aug-sp-prob', type=float, default=0.01,
+                        help='Fraction of salt-and-pepper pixels (default: 0.01)')
     args = parser.parse_args()
+    if not 0.0 <= args.synthetic_ratio < 1.0:
+        parser.error('--synthetic-ratio must be in [0, 1)')
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f'Using device: {device}')
 
     # Dataset and splits
-    dataset = CaptchaDataset(data_dir=args.data_dir)
+    dataset = CaptchaDataset(
+        data_dir=args.data_dir,
+        cache_dir=None if args.no_cache else args.cache_dir,
+    )
     print(f'Total samples: {len(dataset)}')
 
     val_size = int(len(dataset) * VALIDATION_SPLIT)
@@ -109,15 +216,40 @@ def main() -> None:
         generator=torch.Generator().manual_seed(42),
     )
 
+    loader_opts = loader_options(args.num_workers, args.pin_memory, args.persistent_workers)
+    real_batch = max(1, round(args.batch_size * (1 - args.synthetic_ratio)))
     train_loader = DataLoader(
-        train_set, batch_size=args.batch_size, shuffle=True, num_workers=2,
+        train_set, batch_size=real_batch, shuffle=True, **loader_opts,
     )
+    synthetic = None
+    if real_batch < args.batch_size:
+        synthetic = iter(DataLoader(
+            SyntheticCaptchaDataset(atlas_path=args.glyph_atlas),
+            batch_size=args.batch_size - real_batch,
+            num_workers=args.synthetic_workers,
+            pin_memory=args.pin_memory,
+        ))
+        print(f'Batch: {real_batch} real + {args.batch_size - real_batch} synthetic')
     val_loader = DataLoader(
-        val_set, batch_size=args.batch_size, shuffle=False, num_workers=2,
+        val_set, batch_size=args.batch_size, shuffle=False, **loader_opts,
     )
 
     # Model, loss, optimizer
     model = CaptchaCNN(num_classes=len(ALLOWED_CHARS)).to(device)
+    net = prepare_model(model, channels_last=args.channels_last, compile=args.compile)
+    config = ', '.join(
+        f'{name}={getattr(args, name)}'
+        for name in ('bf16', 'channels_last', 'compile', 'num_workers', 'pin_memory', 'persistent_workers')
+    )
+    print(f'Config: {config}')
+    augment = None
+    if args.augment:
+        augment = BatchAugment(
+            max_rotate=args.aug_rotate,
+            max_shift=args.aug_shift,
+            arc_prob=args.aug_arc_prob,
+            sp_prob=args.aug_sp_prob,
+        )
     criterion = nn.CrossEntropyLoss()
     optimizer = torch.optim.Adam(
         model.parameters(), lr=args.lr, weight_decay=WEIGHT_DECAY,
@@ -132,19 +264,22 @@ def main() -> None:
         checkpoint = torch.load(args.resume, map_location=device, weights_only=True)
         model.load_state_dict(checkpoint)
         # Evaluate resumed model to set baseline
-        val_loss, val_acc = _validate(model, val_loader, criterion, device)
+        val_loss, val_acc = _validate(net, val_loader, criterion, device, args.bf16)
         best_val_acc = val_acc
         print(f'Resumed from {args.resume} (val_acc={val_acc:.4f})')
 
+    epoch_times = []
     for epoch in range(1, args.epochs + 1):
         t0 = time.time()
+        batches = _mixed_batches(train_loader, synthetic, args.steps_per_epoch)
         train_loss, train_acc = _train_one_epoch(
-            model, train_loader, optimizer, criterion, device,
+            net, batches, optimizer, criterion, device, args.bf16, augment,
         )
-        val_loss, val_acc = _validate(model, val_loader, criterion, device)
+        val_loss, val_acc = _validate(net, val_loader, criterion, device, args.bf16)
         scheduler.step(val_loss)
 
         elapsed = time.time() - t0
+        epoch_times.append(elapsed)
         lr = optimizer.param_groups[0]['lr']
         print(
             f'Epoch {epoch:3d}/{args.epochs} '
@@ -159,6 +294,11 @@ def main() -> None:
             print(f'  -> Saved best model (val_acc={val_acc:.4f})')
 
     print(f'\nTraining complete. Best val accuracy: {best_val_acc:.4f}')
+    if epoch_times:
+        # the first epoch includes worker start-up and (with --compile) compilation
+        steady = epoch_times[1:] or epoch_times
+        print(f'Mean epoch time: {sum(steady) / len(steady):.2f}s '
+              f'(first epoch {epoch_times[0]:.2f}s) [{config}]')
 
 
 if __name__ == '__main__':
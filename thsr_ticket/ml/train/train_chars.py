@@ -0,0 +1,157 @@
+"""Train the per-character CharCNN on segmented glyphs and export it to ONNX.
+
+Usage:
+    python -m thsr_ticket.ml.train.train_chars [--synthetic 4000] [--epochs 20]
+
+Captchas (labeled real ones from the raw manifest plus optional generated
+ones) are cut into glyphs with image_process.segment; captchas that do not
+split into exactly 4 glyphs are skipped. Segmentation runs the legacy
+line elimination (two NLM denoise passes), so it is spread over processes.
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from thsr_ticket.ml.image_process import segment
+from thsr_ticket.ml.train.char_model import CharCNN
+from thsr_ticket.ml.train.config import (
+    ALLOWED_CHARS, CHAR_ONNX_OUTPUT_NAME, GLYPH_SIZE, HEIGHT, MODEL_OUTPUT_DIR, NUM_DIGITS,
+    ONNX_INPUT_NAME, ONNX_OPSET_VERSION, RAW_DIR, VALIDATION_SPLIT, WIDTH,
+)
+from thsr_ticket.ml.train.manifest import manifest_for
+
+CHAR_ONNX_PATH = os.path.join(MODEL_OUTPUT_DIR, 'thsrc_char.onnx')
+
+Glyphs = Tuple[np.ndarray, List[int]]
+
+
+def _segment_file(item: Tuple[str, str]) -> Optional[Glyphs]:
+    path, label = item
+    img_bgr = cv2.imread(path)
+    glyphs = segment(cv2.resize(img_bgr, (WIDTH, HEIGHT)), NUM_DIGITS, GLYPH_SIZE)
+    return None if glyphs is None else (glyphs, [ALLOWED_CHARS.index(c) for c in label])
+
+
+def _segment_synthetic(args: Tuple[int, int]) -> List[Glyphs]:
+    from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+
+    seed, count = args
+    random.seed(seed)
+    np.random.seed(seed)
+    generator = GenerateCaptcha()
+    out = []
+    for _ in range(count):
+        img, chars = generator.generate()
+        img_bgr = cv2.cvtColor(cv2.resize(np.array(img), (WIDTH, HEIGHT)), cv2.COLOR_GRAY2BGR)
+        glyphs = segment(img_bgr, NUM_DIGITS, GLYPH_SIZE)
+        if glyphs is not None:
+            out.append((glyphs, [ALLOWED_CHARS.index(c) for c in chars]))
+    return out
+
+
+def collect_glyphs(data_dir: str, synthetic: int, workers: int, seed: int = 0) -> List[Glyphs]:
+    labeled = [
+        (path, label) for path, label in manifest_for(data_dir).labeled()
+        if len(label) == NUM_DIGITS and all(c in ALLOWED_CHARS for c in label)
+    ]
+    chunk = 250
+    jobs = [(seed + i, min(chunk, synthetic - i)) for i in range(0, synthetic, chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        samples = [s for s in pool.map(_segment_file, labeled, chunksize=16) if s is not None]
+        print(f'Real: {len(samples)}/{len(labeled)} segmented into {NUM_DIGITS} glyphs')
+        generated = [s for batch in pool.map(_segment_synthetic, jobs) for s in batch]
+        if synthetic:
+            print(f'Synthetic: {len(generated)}/{synthetic} segmented into {NUM_DIGITS} glyphs')
+    return samples + generated
+
+
+def _to_tensors(samples: Sequence[Glyphs]) -> TensorDataset:
+    images = np.concatenate([g for g, _ in samples])[..., None].astype(np.float32) / 255.0  # [N*4, 24, 24, 1]
+    labels = np.array([c for _, chars in samples for c in chars], dtype=np.int64)
+    return TensorDataset(torch.from_numpy(images), torch.from_numpy(labels))
+
+
+def export_char_model(model: CharCNN, output_path: str) -> None:
+    model.eval()
+    dummy_input = torch.randn(NUM_DIGITS, GLYPH_SIZE, GLYPH_SIZE, 1)
+    torch.onnx.export(
+        model,
+        dummy_input,
+        output_path,
+        opset_version=ONNX_OPSET_VERSION,
+        input_names=[ONNX_INPUT_NAME],
+        output_names=[CHAR_ONNX_OUTPUT_NAME],
+        dynamic_axes={ONNX_INPUT_NAME: {0: 'batch'}, CHAR_ONNX_OUTPUT_NAME: {0: 'batch'}},
+        dynamo=False,
+    )
+    print(f'Exported ONNX model to {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)')
+
+
+def train(samples: Sequence[Glyphs], epochs: int, batch_size: int, lr: float) -> Tuple[CharCNN, float]:
+    """Train on glyphs of all but the last VALIDATION_SPLIT captchas; return the model and
+    the share of held-out captchas with all 4 glyphs right."""
+    samples = list(samples)
+    random.Random(42).shuffle(samples)
+    val_size = max(1, int(len(samples) * VALIDATION_SPLIT))
+    train_set, val_set = _to_tensors(samples[val_size:]), _to_tensors(samples[:val_size])
+
+    model = CharCNN()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    criterion = nn.CrossEntropyLoss()
+    loader = DataLoader(train_set, batch_size=batch_size, shuffle=True)
+    val_images, val_labels = val_set.tensors
+
+    captcha_acc = 0.0
+    for epoch in range(1, epochs + 1):
+        t0 = time.time()
+        model.train()
+        total_loss = 0.0
+        for images, labels in loader:
+            optimizer.zero_grad()
+            loss = criterion(model(images), labels)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(labels)
+
+        model.eval()
+        with torch.no_grad():
+            correct = model(val_images).argmax(dim=1) == val_labels
+        captcha_acc = correct.view(-1, NUM_DIGITS).all(dim=1).float().mean().item()
+        print(f'Epoch {epoch:3d}/{epochs} | train_loss={total_loss / len(train_set):.4f} '
+              f'| val_char_acc={correct.float().mean().item():.4f} val_captcha_acc={captcha_acc:.4f} '
+              f'| {time.time() - t0:.1f}s')
+    return model, captcha_acc
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Train the per-character captcha model')
+    parser.add_argument('--data-dir', default=RAW_DIR)
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Generated captchas to add to the labeled ones')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--lr', type=float, default=3e-3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes used for segmentation')
+    parser.add_argument('--output', default=CHAR_ONNX_PATH, help='Output ONNX path')
+    args = parser.parse_args()
+
+    samples = collect_glyphs(args.data_dir, args.synthetic, args.workers)
+    if not samples:
+        parser.error('no captcha could be segmented; label some or pass --synthetic N')
+    model, _ = train(samples, args.epochs, args.batch_size, args.lr)
+    export_char_model(model, args.output)
+
+
+if __name__ == '__main__':
+    main()
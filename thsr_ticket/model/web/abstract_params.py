@@ -1,9 +1,26 @@
-from typing import Mapping, Any
+import json
+from typing import Mapping, Any, Optional
+
+from thsr_ticket.model.web.schema_validator import validate
 
 
 class AbstractParams:
+    # Skip re-validating params identical to the last ones that passed, e.g. on
+    # captcha retries where only unrelated state changed. Schemas are constant,
+    # so a params dict that validated once keeps validating. Compared as JSON
+    # so that True and 1 (or False and 0) count as different params.
+    cache_validation: bool = True
+    _last_valid: Optional[str] = None
+
     def __init__(self) -> None:
         pass
 
     def get_params(self, val: bool = True) -> Mapping[str, Any]:
         raise NotImplementedError
+
+    def _validate(self, params: Mapping[str, Any], schema: Mapping[str, Any]) -> None:
+        key = json.dumps(params, sort_keys=True, default=repr) if self.cache_validation else None
+        if key is not None and key == self._last_valid:
+            return
+        validate(params, schema=schema)
+        self._last_valid = key
@@ -1,8 +1,6 @@
 from datetime import datetime, timedelta
 from typing import Mapping, Any
 
-from jsonschema import validate
-
 from thsr_ticket.model.web.abstract_params import AbstractParams
 from thsr_ticket.configs.web.param_schema import BOOKING_SCHEMA
 
@@ -70,7 +68,7 @@ class BookingForm(AbstractParams):
         }
 
         if val:
-            validate(params, schema=BOOKING_SCHEMA)
+            self._validate(params, BOOKING_SCHEMA)
         return params
 
     @property
@@ -1,5 +1,4 @@
 from typing import Mapping, Any
-from jsonschema import validate
 
 from thsr_ticket.model.web.abstract_params import AbstractParams
 from thsr_ticket.configs.web.param_schema import CONFIRM_TICKET_SHEMA
@@ -30,7 +29,7 @@ class ConfirmTicket(AbstractParams):
         }
 
         if val:
-            validate(params, schema=CONFIRM_TICKET_SHEMA)
+            self._validate(params, CONFIRM_TICKET_SHEMA)
         return params
 
     @property
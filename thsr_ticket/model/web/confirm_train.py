@@ -1,5 +1,4 @@
 from typing import Mapping, Any
-from jsonschema import validate
 
 from thsr_ticket.model.web.abstract_params import AbstractParams
 from thsr_ticket.configs.web.param_schema import CONFIRM_TRAIN_SCHEMA
@@ -17,7 +16,7 @@ class ConfirmTrain(AbstractParams):
         }
 
         if val:
-            validate(params, schema=CONFIRM_TRAIN_SCHEMA)
+            self._validate(params, CONFIRM_TRAIN_SCHEMA)
         return params
 
     @property
@@ -0,0 +1,59 @@
+"""Compiled JSON-schema validators, built once per schema.
+
+`jsonschema.validate(params, schema=...)` looks up the validator class and
+re-checks the schema itself on every call. Here both happen once; when the
+optional `fastjsonschema` package is installed the schema is compiled to
+Python code instead. Failures are always re-raised as
+`jsonschema.exceptions.ValidationError` so callers see one exception type.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Mapping, Tuple
+
+from jsonschema.exceptions import ValidationError
+from jsonschema.validators import validator_for
+
+try:
+    import fastjsonschema
+except ImportError:  # optional speed-up
+    fastjsonschema = None  # type: ignore[assignment]
+
+Validator = Callable[[Mapping[str, Any]], None]
+
+# id(schema) -> (schema, validator); the schema is kept alive so its id stays unique
+_CACHE: Dict[int, Tuple[Mapping[str, Any], Validator]] = {}
+_LOCK = threading.Lock()
+
+
+def _build(schema: Mapping[str, Any]) -> Validator:
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    slow = cls(schema).validate
+    if fastjsonschema is None:
+        return slow
+
+    fast = fastjsonschema.compile(dict(schema))
+
+    def validate(params: Mapping[str, Any]) -> None:
+        try:
+            fast(params)
+        except fastjsonschema.JsonSchemaException as e:
+            slow(params)  # raises the jsonschema ValidationError with the full message
+            # The validators disagree; keep the stricter verdict, in the documented exception type
+            raise ValidationError(str(e)) from e
+    return validate
+
+
+def compiled_validator(schema: Mapping[str, Any]) -> Validator:
+    entry = _CACHE.get(id(schema))
+    if entry is None:
+        with _LOCK:
+            entry = _CACHE.get(id(schema))
+            if entry is None:
+                entry = _CACHE[id(schema)] = (schema, _build(schema))
+    return entry[1]
+
+
+def validate(params: Mapping[str, Any], schema: Mapping[str, Any]) -> None:
+    """Drop-in replacement for jsonschema.validate using the cached validator."""
+    compiled_validator(schema)(params)
@@ -0,0 +1,131 @@
+"""Record HTTPRequest traffic into a JSONL cassette for offline replay.
+
+Each line holds one request/response pair. Personal data (ID numbers, phone
+numbers, e-mail addresses and session cookies) is redacted before it is
+written, so cassettes can be shared and committed as fixtures.
+"""
+
+import base64
+import json
+import re
+import threading
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests.models import Response
+
+REDACTED = 'REDACTED'
+
+# Form fields that carry personal data
+PII_PARAMS = (
+    'dummyId',
+    'dummyPhone',
+    'email',
+    'passengerDataIdNumber',
+    'memberShipNumber',
+)
+SECRET_HEADERS = ('Cookie', 'Set-Cookie')
+
+_PII_PATTERNS = [
+    re.compile(r'\b[A-Z][12]\d{8}\b'),               # R.O.C. ID
+    re.compile(r'\b09\d{2}-?\d{3}-?\d{3}\b'),        # mobile phone
+    re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'),         # e-mail
+]
+_JSESSIONID = re.compile(r'(jsessionid[=:])[\w.-]+', re.IGNORECASE)
+
+
+def classify(url: str) -> str:
+    """Map a THSR url onto the endpoint name used by the recorder and stand-in server."""
+    if 'passCode' in url:
+        return 'security_code_img'
+    if 'BookingS1Form' in url:
+        return 'submit_booking_form'
+    if 'BookingS2Form' in url:
+        return 'submit_train'
+    if 'BookingS3Form' in url:
+        return 'submit_ticket'
+    return 'booking_page'
+
+
+def redact_text(text: str, secrets: Optional[List[str]] = None) -> str:
+    for value in secrets or []:
+        if value:
+            text = text.replace(value, REDACTED)
+    for pattern in _PII_PATTERNS:
+        text = pattern.sub(REDACTED, text)
+    return _JSESSIONID.sub(r'\1' + REDACTED, text)
+
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [
+        (k, REDACTED if any(k.endswith(p) for p in PII_PARAMS) and v else v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    path = _JSESSIONID.sub(r'\1' + REDACTED, parts.path)
+    return urlunsplit((parts.scheme, parts.netloc, path, urlencode(query, safe=':'), parts.fragment))
+
+
+def _pii_values(url: str) -> List[str]:
+    query = parse_qsl(urlsplit(url).query, keep_blank_values=True)
+    return [v for k, v in query if v and any(k.endswith(p) for p in PII_PARAMS)]
+
+
+def _redact_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    return {k: (REDACTED if k in SECRET_HEADERS else v) for k, v in headers.items()}
+
+
+class Recorder:
+    """Response hook that appends redacted request/response pairs to `path`.
+
+    Usage:
+        client = HTTPRequest(recorder=Recorder('session.jsonl'))
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._secrets: List[str] = []
+
+    def __call__(self, resp: Response, *args: Any, **kwargs: Any) -> Response:
+        self.record(resp)
+        return resp
+
+    def record(self, resp: Response) -> None:
+        req = resp.request
+        url = req.url or ''
+        with self._lock:
+            # Values typed into one form may be echoed back on later pages
+            self._secrets.extend(v for v in _pii_values(url) if v not in self._secrets)
+            secrets = list(self._secrets)
+
+        content_type = resp.headers.get('Content-Type', '')
+        body = resp.content
+        if content_type.startswith('text/') or 'html' in content_type:
+            body = redact_text(body.decode(resp.encoding or 'utf-8', errors='replace'), secrets).encode('utf-8')
+
+        entry = {
+            'endpoint': classify(url),
+            'method': req.method,
+            'url': redact_url(url),
+            'request_headers': _redact_headers(req.headers),
+            'status': resp.status_code,
+            'response_headers': _redact_headers(
+                {k: v for k, v in resp.headers.items() if k not in ('Content-Encoding', 'Content-Length')}
+            ),
+            'elapsed': resp.elapsed.total_seconds(),
+            'body': base64.b64encode(body).decode('ascii'),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def load_cassette(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entry['body'] = base64.b64decode(entry['body'])
+                yield entry
@@ -0,0 +1,94 @@
+"""Direct alias -> value form encoding for the pydantic form models.
+
+Replaces `json.loads(model.json(by_alias=True))`, which serialized every model
+to a JSON string and parsed it back on each attempt. The alias table is built
+once per model class, and the URL-encoded query is built once per template:
+between captcha retries only the `variable` field is re-encoded.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple, Type
+from urllib.parse import urlencode
+
+from pydantic import BaseModel
+
+from thsr_ticket.configs.web.param_schema import BookingModel, ConfirmTicketModel, ConfirmTrainModel
+
+MAX_TEMPLATES = 32
+
+
+def _encode(pairs: Any) -> str:
+    # Same rules as requests: drop None values, quote_plus everything else
+    return urlencode([(k, v) for k, v in pairs if v is not None])
+
+
+class FormTemplate:
+    """Pre-encoded query string with one slot left open for the variable field."""
+
+    def __init__(self, head: str, alias: Optional[str], tail: str) -> None:
+        self.head = head
+        self.alias = alias
+        self.tail = tail
+
+    def fill(self, value: Any = None, extra: Optional[Mapping[str, Any]] = None) -> str:
+        parts = [self.head]
+        if self.alias is not None and value is not None:
+            parts.append(urlencode([(self.alias, value)]))
+        parts.append(self.tail)
+        if extra:
+            parts.append(_encode(extra.items()))
+        return '&'.join(p for p in parts if p)
+
+
+class FormEncoder:
+    def __init__(self, model_cls: Type[BaseModel], variable: Optional[str] = None) -> None:
+        self.fields: Tuple[Tuple[str, str], ...] = tuple(
+            (name, field.alias) for name, field in model_cls.__fields__.items()
+        )
+        self.variable = variable
+        self._aliases = frozenset(alias for _, alias in self.fields)
+        self._static = tuple(name for name, _ in self.fields if name != variable)
+        self._templates: 'OrderedDict[Tuple[Any, ...], FormTemplate]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def to_dict(self, model: BaseModel) -> Dict[str, Any]:
+        """Equivalent to json.loads(model.json(by_alias=True)) for the form models."""
+        values = model.__dict__
+        return {alias: values[name] for name, alias in self.fields}
+
+    def template(self, model: BaseModel) -> FormTemplate:
+        values = model.__dict__
+        key = tuple(values[name] for name in self._static)
+        with self._lock:
+            tmpl = self._templates.get(key)
+            if tmpl is not None:
+                self._templates.move_to_end(key)
+                return tmpl
+
+        head, tail, alias, seen = [], [], None, False
+        for name, field_alias in self.fields:
+            if name == self.variable:
+                alias, seen = field_alias, True
+                continue
+            (tail if seen else head).append((field_alias, values[name]))
+        tmpl = FormTemplate(_encode(head), alias, _encode(tail))
+
+        with self._lock:
+            self._templates[key] = tmpl
+            if len(self._templates) > MAX_TEMPLATES:
+                self._templates.popitem(last=False)
+        return tmpl
+
+    def encode(self, model: BaseModel, extra: Optional[Mapping[str, Any]] = None) -> str:
+        """URL-encoded form params, ready to pass as `params=` to HTTPRequest."""
+        if extra and not self._aliases.isdisjoint(extra):
+            # Extra params override model fields in place, like dict.update did
+            return _encode({**self.to_dict(model), **extra}.items())
+        value = getattr(model, self.variable) if self.variable else None
+        return self.template(model).fill(value, extra)
+
+
+BOOKING_FORM = FormEncoder(BookingModel, variable='security_code')
+CONFIRM_TRAIN_FORM = FormEncoder(ConfirmTrainModel, variable='selected_train')
+CONFIRM_TICKET_FORM = FormEncoder(ConfirmTicketModel)
@@ -0,0 +1,149 @@
+"""HTTP/2 transport for HTTPRequest, built on the optional `httpx` package.
+
+H2Session stands in for the requests.Session inside HTTPRequest: it has the
+same get/post/cookies/hooks surface and returns requests Responses, so flows,
+the capture Recorder and `self.sess.cookies["JSESSIONID"]` work unchanged.
+Every request of a session (and of every session sharing an H2Transports)
+is a stream on one multiplexed connection per host instead of waiting for a
+free HTTP/1.1 connection.
+
+    pip install "thsr-ticket[http2]"
+
+https:// origins negotiate HTTP/2 with ALPN and fall back to HTTP/1.1;
+http:// origins (the stand-in servers) speak HTTP/2 with prior knowledge.
+"""
+
+import ssl
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from requests.cookies import RequestsCookieJar
+from requests.hooks import dispatch_hook
+from requests.models import PreparedRequest, Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import httpx
+except ImportError:  # optional: pip install "httpx[http2]"
+    httpx = None  # type: ignore[assignment]
+
+# Connection-specific headers are not allowed in HTTP/2 (RFC 9113 8.2.2)
+HOP_BY_HOP = ('connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade')
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_ssl_lock = threading.Lock()
+
+
+def available() -> bool:
+    if httpx is None:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _require() -> None:
+    if not available():
+        raise RuntimeError('HTTP/2 needs httpx and h2: pip install "thsr-ticket[http2]"')
+
+
+def _ssl() -> ssl.SSLContext:
+    # Loading the CA bundle takes tens of milliseconds; do it once per process.
+    global _ssl_context
+    with _ssl_lock:
+        if _ssl_context is None:
+            _ssl_context = httpx.create_ssl_context()
+        return _ssl_context
+
+
+class H2Transports:
+    """One connection pool per scheme; share it between sessions like SharedPool.
+
+    retries only covers failed connects: httpx does not retry on status codes.
+    """
+
+    def __init__(self, max_connections: int = 4, keep_alive: bool = True, retries: int = 3) -> None:
+        _require()
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections if keep_alive else 0,
+        )
+        self.mounts = {
+            'https://': httpx.HTTPTransport(verify=_ssl(), http2=True, limits=limits, retries=retries),
+            'http://': httpx.HTTPTransport(verify=_ssl(), http1=False, http2=True, limits=limits, retries=retries),
+        }
+
+    def close(self) -> None:
+        for transport in self.mounts.values():
+            transport.close()
+
+
+class H2Session:
+    """The part of requests.Session that HTTPRequest uses, sent through httpx."""
+
+    def __init__(self, transports: Optional[H2Transports] = None) -> None:
+        _require()
+        self.transports = transports or H2Transports()
+        # An explicit transport also keeps httpx from building a default one (and SSL context) per client
+        self.client = httpx.Client(
+            transport=self.transports.mounts['https://'], mounts=self.transports.mounts, follow_redirects=False,
+        )
+        self.hooks: Dict[str, List[Callable[..., Any]]] = {'response': []}
+
+    @property
+    def cookies(self) -> 'httpx.Cookies':
+        # httpx.Cookies supports cookies["JSESSIONID"] like a RequestsCookieJar
+        return self.client.cookies
+
+    def get(self, url: str, headers: Optional[Mapping[str, str]] = None, allow_redirects: bool = True,
+            timeout: Optional[Tuple[float, float]] = None) -> Response:
+        return self.request('GET', url, headers=headers, allow_redirects=allow_redirects, timeout=timeout)
+
+    def post(self, url: str, headers: Optional[Mapping[str, str]] = None, params: Any = None,
+             allow_redirects: bool = True, timeout: Optional[Tuple[float, float]] = None) -> Response:
+        return self.request('POST', url, headers=headers, params=params,
+                            allow_redirects=allow_redirects, timeout=timeout)
+
+    def request(self, method: str, url: str, headers: Optional[Mapping[str, str]] = None, params: Any = None,
+                allow_redirects: bool = True, timeout: Optional[Tuple[float, float]] = None) -> Response:
+        if params:
+            # Let requests build the query string so the url is byte-identical to HTTP/1.1
+            prepared = PreparedRequest()
+            prepared.prepare_url(url, params)
+            url = prepared.url  # type: ignore[assignment]
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() not in HOP_BY_HOP}
+        if timeout is not None:
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)  # type: ignore[assignment]
+        resp = self.client.request(method, url, headers=headers, timeout=timeout, follow_redirects=allow_redirects)
+        return dispatch_hook('response', self.hooks, _to_response(resp))
+
+    def close(self) -> None:
+        # Like requests.Session.close this closes the transports, shared or not
+        self.client.close()
+
+
+def _to_response(resp: 'httpx.Response') -> Response:
+    result = Response()
+    result.status_code = resp.status_code
+    result.reason = resp.reason_phrase
+    result.headers = CaseInsensitiveDict(resp.headers)
+    result._content = resp.content
+    result.encoding = get_encoding_from_headers(result.headers)
+    result.url = str(resp.url)
+    result.elapsed = resp.elapsed
+    result.history = [_to_response(r) for r in resp.history]
+    result.cookies = RequestsCookieJar()
+    for cookie in resp.cookies.jar:
+        result.cookies.set_cookie(cookie)
+
+    request = PreparedRequest()
+    request.method = resp.request.method
+    request.url = str(resp.request.url)
+    request.headers = CaseInsensitiveDict(resp.request.headers)
+    request.body = resp.request.content or None
+    result.request = request
+    return result
@@ -1,58 +1,307 @@
-from typing import Mapping, Any
+import dataclasses
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from html import unescape
+from typing import Dict, Mapping, Any, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
 import requests
 from requests.adapters import HTTPAdapter
 from requests.models import Response
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
 from thsr_ticket.configs.web.http_config import HTTPConfig
+from thsr_ticket.metrics import HTTP_REQUEST_SECONDS
 from thsr_ticket.configs.web.parse_html_element import BOOKING_PAGE
+from thsr_ticket.remote.capture import Recorder
+from thsr_ticket.remote.http2_session import H2Session, H2Transports
+
+# Form params: a mapping, or a query string pre-encoded by thsr_ticket.remote.form_encoder
+FormParams = Union[Mapping[str, Any], str]
+
+# The captcha <img> tag of the booking page (BOOKING_PAGE["security_code_img"]), matched on raw bytes
+_CAPTCHA_IMG_TAG = re.compile(rb'<img\b[^>]*\bid="BookingS1Form_homeCaptcha_passCode"[^>]*>')
+_SRC = re.compile(rb'\bsrc="([^"]*)"')
+_TAG_OVERLAP = 512  # bytes re-scanned per chunk, so a tag split across chunks is still found
+STREAM_CHUNK = 4096
+
+# What a POST response turned out to be: an error panel (ErrorFeedback), the train list (AvailTrains)
+# or the booking result (BookingResult). Only the first can be cut short: the others are parsed whole.
+_OUTCOME = re.compile(rb'class="[^"]*\b(feedbackPanelERROR|result-item|pnr-code)\b')
+_ERROR_PANEL_END = b'</ul>'
+
+# Captcha downloads started while the booking page streams in, and bodies drained after an early exit
+_background = ThreadPoolExecutor(max_workers=4, thread_name_prefix='thsr-http')
+
+# (connect, read) timeout in seconds per endpoint
+Timeout = Tuple[float, float]
+DEFAULT_TIMEOUTS: Dict[str, Timeout] = {
+    'booking_page': (3.05, 15.0),
+    'security_code_img': (3.05, 10.0),
+    'submit_booking_form': (3.05, 20.0),
+    'submit_train': (3.05, 20.0),
+    'submit_ticket': (3.05, 30.0),
+}
+
+
+@dataclass
+class HTTPOptions:
+    pool_maxsize: int = 4             # connections kept open per host
+    pool_block: bool = False          # wait for a free connection instead of opening an extra one
+    keep_alive: bool = True
+    retries: int = 3
+    backoff_factor: float = 0.5       # sleeps 0, 1, 2, ... seconds between retries (urllib3 Retry)
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+    timeouts: Dict[str, Timeout] = field(default_factory=dict)  # overrides DEFAULT_TIMEOUTS
+    http2: bool = False               # send through httpx (thsr_ticket.remote.http2_session)
+    early_exit: bool = True           # stop reading a POST response at its error panel (read_until_outcome)
+
+    def retry(self) -> Retry:
+        # urllib3 only retries reads and error statuses for idempotent methods, so a
+        # POST is resent only when the connection failed before anything was sent.
+        return Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.retry_statuses,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+
+    def adapter(self) -> HTTPAdapter:
+        return HTTPAdapter(pool_maxsize=self.pool_maxsize, pool_block=self.pool_block, max_retries=self.retry())
+
+    def h2_transports(self) -> H2Transports:
+        return H2Transports(max_connections=self.pool_maxsize, keep_alive=self.keep_alive, retries=self.retries)
+
+    def timeout(self, endpoint: str) -> Timeout:
+        return tuple(self.timeouts.get(endpoint, DEFAULT_TIMEOUTS[endpoint]))  # type: ignore[return-value]
+
+
+class SharedPool:
+    """One bounded connection pool for many HTTPRequest sessions.
+
+    Every HTTPRequest keeps its own requests.Session (cookie jar, JSESSIONID)
+    but sends through this adapter, so any number of booking sessions use at
+    most `pool_maxsize` connections per host, and a new session reuses an open
+    connection instead of connecting (and handshaking TLS) again. With
+    `options.http2` the sessions share H2Transports instead, and their
+    requests are multiplexed over one connection per host.
+    """
+
+    def __init__(self, options: Optional[HTTPOptions] = None) -> None:
+        self.options = dataclasses.replace(options or HTTPOptions(), pool_block=True)
+        self.adapter: Optional[HTTPAdapter] = None
+        self.h2_transports: Optional[H2Transports] = None
+        if self.options.http2:
+            self.h2_transports = self.options.h2_transports()
+        else:
+            self.adapter = self.options.adapter()
+
+    def close(self) -> None:
+        if self.h2_transports is not None:
+            self.h2_transports.close()
+        else:
+            self.adapter.close()
 
 
 class HTTPRequest:
-    def __init__(self, max_retries: int = 3) -> None:
-        self.sess = requests.Session()
-        self.sess.mount("https://", HTTPAdapter(max_retries=max_retries))
+    def __init__(
+        self,
+        max_retries: Optional[int] = None,
+        base_url: Optional[str] = None,
+        recorder: Optional[Recorder] = None,
+        options: Optional[HTTPOptions] = None,
+        pool: Optional[SharedPool] = None,
+    ) -> None:
+        """
+        base_url: send every request to this origin instead of HTTPConfig.BASE_URL,
+            e.g. a local stand-in server (thsr_ticket.remote.standin_server).
+        recorder: capture request/response pairs into a cassette (thsr_ticket.remote.capture).
+        options: pool size, keep-alive, retry backoff and per-endpoint timeouts.
+        pool: send through a SharedPool (its options win) instead of a private pool.
+
+        With `options.http2` the session is an H2Session (needs httpx); it keeps
+        the requests.Session interface, so `sess.cookies["JSESSIONID"]` still works.
+        """
+        if pool is not None:
+            options = pool.options
+        options = options or HTTPOptions()
+        if max_retries is not None:
+            options = dataclasses.replace(options, retries=max_retries)
+        self.options = options
+        self.pool = pool
+        self.base_url = (base_url or HTTPConfig.BASE_URL).rstrip('/')
+        self.sess: Union[requests.Session, H2Session]
+        if options.http2:
+            self.sess = H2Session(pool.h2_transports if pool is not None else options.h2_transports())
+        else:
+            self.sess = requests.Session()
+            adapter = pool.adapter if pool is not None else options.adapter()
+            self.sess.mount("https://", adapter)
+            self.sess.mount("http://", adapter)
+        if recorder is not None:
+            self.sess.hooks['response'].append(recorder)
 
         self.common_head_html: dict = {
-            "Host": HTTPConfig.HTTPHeader.BOOKING_PAGE_HOST,
+            "Host": urlsplit(self.base_url).netloc,
             "User-Agent": HTTPConfig.HTTPHeader.USER_AGENT,
             "Accept": HTTPConfig.HTTPHeader.ACCEPT_HTML,
             "Accept-Language": HTTPConfig.HTTPHeader.ACCEPT_LANGUAGE,
-            "Accept-Encoding": HTTPConfig.HTTPHeader.ACCEPT_ENCODING
+            "Accept-Encoding": HTTPConfig.HTTPHeader.ACCEPT_ENCODING,
+            "Connection": "keep-alive" if options.keep_alive else "close",
         }
 
+    def close(self) -> None:
+        """Close this session's connections; a SharedPool stays open for the other sessions."""
+        if self.pool is None:
+            self.sess.close()
+
+    def _url(self, url: str) -> str:
+        return self.base_url + url[len(HTTPConfig.BASE_URL):]
+
     def request_booking_page(self) -> Response:
-        return self.sess.get(HTTPConfig.BOOKING_PAGE_URL, headers=self.common_head_html, allow_redirects=True, timeout=15)
+        with HTTP_REQUEST_SECONDS.time(endpoint='booking_page'):
+            return self.sess.get(
+                self._url(HTTPConfig.BOOKING_PAGE_URL),
+                headers=self.common_head_html,
+                allow_redirects=True,
+                timeout=self.options.timeout('booking_page'),
+            )
 
     def request_security_code_img(self, book_page: bytes) -> Response:
-        img_url = parse_security_img_url(book_page)
-        return self.sess.get(img_url, headers=self.common_head_html, timeout=15)
-
-    def submit_booking_form(self, params: Mapping[str, Any]) -> Response:
-        url = HTTPConfig.SUBMIT_FORM_URL.format(self.sess.cookies["JSESSIONID"])
-        return self.sess.post(url, headers=self.common_head_html, params=params, allow_redirects=True, timeout=15)
-
-    def submit_train(self, params: Mapping[str, Any]) -> Response:
-        return self.sess.post(
-            HTTPConfig.CONFIRM_TRAIN_URL,
-            headers=self.common_head_html,
-            params=params,
-            allow_redirects=True,
-            timeout=15,
-        )
+        return self._get_security_code_img(parse_security_img_url(book_page, base_url=self.base_url))
 
-    def submit_ticket(self, params: Mapping[str, Any]) -> Response:
-        return self.sess.post(
-            HTTPConfig.CONFIRM_TICKET_URL,
-            headers=self.common_head_html,
-            params=params,
-            allow_redirects=True,
-            timeout=15,
-        )
+    def _get_security_code_img(self, img_url: str) -> Response:
+        with HTTP_REQUEST_SECONDS.time(endpoint='security_code_img'):
+            return self.sess.get(
+                img_url, headers=self.common_head_html, timeout=self.options.timeout('security_code_img'),
+            )
+
+    def request_booking_page_and_captcha(self) -> Tuple[Response, Response]:
+        """The booking page and its captcha image.
+
+        The page is streamed and the captcha download starts as soon as its
+        <img> tag has arrived, overlapping the rest of the page. Response hooks
+        (a Recorder) read the whole body first and H2Session does not stream,
+        so then the two are fetched one after the other.
+        """
+        if not self._can_stream():
+            page = self.request_booking_page()
+            return page, self.request_security_code_img(page.content)
+
+        img = None
+        with HTTP_REQUEST_SECONDS.time(endpoint='booking_page'):
+            page = self.sess.get(
+                self._url(HTTPConfig.BOOKING_PAGE_URL),
+                headers=self.common_head_html,
+                allow_redirects=True,
+                timeout=self.options.timeout('booking_page'),
+                stream=True,
+            )
+            body = bytearray()
+            try:
+                for chunk in page.iter_content(STREAM_CHUNK):
+                    scan_from = max(0, len(body) - _TAG_OVERLAP)
+                    body += chunk
+                    if img is None:
+                        img_url = find_security_img_url(body, base_url=self.base_url, pos=scan_from)
+                        if img_url is not None:
+                            img = _background.submit(self._get_security_code_img, img_url)
+            finally:
+                page.close()  # hands the connection back to the pool once the body is read
+            page._content = bytes(body)
+        if img is None:
+            return page, self.request_security_code_img(page.content)
+        return page, img.result()
+
+    def submit_booking_form(self, params: FormParams) -> Response:
+        url = self._url(HTTPConfig.SUBMIT_FORM_URL.format(self.sess.cookies["JSESSIONID"]))
+        return self._post('submit_booking_form', url, params)
+
+    def submit_train(self, params: FormParams) -> Response:
+        return self._post('submit_train', self._url(HTTPConfig.CONFIRM_TRAIN_URL), params)
+
+    def submit_ticket(self, params: FormParams) -> Response:
+        return self._post('submit_ticket', self._url(HTTPConfig.CONFIRM_TICKET_URL), params)
 
+    def _post(self, endpoint: str, url: str, params: FormParams) -> Response:
+        with HTTP_REQUEST_SECONDS.time(endpoint=endpoint):
+            if not (self.options.early_exit and self._can_stream()):
+                return self.sess.post(
+                    url,
+                    headers=self.common_head_html,
+                    params=params,
+                    allow_redirects=True,
+                    timeout=self.options.timeout(endpoint),
+                )
+            resp = self.sess.post(
+                url,
+                headers=self.common_head_html,
+                params=params,
+                allow_redirects=True,
+                timeout=self.options.timeout(endpoint),
+                stream=True,
+            )
+            read_until_outcome(resp)
+            return resp
 
-def parse_security_img_url(html: bytes) -> str:
+    def _can_stream(self) -> bool:
+        # Response hooks (a Recorder) read the whole body before we see it; H2Session does not stream.
+        return isinstance(self.sess, requests.Session) and not self.sess.hooks['response']
+
+
+def read_until_outcome(resp: Response) -> bool:
+    """Read a streamed POST response until its outcome is known; True if it was cut short.
+
+    An error page ends at its feedback panel, which is all ErrorFeedback
+    parses, so resp.content is that prefix and the rest of the body is
+    drained in the background to keep the connection reusable. Once a
+    train list or booking result shows up, the body is read to the end.
+    """
+    body = bytearray()
+    scan_from, error_at = 0, -1
+    scanning = True
+    for chunk in resp.iter_content(STREAM_CHUNK):
+        body += chunk
+        if error_at < 0 and scanning:
+            m = _OUTCOME.search(body, scan_from)
+            scan_from = max(0, len(body) - _TAG_OVERLAP)
+            if m is None:
+                continue
+            if m.group(1) != b'feedbackPanelERROR':
+                scanning = False
+                continue
+            error_at = m.end()
+        if error_at >= 0:
+            end = body.find(_ERROR_PANEL_END, error_at)
+            if end >= 0:
+                resp._content = bytes(body[:end + len(_ERROR_PANEL_END)])
+                _background.submit(_drain, resp)
+                return True
+    resp._content = bytes(body)
+    resp.close()  # hands the connection back to the pool
+    return False
+
+
+def _drain(resp: Response) -> None:
+    resp.raw.drain_conn()
+    resp.raw.release_conn()
+
+
+def parse_security_img_url(html: bytes, base_url: str = HTTPConfig.BASE_URL) -> str:
     page = BeautifulSoup(html, features="html.parser")
     element = page.find(**BOOKING_PAGE["security_code_img"])
-    return HTTPConfig.BASE_URL + element["src"]
+    return base_url + element["src"]
+
+
+def find_security_img_url(
+    partial_html: Union[bytes, bytearray], base_url: str = HTTPConfig.BASE_URL, pos: int = 0,
+) -> Optional[str]:
+    """parse_security_img_url on a page prefix: None until the whole <img> tag has arrived."""
+    tag = _CAPTCHA_IMG_TAG.search(partial_html, pos)
+    src = _SRC.search(tag.group(0)) if tag else None
+    if src is None:
+        return None
+    return base_url + unescape(src.group(1).decode('utf-8'))
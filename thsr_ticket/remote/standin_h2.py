@@ -0,0 +1,172 @@
+"""HTTP/2 front end for the stand-in server (needs the optional `h2` package).
+
+Speaks cleartext HTTP/2 with prior knowledge (h2c), which is what
+HTTPRequest(options=HTTPOptions(http2=True)) uses for http:// origins:
+
+    python -m thsr_ticket.remote.standin_server --http2 --port 8080
+
+Streams are answered concurrently, so latency configured in StandInConfig
+overlaps for requests multiplexed on one connection, as it does on THSR.
+"""
+
+import socket
+import socketserver
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from thsr_ticket.remote.standin_server import StandInApp, StandInConfig
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+except ImportError:  # optional: pip install "thsr-ticket[http2]"
+    h2 = None  # type: ignore[assignment]
+
+RECV_SIZE = 65535
+# Connection-specific headers StandInApp adds for HTTP/1.1
+_DROP_HEADERS = ('connection', 'keep-alive', 'transfer-encoding')
+
+
+class _Connection:
+    """One client connection: an h2 state machine guarded by a lock, one thread per stream."""
+
+    def __init__(self, sock: socket.socket, app: StandInApp) -> None:
+        self.sock = sock
+        self.app = app
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.lock = threading.Lock()
+        self.window_open = threading.Condition(self.lock)
+        self.closed = False
+        self.requests: Dict[int, Tuple[List[Tuple[str, str]], bytearray]] = {}
+
+    def _flush(self) -> None:
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def serve(self) -> None:
+        with self.lock:
+            self.conn.initiate_connection()
+            self._flush()
+        try:
+            while True:
+                data = self.sock.recv(RECV_SIZE)
+                if not data:
+                    return
+                with self.lock:
+                    events = self.conn.receive_data(data)
+                    for event in events:
+                        self._on_event(event)
+                    self._flush()
+                    self.window_open.notify_all()
+                if any(isinstance(e, h2.events.ConnectionTerminated) for e in events):
+                    return
+        except (OSError, h2.exceptions.ProtocolError):
+            return
+        finally:
+            with self.lock:
+                self.closed = True
+                self.window_open.notify_all()
+
+    def _on_event(self, event: object) -> None:
+        if isinstance(event, h2.events.RequestReceived):
+            self.requests[event.stream_id] = (list(event.headers), bytearray())
+        elif isinstance(event, h2.events.DataReceived):
+            self.requests[event.stream_id][1].extend(event.data)
+            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded):
+            headers, body = self.requests.pop(event.stream_id)
+            threading.Thread(
+                target=self._respond, args=(event.stream_id, headers, bytes(body)), daemon=True,
+            ).start()
+        elif isinstance(event, h2.events.StreamReset):
+            self.requests.pop(event.stream_id, None)
+
+    def _respond(self, stream_id: int, raw_headers: List[Tuple[str, str]], body: bytes) -> None:
+        pseudo = {k: v for k, v in raw_headers if k.startswith(':')}
+        headers: Dict[str, str] = {}
+        for name, value in raw_headers:
+            if name.startswith(':'):
+                continue
+            name = name.title()
+            # HTTP/2 may split the Cookie header into one field per cookie
+            headers[name] = f'{headers[name]}; {value}' if name == 'Cookie' and name in headers else value
+        status, reply_headers, payload = self.app.handle(pseudo[':method'], pseudo[':path'], headers, body)
+
+        out = [(':status', str(status))] + [
+            (k.lower(), v) for k, v in reply_headers if k.lower() not in _DROP_HEADERS
+        ]
+        try:
+            with self.lock:
+                self.conn.send_headers(stream_id, out, end_stream=not payload)
+                self._flush()
+            for chunk in self.app.chunks(payload):
+                view = memoryview(chunk)
+                while view:
+                    with self.lock:
+                        while not self.closed and self.conn.local_flow_control_window(stream_id) <= 0:
+                            self.window_open.wait()
+                        if self.closed:
+                            return
+                        size = min(len(view), self.conn.local_flow_control_window(stream_id),
+                                   self.conn.max_outbound_frame_size)
+                        self.conn.send_data(stream_id, view[:size].tobytes())
+                        self._flush()
+                    view = view[size:]
+            if payload:
+                with self.lock:
+                    self.conn.end_stream(stream_id)
+                    self._flush()
+        except (OSError, h2.exceptions.StreamClosedError):
+            pass
+
+
+class _H2Handler(socketserver.BaseRequestHandler):
+    app: StandInApp
+
+    def handle(self) -> None:
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _Connection(self.request, self.app).serve()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandInH2Server:
+    """StandInServer over h2c; same interface.
+
+    with StandInH2Server(StandInConfig(latency=0.05)) as server:
+        client = HTTPRequest(base_url=server.url, options=HTTPOptions(http2=True))
+    """
+
+    def __init__(self, config: StandInConfig = None, host: str = '127.0.0.1', port: int = 0) -> None:
+        if h2 is None:
+            raise RuntimeError('the HTTP/2 stand-in needs h2: pip install "thsr-ticket[http2]"')
+        self.app = StandInApp(config)
+        handler = type('StandInH2Handler', (_H2Handler,), {'app': self.app})
+        self.server = _ThreadingTCPServer((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StandInH2Server':
+        self._thread = threading.Thread(target=self.server.serve_forever, name='thsr-standin-h2', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'StandInH2Server':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:  # type: ignore[no-untyped-def]
+        self.stop()
@@ -0,0 +1,128 @@
+"""Minimal HTML pages served by the local THSR stand-in server.
+
+The markup only contains what the parsers in `controller/` and `view_model/`
+look for, using the same ids and classes as irs.thsrc.com.tw.
+"""
+
+import struct
+import zlib
+from typing import List, Sequence, Tuple
+
+from thsr_ticket.configs.web.http_config import HTTPConfig
+
+CAPTCHA_ERROR_MSG = '檢測碼輸入錯誤，請確認後重新輸入，謝謝！'
+NO_TRAINS_MSG = '去程查無可售車次或選購的車票已售完，請重新輸入訂票條件。'
+EXPIRED_MSG = '網頁已逾期，請重新訂位。'
+
+_S1_URL = HTTPConfig.SUBMIT_FORM_URL[len(HTTPConfig.BASE_URL):]
+_S2_URL = HTTPConfig.CONFIRM_TRAIN_URL[len(HTTPConfig.BASE_URL):]
+_S3_URL = HTTPConfig.CONFIRM_TICKET_URL[len(HTTPConfig.BASE_URL):]
+CAPTCHA_IMG_PATH = '/IMINT/?wicket:interface=:0:BookingS1Form:homeCaptcha:passCode::IResourceListener'
+
+# (train id, departure, arrival, duration, discount)
+DEFAULT_TRAINS: Sequence[Tuple[int, str, str, str, str]] = (
+    (803, '06:30', '08:15', '1:45', ''),
+    (603, '07:00', '08:35', '1:35', '早鳥8折'),
+    (805, '07:30', '09:15', '1:45', ''),
+    (609, '08:00', '09:35', '1:35', '大學生5折'),
+    (663, '08:46', '10:20', '1:34', '早鳥65折'),
+)
+
+
+def _page(body: str) -> bytes:
+    return (
+        '<!DOCTYPE html><html lang="zh-TW"><head><meta charset="utf-8"/>'
+        '<title>台灣高鐵網路訂票</title></head><body>'
+        f'{body}</body></html>'
+    ).encode('utf-8')
+
+
+def _filler(size: int) -> str:
+    return f'<script>/*{"." * size}*/</script>' if size else ''
+
+
+def _feedback(msgs: List[str]) -> str:
+    if not msgs:
+        return ''
+    items = ''.join(f'<li><span class="feedbackPanelERROR">{m}</span></li>' for m in msgs)
+    return f'<ul class="feedbackPanel">{items}</ul>'
+
+
+def booking_page(session_id: str, nonce: int, errors: List[str] = None, tail: int = 0) -> bytes:
+    """tail: bytes of filler script after the form, where the real page has its scripts and footer."""
+    return _page(
+        _feedback(errors or [])
+        + f'<form id="BookingS1Form" method="post" action="{_S1_URL.format(session_id)}">'
+        '<select id="BookingS1Form_tripCon_typesoftrip" name="tripCon:typesoftrip">'
+        '<option value="0" selected="selected">單程</option><option value="1">去回程</option></select>'
+        '<select id="BookingS1Form_seatCon_seatRadioGroup" name="seatCon:seatRadioGroup">'
+        '<option value="radio17" selected="selected">無座位偏好</option>'
+        '<option value="radio19">靠窗優先</option><option value="radio21">走道優先</option></select>'
+        '<input type="radio" name="bookingMethod" value="radio31" checked="checked"/>'
+        '<input type="radio" name="bookingMethod" value="radio33"/>'
+        f'<img id="BookingS1Form_homeCaptcha_passCode" src="{CAPTCHA_IMG_PATH}&amp;wicket:antiCache={nonce}"/>'
+        '</form>'
+        + _filler(tail)
+    )
+
+
+def trains_page(trains: Sequence[Tuple[int, str, str, str, str]] = DEFAULT_TRAINS) -> bytes:
+    items = []
+    for idx, (train_id, depart, arrive, duration, discount) in enumerate(trains):
+        discount_html = f'<p class="early-bird"><span>{discount}</span></p>' if discount else ''
+        items.append(
+            '<label class="result-item">'
+            f'<input type="radio" name="TrainQueryDataViewPanel:TrainGroup" value="radio{idx * 2 + 18}"/>'
+            f'<span id="QueryDeparture">{depart}</span><span id="QueryArrival">{arrive}</span>'
+            f'<div class="duration"><span class="material-icons">schedule</span><span>{duration}</span></div>'
+            f'<span id="QueryCode">{train_id}</span>{discount_html}'
+            '</label>'
+        )
+    return _page(f'<form id="BookingS2Form" method="post" action="{_S2_URL}">{"".join(items)}</form>')
+
+
+def ticket_page() -> bytes:
+    return _page(
+        f'<form id="BookingS3FormSP" method="post" action="{_S3_URL}">'
+        '<input type="radio" id="memberSystemRadio1" name="TicketMemberSystemInputPanel:TakerMemberSystemDataView:'
+        'memberSystemRadioGroup" value="radio56"/>'
+        '<input type="radio" id="memberSystemRadio3" name="TicketMemberSystemInputPanel:TakerMemberSystemDataView:'
+        'memberSystemRadioGroup" value="radio60" checked="checked"/>'
+        '<input type="text" id="idNumber" name="dummyId"/><input type="text" id="mobilePhone" name="dummyPhone"/>'
+        '</form>'
+    )
+
+
+def result_page(pnr: str, train: Tuple[int, str, str, str, str], date: str) -> bytes:
+    train_id, depart, arrive, _, _ = train
+    return _page(
+        f'<p class="pnr-code">訂位代號<span>{pnr}</span></p>'
+        '<p class="payment-status"><span>未付款</span>（付款期限：<span>' + date + '</span>）</p>'
+        '<table class="table_simple"><tr><td>去程</td></tr></table>'
+        f'<span class="date"><span>{date}</span></span>'
+        f'<span id="setTrainCode0">{train_id}</span>'
+        f'<span id="setTrainDeparture0">{depart}</span><span id="setTrainArrival0">{arrive}</span>'
+        '<p class="departure-stn"><span>台北</span></p><p class="arrival-stn"><span>左營</span></p>'
+        '<div class="seat-label"><span>8車12A</span></div>'
+        '<p><span>車廂</span><span>標準車廂</span></p>'
+        '<p>票數</p><span>全票 1</span>'
+        '<span id="setTrainTotalPriceValue">TWD 1,490</span>'
+    )
+
+
+def error_page(msg: str, tail: int = 0) -> bytes:
+    return _page(_feedback([msg]) + _filler(tail))
+
+
+def captcha_png(pixels: bytes, width: int, height: int) -> bytes:
+    """Encode 8-bit grayscale `pixels` (row-major) as a PNG without any imaging library."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    raw = b''.join(b'\x00' + pixels[y * width:(y + 1) * width] for y in range(height))
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw))
+        + chunk(b'IEND', b'')
+    )
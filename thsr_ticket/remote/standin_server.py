@@ -0,0 +1,314 @@
+"""Local stand-in for irs.thsrc.com.tw.
+
+Emulates the Wicket booking state machine (booking page -> S1 -> S2 -> S3)
+so flows can be exercised and benchmarked offline:
+
+    python -m thsr_ticket.remote.standin_server --port 8080 --captcha-accept-rate 0.6
+
+and point the client at it with `HTTPRequest(base_url='http://127.0.0.1:8080')`
+or `thsr-ticket --base-url http://127.0.0.1:8080`.
+
+Pages come from a cassette recorded with `thsr_ticket.remote.capture.Recorder`
+when one is given, otherwise from the built-in templates in `standin_pages`.
+"""
+
+import argparse
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from thsr_ticket.remote import standin_pages as pages
+from thsr_ticket.remote.capture import classify, load_cassette
+
+Headers = List[Tuple[str, str]]
+Reply = Tuple[int, Headers, bytes]
+
+CAPTCHA_WIDTH = 140
+CAPTCHA_HEIGHT = 48
+MAX_SESSIONS = 4096
+
+
+@dataclass
+class StandInConfig:
+    captcha_accept_rate: float = 1.0  # probability that a submitted captcha is accepted
+    no_trains_rounds: int = 0         # answer '查無可售車次' to the first N accepted S1 submits
+    latency: float = 0.0              # seconds added to every response
+    jitter: float = 0.0               # extra uniform random latency in [0, jitter)
+    seed: Optional[int] = None
+    cassette: Optional[str] = None
+    chunk_size: int = 0               # write bodies in chunks of this many bytes (0: at once)
+    chunk_delay: float = 0.0          # seconds between chunks, i.e. a slow link
+    page_tail: int = 0                # filler bytes in booking / S1 error pages, like the real page's scripts
+
+
+@dataclass
+class _Session:
+    stage: str = 'S1'
+    train: Tuple[int, str, str, str, str] = pages.DEFAULT_TRAINS[0]
+    date: str = ''
+
+
+@dataclass
+class _Stats:
+    requests: Dict[str, int] = field(default_factory=dict)
+    captcha_accepted: int = 0
+    captcha_rejected: int = 0
+    no_trains: int = 0
+    bookings: int = 0
+
+
+class StandInApp:
+    """Transport independent request handler; see StandInServer for the HTTP/1.1 front end
+    and standin_h2.StandInH2Server for HTTP/2."""
+
+    def __init__(self, config: StandInConfig = None) -> None:
+        self.config = config or StandInConfig()
+        self.stats = _Stats()
+        self._rand = random.Random(self.config.seed)
+        self._sessions: Dict[str, _Session] = {}
+        self._lock = threading.Lock()
+        self._replay: Dict[str, bytes] = {}
+        if self.config.cassette:
+            self._load_replay(self.config.cassette)
+
+    def _load_replay(self, path: str) -> None:
+        for entry in load_cassette(path):
+            key = entry['endpoint']
+            if key == 'submit_booking_form':
+                key = _s1_outcome(entry['body'])
+            self._replay.setdefault(key, entry['body'])
+
+    def handle(self, method: str, target: str, headers: Dict[str, str], body: bytes = b'') -> Reply:
+        delay = self.config.latency + (self._rand.random() * self.config.jitter if self.config.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        parts = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        if body:
+            params.update({k: v[0] for k, v in parse_qs(body.decode('utf-8'), keep_blank_values=True).items()})
+        endpoint = classify(target) if 'wicket:interface' in target else 'booking_page'
+        with self._lock:
+            self.stats.requests[endpoint] = self.stats.requests.get(endpoint, 0) + 1
+
+        session_id = _session_id(parts.path, headers.get('Cookie', ''))
+        if endpoint == 'booking_page' and method == 'GET':
+            return self._booking_page()
+
+        with self._lock:
+            sess = self._sessions.get(session_id) if session_id else None
+        if sess is None:
+            return _html(pages.error_page(pages.EXPIRED_MSG))
+
+        if endpoint == 'security_code_img':
+            return self._captcha_img(sess)
+        if method != 'POST':
+            return 405, [('Content-Length', '0')], b''
+        if endpoint == 'submit_booking_form':
+            return self._submit_booking_form(sess, params)
+        if endpoint == 'submit_train':
+            return self._submit_train(sess, params)
+        return self._submit_ticket(sess, params)
+
+    def chunks(self, payload: bytes) -> Iterator[bytes]:
+        """Split a response body for the front end to write, pausing chunk_delay in between."""
+        size = self.config.chunk_size or len(payload) or 1
+        for start in range(0, len(payload), size):
+            if start and self.config.chunk_delay:
+                time.sleep(self.config.chunk_delay)
+            yield payload[start:start + size]
+
+    def _booking_page(self) -> Reply:
+        session_id = uuid.uuid4().hex.upper()
+        with self._lock:
+            if len(self._sessions) >= MAX_SESSIONS:
+                self._sessions.pop(next(iter(self._sessions)))
+            self._sessions[session_id] = _Session()
+        body = self._replay.get('booking_page') or pages.booking_page(
+            session_id, self._rand.randrange(10 ** 9), tail=self.config.page_tail,
+        )
+        status, headers, body = _html(body)
+        headers.append(('Set-Cookie', f'JSESSIONID={session_id}; Path=/'))
+        return status, headers, body
+
+    def _captcha_img(self, sess: _Session) -> Reply:
+        body = self._replay.get('security_code_img')
+        if body is None:
+            pixels = bytes(self._rand.randrange(180, 256) for _ in range(CAPTCHA_WIDTH * CAPTCHA_HEIGHT))
+            body = pages.captcha_png(pixels, CAPTCHA_WIDTH, CAPTCHA_HEIGHT)
+        return 200, [('Content-Type', 'image/png'), ('Content-Length', str(len(body)))], body
+
+    def _submit_booking_form(self, sess: _Session, params: Dict[str, str]) -> Reply:
+        if sess.stage != 'S1':
+            return _html(pages.error_page(pages.EXPIRED_MSG))
+        with self._lock:
+            code = params.get('homeCaptcha:securityCode', '')
+            if not code or self._rand.random() >= self.config.captcha_accept_rate:
+                self.stats.captcha_rejected += 1
+                return _html(self._replay.get('captcha_error') or pages.booking_page(
+                    '', 0, errors=[pages.CAPTCHA_ERROR_MSG], tail=self.config.page_tail,
+                ))
+            self.stats.captcha_accepted += 1
+            if self.stats.no_trains < self.config.no_trains_rounds:
+                self.stats.no_trains += 1
+                return _html(self._replay.get('no_trains') or pages.error_page(
+                    pages.NO_TRAINS_MSG, tail=self.config.page_tail,
+                ))
+        sess.stage = 'S2'
+        sess.date = params.get('toTimeInputField', '')
+        return _html(self._replay.get('trains') or pages.trains_page())
+
+    def _submit_train(self, sess: _Session, params: Dict[str, str]) -> Reply:
+        selected = params.get('TrainQueryDataViewPanel:TrainGroup', '')
+        if sess.stage != 'S2' or not selected:
+            return _html(pages.error_page(pages.EXPIRED_MSG))
+        values = [f'radio{idx * 2 + 18}' for idx in range(len(pages.DEFAULT_TRAINS))]
+        if selected in values:
+            sess.train = pages.DEFAULT_TRAINS[values.index(selected)]
+        sess.stage = 'S3'
+        return _html(self._replay.get('submit_train') or pages.ticket_page())
+
+    def _submit_ticket(self, sess: _Session, params: Dict[str, str]) -> Reply:
+        if sess.stage != 'S3' or not params.get('dummyId'):
+            return _html(pages.error_page(pages.EXPIRED_MSG))
+        sess.stage = 'done'
+        with self._lock:
+            self.stats.bookings += 1
+            pnr = f'{self.stats.bookings:08d}'
+        return _html(self._replay.get('submit_ticket') or pages.result_page(pnr, sess.train, sess.date))
+
+
+def _s1_outcome(body: bytes) -> str:
+    text = body.decode('utf-8', errors='replace')
+    if '檢測碼' in text:
+        return 'captcha_error'
+    if '查無' in text:
+        return 'no_trains'
+    return 'trains'
+
+
+def _session_id(path: str, cookie: str) -> Optional[str]:
+    if ';jsessionid=' in path:
+        return path.split(';jsessionid=', 1)[1]
+    for item in cookie.split(';'):
+        name, _, value = item.strip().partition('=')
+        if name == 'JSESSIONID':
+            return value
+    return None
+
+
+def _html(body: bytes) -> Reply:
+    return 200, [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', str(len(body)))], body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    app: StandInApp
+
+    def _dispatch(self, method: str) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, payload = self.app.handle(method, self.path, dict(self.headers.items()), body)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in self.app.chunks(payload):
+            self.wfile.write(chunk)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._dispatch('GET')
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._dispatch('POST')
+
+    def log_message(self, *args) -> None:  # type: ignore[no-untyped-def]
+        pass
+
+
+class StandInServer:
+    """HTTP/1.1 stand-in server running in a daemon thread.
+
+    with StandInServer(StandInConfig(captcha_accept_rate=0.5)) as server:
+        client = HTTPRequest(base_url=server.url)
+    """
+
+    def __init__(self, config: StandInConfig = None, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.app = StandInApp(config)
+        handler = type('StandInHandler', (_Handler,), {'app': self.app})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StandInServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='thsr-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:  # type: ignore[no-untyped-def]
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Local stand-in server for irs.thsrc.com.tw')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cassette', default=None, help='Replay pages recorded with HTTPRequest(recorder=...)')
+    parser.add_argument('--captcha-accept-rate', type=float, default=1.0)
+    parser.add_argument('--no-trains-rounds', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency upper bound (seconds)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=0, help='Send bodies in chunks of N bytes')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds between body chunks')
+    parser.add_argument('--page-tail', type=int, default=0,
+                        help='Filler bytes in the booking page and S1 errors (the real page is ~100 KB)')
+    parser.add_argument('--http2', action='store_true', help='Speak HTTP/2 (h2c, prior knowledge); needs h2')
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        captcha_accept_rate=args.captcha_accept_rate,
+        no_trains_rounds=args.no_trains_rounds,
+        latency=args.latency,
+        jitter=args.jitter,
+        seed=args.seed,
+        cassette=args.cassette,
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        page_tail=args.page_tail,
+    )
+    if args.http2:
+        from thsr_ticket.remote.standin_h2 import StandInH2Server
+        httpd = StandInH2Server(config, host=args.host, port=args.port).server
+    else:
+        httpd = StandInServer(config, host=args.host, port=args.port).httpd
+    host, port = httpd.server_address[:2]
+    print(f"THSR stand-in listening on http://{host}:{port}{' (HTTP/2)' if args.http2 else ''}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
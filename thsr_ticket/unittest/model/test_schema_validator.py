@@ -0,0 +1,72 @@
+import pytest
+import jsonschema
+
+from thsr_ticket.configs.web.param_schema import CONFIRM_TRAIN_SCHEMA
+from thsr_ticket.model.web import schema_validator
+from thsr_ticket.model.web.confirm_train import ConfirmTrain
+
+VALID = {"BookingS2Form:hf:0": "", "TrainQueryDataViewPanel:TrainGroup": "radio21"}
+INVALID = {"BookingS2Form:hf:0": "", "unknown": 1}
+
+
+@pytest.fixture(params=[True, False], ids=['fastjsonschema', 'jsonschema'])
+def fresh_cache(request, monkeypatch):
+    if request.param and schema_validator.fastjsonschema is None:
+        pytest.skip('fastjsonschema not installed')
+    if not request.param:
+        monkeypatch.setattr(schema_validator, 'fastjsonschema', None)
+    monkeypatch.setattr(schema_validator, '_CACHE', {})
+
+
+def test_validate(fresh_cache):
+    schema_validator.validate(VALID, schema=CONFIRM_TRAIN_SCHEMA)
+    with pytest.raises(jsonschema.exceptions.ValidationError):
+        schema_validator.validate(INVALID, schema=CONFIRM_TRAIN_SCHEMA)
+
+
+def test_fast_only_rejection_is_validation_error(monkeypatch):
+    fastjsonschema = pytest.importorskip('fastjsonschema')
+
+    def reject(params):
+        raise fastjsonschema.JsonSchemaException('data must be rejected')
+
+    monkeypatch.setattr(fastjsonschema, 'compile', lambda schema: reject)
+    monkeypatch.setattr(schema_validator, '_CACHE', {})
+    with pytest.raises(jsonschema.exceptions.ValidationError, match='must be rejected'):
+        schema_validator.validate(VALID, schema=CONFIRM_TRAIN_SCHEMA)
+
+
+def test_compiled_once(fresh_cache):
+    first = schema_validator.compiled_validator(CONFIRM_TRAIN_SCHEMA)
+    assert schema_validator.compiled_validator(CONFIRM_TRAIN_SCHEMA) is first
+
+
+def test_skip_unchanged(monkeypatch):
+    calls = []
+    monkeypatch.setattr('thsr_ticket.model.web.abstract_params.validate', lambda p, schema: calls.append(p))
+
+    train = ConfirmTrain()
+    train.selection = "radio21"
+    train.get_params()
+    train.get_params()
+    assert len(calls) == 1
+
+    train.selection = "radio23"
+    train.get_params()
+    assert len(calls) == 2
+
+    train.cache_validation = False
+    train.get_params()
+    assert len(calls) == 3
+
+
+def test_skip_is_type_aware(monkeypatch):
+    calls = []
+    monkeypatch.setattr('thsr_ticket.model.web.abstract_params.validate', lambda p, schema: calls.append(p))
+
+    train = ConfirmTrain()
+    train._validate({'x': True}, CONFIRM_TRAIN_SCHEMA)
+    train._validate({'x': 1}, CONFIRM_TRAIN_SCHEMA)
+    train._validate({'x': 0}, CONFIRM_TRAIN_SCHEMA)
+    train._validate({'x': False}, CONFIRM_TRAIN_SCHEMA)
+    assert len(calls) == 4
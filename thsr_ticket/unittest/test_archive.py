@@ -0,0 +1,92 @@
+import threading
+
+from thsr_ticket.metrics import CAPTCHA_ARCHIVE_DROPPED, CAPTCHA_ARCHIVE_FSYNC_ERRORS
+from thsr_ticket.ml.train import archive
+from thsr_ticket.ml.train.archive import CaptchaArchiver
+from thsr_ticket.ml.train.manifest import RawManifest
+
+
+class BlockingManifest(RawManifest):
+    """Holds the writer thread inside add() until released."""
+
+    def __init__(self, raw_dir):
+        super().__init__(raw_dir)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def add(self, *args, **kwargs):
+        self.entered.set()
+        self.release.wait(5)
+        return super().add(*args, **kwargs)
+
+
+def test_archives_in_background(tmp_path):
+    manifest = RawManifest(str(tmp_path))
+    archiver = CaptchaArchiver(manifest)
+    assert archiver.submit(b'img-a', source='booking')
+    assert archiver.submit(b'img-b', label='A2C4', source='booking', verified=True)
+    archiver.flush()
+
+    assert [label for _, label in manifest.labeled()] == ['A2C4']
+    assert len(list(tmp_path.glob('*.png'))) == 2
+    archiver.close()
+    assert archiver.submit(b'img-c')  # restarts the writer
+    archiver.close()
+    assert len(RawManifest(str(tmp_path))) == 3
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    manifest = BlockingManifest(str(tmp_path))
+    archiver = CaptchaArchiver(manifest, maxsize=1, fsync=False)
+    dropped = CAPTCHA_ARCHIVE_DROPPED.get()
+
+    assert archiver.submit(b'img-a')
+    assert manifest.entered.wait(5)        # writer is busy with img-a
+    assert archiver.submit(b'img-b')       # fills the queue
+    assert not archiver.submit(b'img-c')   # dropped, returns at once
+    assert CAPTCHA_ARCHIVE_DROPPED.get() == dropped + 1
+
+    manifest.release.set()
+    archiver.close()
+    assert len(list(tmp_path.glob('*.png'))) == 2
+
+
+def test_fsync_error_keeps_writer_running(tmp_path, monkeypatch):
+    def failing_fsync(path):
+        raise OSError(28, 'No space left on device')
+
+    manifest = RawManifest(str(tmp_path))
+    archiver = CaptchaArchiver(manifest)
+    errors = CAPTCHA_ARCHIVE_FSYNC_ERRORS.get()
+
+    monkeypatch.setattr(archive, '_fsync', failing_fsync)
+    assert archiver.submit(b'img-a')
+    archiver.flush()
+    assert CAPTCHA_ARCHIVE_FSYNC_ERRORS.get() == errors + 1
+
+    monkeypatch.undo()
+    assert archiver.submit(b'img-b')
+    archiver.flush()
+    assert archiver._thread.is_alive()
+    assert len(RawManifest(str(tmp_path))) == 2
+    archiver.close()
+
+
+def test_corrupt_manifest_line_keeps_writer_running(tmp_path):
+    manifest = RawManifest(str(tmp_path))
+    archiver = CaptchaArchiver(manifest, fsync=False)
+    assert archiver.submit(b'img-a')
+    archiver.flush()
+    dropped = CAPTCHA_ARCHIVE_DROPPED.get()
+
+    with open(manifest.path, 'ab') as f:
+        f.write(b'{"seq": 2, "file": \n')
+    assert archiver.submit(b'img-b')  # its refresh hits the corrupt line
+    archiver.flush()
+    assert CAPTCHA_ARCHIVE_DROPPED.get() == dropped + 1
+
+    assert archiver.submit(b'img-c')
+    archiver.flush()
+    assert archiver._thread.is_alive()
+    assert len(list(tmp_path.glob('*.png'))) == 2
+    archiver.close()
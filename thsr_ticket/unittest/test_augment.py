@@ -0,0 +1,45 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from thsr_ticket.ml.train.augment import BatchAugment  # noqa: E402
+
+
+@pytest.fixture
+def batch():
+    torch.manual_seed(0)
+    return (torch.rand(8, 48, 140, 3) > 0.7).float()
+
+
+def test_disabled_is_identity(batch):
+    aug = BatchAugment(max_rotate=0, max_scale=0, max_shift=0, arc_prob=0, sp_prob=0)
+    assert torch.equal(aug(batch), batch)
+
+
+def test_affine_identity_when_no_jitter(batch):
+    aug = BatchAugment(max_rotate=0, max_scale=0, max_shift=0)
+    assert torch.allclose(aug.affine(batch), batch, atol=1e-5)
+
+
+def test_shift_exposes_background(batch):
+    aug = BatchAugment(max_rotate=0, max_scale=0, max_shift=0.2, background=1.0)
+    out = aug.affine(torch.zeros_like(batch))
+    assert out.shape == batch.shape
+    assert (out == 1.0).any() and (out == 0.0).any()
+
+
+def test_salt_and_pepper_fraction(batch):
+    aug = BatchAugment(sp_prob=0.1, generator=torch.Generator().manual_seed(1))
+    flat = torch.full((16, 48, 140, 1), 0.5)
+    out = aug.salt_and_pepper(flat)
+    changed = (out != 0.5).float().mean().item()
+    assert 0.08 < changed < 0.12
+    assert set(out.unique().tolist()) == {0.0, 0.5, 1.0}
+
+
+def test_arcs_flip_a_band(batch):
+    aug = BatchAugment(arc_prob=1.0, arc_width=3, generator=torch.Generator().manual_seed(2))
+    out = aug.arcs(torch.zeros(4, 48, 140, 1))
+    per_column = out.sum(dim=1)  # [4, 140, 1]
+    assert ((per_column >= 0) & (per_column <= 3)).all()
+    assert (per_column.sum(dim=1) > 100).all()
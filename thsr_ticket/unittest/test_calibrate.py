@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from thsr_ticket.ml import captcha_solver as cs
+from thsr_ticket.ml.train import calibrate as cal
+
+COSTS = cal.Costs(fetch=1.0, submit=0.5, retry_delay=1.0, solve=0.05)
+
+
+def test_expected_seconds():
+    confidences = np.array([[0.9] * 4, [0.9] * 4, [0.5] * 4, [0.5] * 4])
+    correct = np.array([True, False, True, True])
+    # accepted 1/2, success 1/4, wrong 1/4
+    expected = (1.0 + 0.05 + 0.5 * 0.5 + 0.25 * 1.0) / 0.25
+    assert cal.expected_seconds(confidences, correct, [0.8] * 4, COSTS) == pytest.approx(expected)
+    assert cal.expected_seconds(confidences, correct, [0.95] * 4, COSTS) == float('inf')
+
+
+def test_optimise_lowers_threshold_of_reliable_position():
+    rng = np.random.default_rng(0)
+    confidences = rng.uniform(0.9, 1.0, size=(200, 4))
+    confidences[:, 2] = rng.uniform(0.4, 0.7, size=200)  # under-confident but always right
+    correct = np.ones(200, dtype=bool)
+    thresholds, seconds = cal.optimise(confidences, correct, COSTS, [0.8] * 4)
+    assert thresholds[2] <= 0.4
+    assert seconds == pytest.approx(COSTS.fetch + COSTS.solve + COSTS.submit)
+
+
+def test_optimise_keeps_threshold_that_rejects_wrong_answers():
+    confidences = np.full((100, 4), 0.95)
+    confidences[:50, 0] = 0.6
+    correct = np.arange(100) >= 50  # the low-confidence half is always wrong
+    costs = COSTS._replace(retry_delay=5.0)
+    thresholds, _ = cal.optimise(confidences, correct, costs, [0.8] * 4)
+    assert thresholds[0] > 0.6
+
+
+def test_solver_loads_thresholds_for_matching_model(tmp_path):
+    model = tmp_path / 'thsrc_captcha.onnx'
+    model.write_bytes(b'model v1')
+    result = {'calibrated': {'thresholds': [0.5, 0.6, 0.7, 0.4]}}
+    assert cal.save(str(model), result) == str(tmp_path / 'thsrc_captcha.thresholds.json')
+    assert cs._load_thresholds(str(model)) == (0.5, 0.6, 0.7, 0.4)
+
+    model.write_bytes(b'model v2')  # replaced by a new training run
+    assert cs._load_thresholds(str(model)) == (cs.MIN_CONFIDENCE,) * 4
+
+
+def test_decode_uses_per_position_thresholds():
+    probs = np.full((4, len(cs.ALLOWED_CHARS)), 0.01, np.float32)
+    probs[:, 0] = [0.9, 0.9, 0.6, 0.9]
+    with pytest.raises(cs.LowConfidenceError):
+        cs._decode(probs)
+    assert cs._decode(probs, (0.8, 0.8, 0.5, 0.8)) == cs.ALLOWED_CHARS[0] * 4
@@ -0,0 +1,89 @@
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+from thsr_ticket.ml import captcha_solver as cs
+from thsr_ticket.ml import image_process as ip
+
+
+@pytest.fixture(scope='module')
+def captcha():
+    from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+
+    random.seed(3)
+    np.random.seed(3)
+    img, chars = GenerateCaptcha().generate()
+    img_bgr = cv2.cvtColor(cv2.resize(np.array(img), (cs.WIDTH, cs.HEIGHT)), cv2.COLOR_GRAY2BGR)
+    ok, buf = cv2.imencode('.png', img_bgr)
+    return img_bgr, buf.tobytes()
+
+
+@pytest.fixture(scope='module')
+def char_model(tmp_path_factory):
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('onnx')
+    from thsr_ticket.ml.train.char_model import CharCNN
+    from thsr_ticket.ml.train.train_chars import export_char_model
+
+    torch.manual_seed(0)
+    path = str(tmp_path_factory.mktemp('model') / 'thsrc_char.onnx')
+    export_char_model(CharCNN(), path)
+    return path
+
+
+def test_extract_left_to_right(captcha):
+    img_bgr, _ = captcha
+    regions, letters = ip.extract(img_bgr)
+    assert len(regions) == len(letters) == 4
+    xs = [x for x, _, _, _ in regions]
+    assert xs == sorted(xs)
+
+
+def test_segment_shape(captcha):
+    img_bgr, _ = captcha
+    glyphs = ip.segment(img_bgr)
+    assert glyphs.shape == (4, 24, 24)
+    assert glyphs.dtype == np.uint8
+
+
+def test_segment_blank_image():
+    assert ip.segment(np.full((cs.HEIGHT, cs.WIDTH, 3), 255, np.uint8)) is None
+
+
+def test_char_mode(captcha, char_model, monkeypatch):
+    _, img_bytes = captcha
+    monkeypatch.setattr(cs, 'CHAR_MODEL_PATH', char_model)
+    monkeypatch.setattr(cs, '_models', {})
+    try:
+        result = cs.solve(img_bytes, mode='char')
+    except cs.LowConfidenceError:
+        return  # untrained model
+    assert len(result) == 4 and set(result) <= set(cs.ALLOWED_CHARS)
+
+
+def test_char_mode_falls_back_to_cnn(captcha, monkeypatch):
+    _, img_bytes = captcha
+    monkeypatch.setattr(ip, 'segment', lambda *args, **kwargs: None)
+    one_hot = np.eye(len(cs.ALLOWED_CHARS), dtype=np.float32)[[cs.ALLOWED_CHARS.index(c) for c in 'AC2D']]
+    monkeypatch.setattr(cs, '_models', {'cnn': cs.LoadedModel(None, cs.MODEL_PATH, 'test', (), (0.8,) * 4)})
+    monkeypatch.setattr(cs, '_watch', lambda mode, model: None)
+    monkeypatch.setattr(cs, '_probs', lambda img, session=None: one_hot)
+    monkeypatch.setattr(cs, '_char_probs', lambda glyphs, session=None: pytest.fail('char model used'))
+    assert cs.predict(img_bytes, mode='char').mode == 'cnn'
+    assert cs.solve(img_bytes, mode='char') == 'AC2D'
+
+
+def test_missing_char_model_falls_back_at_startup(tmp_path, monkeypatch):
+    from thsr_ticket.main import _check_solver_model
+
+    cnn = tmp_path / 'thsrc_captcha.onnx'
+    cnn.write_bytes(b'')
+    monkeypatch.setattr(cs, 'MODEL_PATH', str(cnn))
+    monkeypatch.setattr(cs, 'CHAR_MODEL_PATH', str(tmp_path / 'thsrc_char.onnx'))
+    assert _check_solver_model('char') == 'cnn'
+
+    cnn.unlink()
+    with pytest.raises(SystemExit):
+        _check_solver_model('cnn')
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from thsr_ticket.ml import captcha_solver as cs
+from thsr_ticket.ml.train import evaluate as ev
+
+TIMINGS = {'decode': 0.001, 'preprocess': 0.01, 'inference': 0.002}
+
+
+def _prediction(text, confidence=0.9):
+    probs = np.full((4, len(cs.ALLOWED_CHARS)), (1 - confidence) / (len(cs.ALLOWED_CHARS) - 1), np.float32)
+    for i, c in enumerate(text):
+        probs[i, cs.ALLOWED_CHARS.index(c)] = confidence
+    return cs.Prediction(probs, 'cnn', TIMINGS)
+
+
+def test_summarize_accuracy_and_confusion():
+    report = ev.summarize(
+        ['AC2D', 'AC2D', '3456'],
+        [_prediction('AC2D'), _prediction('AC2Z'), _prediction('3456', confidence=0.5)],
+    )
+    assert report['accuracy'] == pytest.approx(2 / 3, abs=1e-4)
+    assert report['position_accuracy'] == [1.0, 1.0, 1.0, pytest.approx(2 / 3, abs=1e-4)]
+    assert report['confusion']['top_errors'] == [('D', 'Z', 1)]
+    matrix = np.array(report['confusion']['matrix'])
+    assert matrix.sum() == 12 and np.trace(matrix) == 11
+    assert report['modes'] == {'cnn': 3, 'char': 0}
+    assert report['latency_ms']['total']['p50'] == pytest.approx(13.0)
+
+
+def test_calibration_at_min_confidence():
+    report = ev.summarize(
+        ['AC2D', 'AC2D', '3456', '3456'],
+        [_prediction('AC2D'), _prediction('AC2Z'), _prediction('3456', 0.5), _prediction('3457', 0.5)],
+    )
+    at_threshold = report['calibration']['min_confidence']
+    assert at_threshold['threshold'] == cs.MIN_CONFIDENCE
+    assert at_threshold['accepted'] == 0.5
+    assert at_threshold['accepted_accuracy'] == 0.5
+    assert at_threshold['rejected_but_correct'] == 0.5
+    assert sum(b['count'] for b in report['calibration']['bins']) == 16
+
+
+def test_evaluate_skips_unreadable(tmp_path, monkeypatch):
+    model = tmp_path / 'model.onnx'
+    model.write_bytes(b'onnx')
+    bad = tmp_path / '00001_AC2D_x.png'
+    bad.write_bytes(b'not an image')
+    monkeypatch.setattr(cs, 'MODEL_PATH', str(model))
+    monkeypatch.setattr(cs, '_get_session', lambda: None)
+
+    report = ev.evaluate([(str(bad), 'AC2D')])
+    assert report['samples'] == 0
+    assert len(report['unreadable']) == 1
+    assert 'accuracy' not in report
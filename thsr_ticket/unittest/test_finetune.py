@@ -0,0 +1,52 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnx')
+
+from thsr_ticket.ml.train.finetune import IncrementalTrainer  # noqa: E402
+
+
+def _write_samples(raw, start: int, count: int) -> None:
+    rng = np.random.default_rng(start)
+    for i in range(start, start + count):
+        img = rng.integers(0, 256, (48, 140, 3), dtype=np.uint8)
+        cv2.imwrite(str(raw / f'{i:05d}_A2C4_x.png'), img)
+
+
+def _trainer(tmp_path) -> IncrementalTrainer:
+    return IncrementalTrainer(
+        checkpoint=str(tmp_path / 'captcha_cnn.pt'),
+        onnx_path=str(tmp_path / 'captcha.onnx'),
+        data_dir=str(tmp_path / 'raw'),
+        cache_dir=str(tmp_path / 'cache'),
+        batch_size=4,
+        device=torch.device('cpu'),
+    )
+
+
+def test_finetune_new_samples_then_publish(tmp_path):
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    _write_samples(raw, 0, 6)
+
+    trainer = _trainer(tmp_path)
+    result = trainer.finetune(epochs=1)
+    assert result['new'] == 6 and result['replay'] == 0
+    trainer.publish()
+    assert os.path.exists(tmp_path / 'captcha.onnx')
+    assert not os.path.exists(tmp_path / 'captcha.onnx.tmp')
+    with open(tmp_path / 'captcha_cnn.pt.json') as f:
+        assert len(json.load(f)['samples']) == 6
+
+    # Nothing new in the same process
+    assert trainer.finetune(epochs=1) is None
+
+    # A fresh process only trains on the two new files plus replay
+    _write_samples(raw, 6, 2)
+    result = _trainer(tmp_path).finetune(epochs=1)
+    assert result['new'] == 2 and result['replay'] == 6
@@ -0,0 +1,67 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+import requests
+
+from thsr_ticket.configs.web.param_schema import BookingModel, ConfirmTicketModel, ConfirmTrainModel
+from thsr_ticket.remote.form_encoder import BOOKING_FORM, CONFIRM_TICKET_FORM, CONFIRM_TRAIN_FORM
+
+URL = 'https://irs.thsrc.com.tw/IMINT/'
+
+
+def _booking(code: str = 'A2C4', **kwargs) -> BookingModel:
+    fields = dict(
+        start_station=2,
+        dest_station=12,
+        outbound_date=(date.today() + timedelta(days=1)).strftime('%Y/%m/%d'),
+        outbound_time='1000A',
+        seat_prefer='radio17',
+        types_of_trip=0,
+        search_by='radio31',
+        security_code=code,
+    )
+    fields.update(kwargs)
+    return BookingModel(**fields)
+
+
+def _requests_url(params) -> str:
+    return requests.Request('POST', URL, params=params).prepare().url
+
+
+@pytest.mark.parametrize('encoder,model', [
+    (BOOKING_FORM, _booking()),
+    (CONFIRM_TRAIN_FORM, ConfirmTrainModel(selected_train='radio18')),
+    (CONFIRM_TICKET_FORM, ConfirmTicketModel(personal_id='A123456789', phone_num='', member_radio='radio60')),
+])
+def test_matches_json_round_trip(encoder, model):
+    expected = json.loads(model.json(by_alias=True))
+    assert encoder.to_dict(model) == expected
+    assert _requests_url(encoder.encode(model)) == _requests_url(expected)
+
+
+def test_template_reused_between_captchas():
+    first = BOOKING_FORM.template(_booking('AAAA'))
+    assert BOOKING_FORM.template(_booking('ZZZZ')) is first
+    assert BOOKING_FORM.template(_booking('ZZZZ', dest_station=7)) is not first
+
+    params = BOOKING_FORM.encode(_booking('ZZZZ'))
+    assert 'homeCaptcha%3AsecurityCode=ZZZZ' in params
+    assert 'AAAA' not in params
+
+
+def test_extra_params():
+    model = ConfirmTicketModel(personal_id='A123456789', phone_num='0912345678', member_radio='radio56')
+    extra = {'TicketMemberSystemInputPanel:TakerMemberSystemDataView:memberSystemRadioGroup:memberShipNumber': 'X'}
+    expected = {**json.loads(model.json(by_alias=True)), **extra}
+    assert _requests_url(CONFIRM_TICKET_FORM.encode(model, extra)) == _requests_url(expected)
+
+
+def test_extra_params_override_model_fields():
+    model = ConfirmTicketModel(personal_id='A123456789', phone_num='0912345678', member_radio='radio56')
+    phone_alias = ConfirmTicketModel.__fields__['phone_num'].alias
+    extra = {phone_alias: '0987654321'}
+    expected = {**json.loads(model.json(by_alias=True)), **extra}
+    params = CONFIRM_TICKET_FORM.encode(model, extra)
+    assert _requests_url(params) == _requests_url(expected)
+    assert params.count('0912345678') == 0 and params.count('0987654321') == 1
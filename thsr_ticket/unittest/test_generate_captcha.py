@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from PIL import Image
+from PIL.ImageDraw import Draw
+
+from thsr_ticket.ml import generate_captcha
+from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+from thsr_ticket.ml.train.config import ALLOWED_CHARS, HEIGHT, WIDTH
+
+
+def test_generate_batch_into_buffer():
+    gen = GenerateCaptcha()
+    out = np.zeros((5, HEIGHT, WIDTH), dtype=np.uint8)
+    images, labels = gen.generate_batch(5, out)
+
+    assert images is out
+    assert len(labels) == 5
+    assert all(len(label) == 4 and set(label) <= set(ALLOWED_CHARS) for label in labels)
+    # every captcha has dark text/arc pixels and a light background
+    assert ((out < 100).mean(axis=(1, 2)) > 0.05).all()
+    assert ((out > 150).mean(axis=(1, 2)) > 0.3).all()
+
+
+def test_generate_batch_seeded():
+    np.random.seed(3)
+    a, la = GenerateCaptcha().generate_batch(3)
+    np.random.seed(3)
+    b, lb = GenerateCaptcha().generate_batch(3)
+    assert la == lb and np.array_equal(a, b)
+
+
+def test_glyph_atlas_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_captcha, '_ATLASES', {})
+    path = str(tmp_path / 'atlas.npz')
+    built = generate_captcha.glyph_atlas(50, path)
+
+    monkeypatch.setattr(generate_captcha, '_ATLASES', {})
+    monkeypatch.setattr(generate_captcha, 'load_font', None)  # must not render again
+    loaded = generate_captcha.glyph_atlas(50, path)
+    assert loaded is not built
+    assert loaded.bboxes == built.bboxes
+    for c in ALLOWED_CHARS:
+        assert np.array_equal(loaded.rasters[c], built.rasters[c])
+
+    monkeypatch.setattr(generate_captcha, '_ATLASES', {})
+    with pytest.raises(ValueError):
+        generate_captcha.glyph_atlas(40, path)
+
+
+def test_atlas_glyph_matches_font_rendering():
+    font = generate_captcha.load_font(50)
+    atlas = generate_captcha.glyph_atlas(50)
+    side = 50 - 6
+    for c, dx, dy in [('A', 0, 0), ('T', 3, 2), ('Y', 6, 6)]:  # T and Y have a negative left bearing
+        im = Image.new('L', (side + dx, side + dy), color=255)
+        Draw(im).text((dx, dy), c, font=font, fill=0)
+        assert np.array_equal(atlas.glyph(c, dx, dy), np.asarray(im))
@@ -0,0 +1,63 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from thsr_ticket.remote import http2_session
+from thsr_ticket.remote.capture import Recorder
+from thsr_ticket.remote.http_request import HTTPOptions, HTTPRequest, SharedPool
+from thsr_ticket.remote.standin_server import StandInConfig
+
+pytest.importorskip('httpx')
+pytest.importorskip('h2')
+
+
+@pytest.fixture
+def server():
+    from thsr_ticket.remote.standin_h2 import StandInH2Server
+
+    with StandInH2Server(StandInConfig(seed=0)) as srv:
+        yield srv
+
+
+def test_session_keeps_jsessionid_and_recorder(server, tmp_path):
+    cassette = str(tmp_path / 'h2.jsonl')
+    client = HTTPRequest(base_url=server.url, recorder=Recorder(cassette), options=HTTPOptions(http2=True))
+    page = client.request_booking_page()
+    assert page.status_code == 200 and page.encoding == 'utf-8'
+    img = client.request_security_code_img(page.content)
+    assert img.content.startswith(b'\x89PNG')
+
+    session_id = client.sess.cookies['JSESSIONID']
+    resp = client.submit_booking_form({'homeCaptcha:securityCode': 'A2C4', 'toTimeInputField': '2026/03/01'})
+    assert f';jsessionid={session_id}?' in resp.request.url
+    assert server.app.stats.captcha_accepted == 1
+    client.close()
+
+    with open(cassette) as f:
+        endpoints = [json.loads(line)['endpoint'] for line in f]
+    assert endpoints == ['booking_page', 'security_code_img', 'submit_booking_form']
+
+
+def test_shared_pool_multiplexes_one_connection(server):
+    pool = SharedPool(HTTPOptions(pool_maxsize=1, http2=True))
+    assert pool.adapter is None
+
+    def session(_):
+        client = HTTPRequest(base_url=server.url, pool=pool)
+        page = client.request_booking_page()
+        client.request_security_code_img(page.content)
+        client.close()
+        return client.sess.cookies['JSESSIONID']
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        session_ids = list(executor.map(session, range(8)))
+    assert len(set(session_ids)) == 8
+    assert len(pool.h2_transports.mounts['http://']._pool.connections) == 1
+    pool.close()
+
+
+def test_missing_httpx(monkeypatch):
+    monkeypatch.setattr(http2_session, 'httpx', None)
+    with pytest.raises(RuntimeError, match='http2'):
+        HTTPRequest(options=HTTPOptions(http2=True))
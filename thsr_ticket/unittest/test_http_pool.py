@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from thsr_ticket.remote.http_request import DEFAULT_TIMEOUTS, HTTPOptions, HTTPRequest, SharedPool
+from thsr_ticket.remote.standin_server import StandInConfig, StandInServer
+
+
+@pytest.fixture
+def server():
+    with StandInServer(StandInConfig(seed=0)) as srv:
+        yield srv
+
+
+def test_timeouts_per_endpoint():
+    options = HTTPOptions(timeouts={'submit_ticket': (1, 60)})
+    assert options.timeout('submit_ticket') == (1, 60)
+    assert options.timeout('booking_page') == DEFAULT_TIMEOUTS['booking_page']
+
+
+def test_retry_is_status_aware_but_never_resends_posts():
+    retry = HTTPOptions(retries=2, backoff_factor=0.1).retry()
+    assert retry.total == 2 and retry.backoff_factor == 0.1
+    assert retry.is_retry('GET', 503) and not retry.is_retry('GET', 404)
+    assert not retry.is_retry('POST', 503)
+
+
+def test_keep_alive_header():
+    assert HTTPRequest().common_head_html['Connection'] == 'keep-alive'
+    assert HTTPRequest(options=HTTPOptions(keep_alive=False)).common_head_html['Connection'] == 'close'
+
+
+def test_shared_pool_bounds_connections_and_keeps_cookies_apart(server):
+    pool = SharedPool(HTTPOptions(pool_maxsize=2))
+    assert pool.options.pool_block
+
+    def session(_):
+        client = HTTPRequest(base_url=server.url, pool=pool)
+        page = client.request_booking_page()
+        client.request_security_code_img(page.content)
+        client.close()
+        return client.sess.cookies['JSESSIONID']
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        session_ids = list(executor.map(session, range(12)))
+    assert len(set(session_ids)) == 12
+
+    (conn_pool,) = pool.adapter.poolmanager.pools._container.values()
+    assert conn_pool.num_connections <= 2
+    pool.close()
@@ -0,0 +1,95 @@
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+from thsr_ticket.ml import image_process as ip
+
+
+def _find_bound_loop(img, sy, ey, up_b=3):
+    # The per-column implementation _find_bound replaced
+    y = list(ip.linear_func(sy, ey, img.shape[1]))
+    low_b = -2
+    impt = 0.9
+    for i in range(1, img.shape[1]):
+        y_center = np.round(impt*y[i-1] + (1-impt)*y[i]).astype('int')
+        rr = range(y_center+low_b, y_center+up_b)
+        chunk = np.average(img[rr, i], axis=1)
+        diff = [abs(chunk[k]-chunk[k-1]) for k in range(1, len(chunk))]
+        max_idx = diff.index(max(diff)) if max(diff) > 50 else -low_b
+        y[i] = min(y[i], max_idx + rr[0])
+    return y
+
+
+def _adjust_line_loop(img, y):
+    yy = y.copy()
+    for i in range(len(y)):
+        for ii in range(1, 3):
+            if abs(np.average(img[yy[i]+ii, i]) - np.average(img[yy[i], i])) > 150:
+                yy[i] = yy[i]+ii
+                break
+    return yy
+
+
+@pytest.fixture(scope='module')
+def captchas():
+    from thsr_ticket.ml.generate_captcha import GenerateCaptcha
+
+    random.seed(0)
+    np.random.seed(0)
+    generator = GenerateCaptcha()
+    out = []
+    for _ in range(10):
+        img, _ = generator.generate()
+        bgr = cv2.cvtColor(cv2.resize(np.array(img), (140, 48)), cv2.COLOR_GRAY2BGR)
+        dst = cv2.fastNlMeansDenoisingColored(bgr, None, 30, 30, 7, 21)
+        out.append(dst)
+    return out
+
+
+def test_vectorized_matches_loops(captchas):
+    for dst in captchas:
+        sy, ey = ip.find_start_end(dst)
+        fdst = np.where(dst < 150, 0, dst)
+        for up_b in range(1, 4):
+            try:
+                expected = _find_bound_loop(fdst, sy, ey, up_b)
+            except IndexError:
+                continue  # window ran off the image: the loop version crashed here
+            assert ip._find_bound(fdst, sy, ey, up_b).tolist() == expected
+
+        y = ip.find_bound(fdst, sy, ey)
+        gray = cv2.cvtColor(dst, cv2.COLOR_BGR2GRAY)
+        assert ip.adjust_line(fdst, y).tolist() == _adjust_line_loop(fdst, y).tolist()
+        assert ip.adjust_line(gray, y - 4).tolist() == _adjust_line_loop(gray, y - 4).tolist()
+
+
+def test_invert_rows_matches_slices():
+    img = np.random.default_rng(0).integers(0, 256, (48, 20), dtype=np.uint8)
+    top = np.array([-3, 0, 5, 40, -50] * 4)
+    bottom = np.array([2, 10, 5, 60, 3] * 4)
+    expected = img.copy()
+    for i in range(img.shape[1]):
+        expected[top[i]:bottom[i], i] = 255 - expected[top[i]:bottom[i], i]
+    assert np.array_equal(ip._invert_rows(img, top, bottom), expected)
+
+
+def test_ridge_closed_form():
+    rx = np.arange(140.0)
+    x = np.column_stack([rx, rx ** 2])
+    y = 20 + 0.1 * rx - 0.0005 * rx ** 2 + np.random.default_rng(0).normal(0, 1, 140)
+
+    # Ridge with an unpenalised intercept == least squares on the centred, augmented system
+    xc = x - x.mean(axis=0)
+    w = np.linalg.lstsq(np.vstack([xc, np.eye(2)]), np.concatenate([y - y.mean(), [0, 0]]), rcond=None)[0]
+    assert np.allclose(ip.ridge_fit_predict(x, y), xc @ w + y.mean())
+
+
+def test_legacy_strategy_layout(captchas):
+    pytest.importorskip('onnxruntime')
+    from thsr_ticket.ml import captcha_solver
+
+    out = captcha_solver.PREPROCESSORS['legacy'](captchas[0])
+    assert out.shape == (captcha_solver.HEIGHT, captcha_solver.WIDTH) and out.dtype == np.uint8
+    assert set(np.unique(out)) <= {0, 255}
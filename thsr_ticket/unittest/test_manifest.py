@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+from thsr_ticket.ml.train.manifest import MANIFEST_FILE, RawManifest, manifest_for
+
+
+@pytest.fixture
+def raw(tmp_path):
+    d = tmp_path / 'raw'
+    d.mkdir()
+    return d
+
+
+def _lines(raw):
+    return [json.loads(line) for line in (raw / MANIFEST_FILE).read_text().splitlines()]
+
+
+def test_add_numbers_and_dedups(raw):
+    m = RawManifest(str(raw))
+    a = m.add(b'img-a', source='booking')
+    b = m.add(b'img-b', label='A2C4', source='booking', verified=True)
+    assert os.path.basename(a).startswith('00001_captcha_')
+    assert os.path.basename(b).startswith('00002_A2C4_')
+    assert m.next_seq == 3
+
+    # Same bytes again: nothing written, same file returned
+    assert m.add(b'img-b') == b
+    # An unlabeled duplicate that is now accepted gets relabeled in place
+    relabeled = m.add(b'img-a', label='ZZ99', verified=True)
+    assert os.path.basename(relabeled).startswith('00001_ZZ99_')
+    assert sorted(p.name for p in raw.glob('*.png')) == sorted([os.path.basename(relabeled), os.path.basename(b)])
+
+    fresh = RawManifest(str(raw))
+    assert fresh.next_seq == 3
+    assert fresh.labeled() == [(relabeled, 'ZZ99'), (b, 'A2C4')]
+    assert fresh.entries[1]['verified'] and fresh.entries[1]['source'] == 'booking'
+
+
+def test_sees_appends_from_other_instance(raw):
+    first, second = RawManifest(str(raw)), RawManifest(str(raw))
+    first.add(b'img-a')
+    assert second.add(b'img-b').endswith('.png')
+    assert second.next_seq == 3 and len(second) == 2
+
+
+def test_reconciles_files_added_by_hand(raw):
+    m = RawManifest(str(raw))
+    m.add(b'img-a', source='incremental', verified=True, label='A2C4')
+    (raw / '00007_QQ99_abc.png').write_bytes(b'copied')
+    os.utime(raw, ns=(os.stat(raw / MANIFEST_FILE).st_mtime_ns + 1,) * 2)
+
+    assert [label for _, label in m.labeled()] == ['A2C4', 'QQ99']
+    assert m.next_seq == 8
+    by_file = {e['file']: e for e in _lines(raw)}
+    assert by_file['00007_QQ99_abc.png']['source'] == 'disk'
+    assert any(e['source'] == 'incremental' and e['verified'] for e in by_file.values())
+
+
+def test_reconcile_without_manifest(raw):
+    (raw / '00003_captcha_abc.png').write_bytes(b'x')
+    (raw / '00004_A2C4_def.png').write_bytes(b'y')
+    (raw / 'notes.txt').write_text('ignored')
+
+    m = manifest_for(str(raw))
+    assert m.next_seq == 5
+    assert [e['file'] for e in m.unlabeled()] == ['00003_captcha_abc.png']
+    assert m.relabel(3, 'ZZ99').endswith('00003_ZZ99_abc.png')
+    assert manifest_for(str(raw)) is m
+    assert len(_lines(raw)) == 3
@@ -0,0 +1,67 @@
+import urllib.request
+
+import pytest
+
+from thsr_ticket.metrics import Counter, Gauge, Histogram, Registry, start_metrics_server
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_render(registry):
+    status = registry.register(Counter('thsr_test_status', 'Statuses.', ['status']))
+    status.inc(status='success')
+    status.inc(2, status='no_trains')
+
+    text = registry.render().decode()
+    assert '# TYPE thsr_test_status counter' in text
+    assert 'thsr_test_status_total{status="no_trains"} 2.0' in text
+    assert 'thsr_test_status_total{status="success"} 1.0' in text
+    assert text.endswith('# EOF\n')
+
+    with pytest.raises(ValueError):
+        status.inc(result='oops')
+
+
+def test_gauge(registry):
+    depth = registry.register(Gauge('thsr_test_depth', 'Depth.'))
+    depth.inc()
+    depth.inc()
+    depth.dec()
+    assert depth.get() == 1
+    assert 'thsr_test_depth 1.0' in registry.render().decode()
+
+
+def test_histogram_buckets(registry):
+    hist = registry.register(Histogram('thsr_test_seconds', 'Latency.', ['endpoint'], buckets=(0.1, 1.0)))
+    hist.observe(0.05, endpoint='a')
+    hist.observe(0.5, endpoint='a')
+    hist.observe(5, endpoint='a')
+
+    text = registry.render().decode()
+    assert 'thsr_test_seconds_bucket{endpoint="a",le="0.1"} 1' in text
+    assert 'thsr_test_seconds_bucket{endpoint="a",le="1.0"} 2' in text
+    assert 'thsr_test_seconds_bucket{endpoint="a",le="+Inf"} 3' in text
+    assert 'thsr_test_seconds_count{endpoint="a"} 3' in text
+    assert hist.count(endpoint='a') == 3
+
+
+def test_duplicated_name(registry):
+    registry.register(Counter('thsr_dup', 'Dup.'))
+    with pytest.raises(ValueError):
+        registry.register(Counter('thsr_dup', 'Dup.'))
+
+
+def test_metrics_server(registry):
+    registry.register(Counter('thsr_served', 'Served.')).inc()
+    server = start_metrics_server(0, registry=registry)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as resp:
+            assert resp.headers['Content-Type'].startswith('application/openmetrics-text')
+            assert b'thsr_served_total 1.0' in resp.read()
+    finally:
+        server.shutdown()
+        server.server_close()
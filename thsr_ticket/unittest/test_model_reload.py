@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+from thsr_ticket.metrics import SOLVER_MODEL_INFO, SOLVER_MODEL_RELOADS
+from thsr_ticket.ml import captcha_solver as cs
+
+
+@pytest.fixture(scope='module')
+def char_models(tmp_path_factory):
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('onnx')
+    from thsr_ticket.ml.train.char_model import CharCNN
+    from thsr_ticket.ml.train.train_chars import export_char_model
+
+    out = tmp_path_factory.mktemp('models')
+    paths = []
+    for seed in (0, 1):
+        torch.manual_seed(seed)
+        paths.append(str(out / f'char_{seed}.onnx'))
+        export_char_model(CharCNN(), paths[-1])
+    return paths
+
+
+@pytest.fixture
+def model_path(tmp_path, char_models, monkeypatch):
+    path = str(tmp_path / 'thsrc_char.onnx')
+    shutil.copy(char_models[0], path)
+    monkeypatch.setattr(cs, 'CHAR_MODEL_PATH', path)
+    monkeypatch.setattr(cs, 'WATCH_INTERVAL', 0.0)
+    for name in ('_models', '_last_check', '_failed', '_published'):
+        monkeypatch.setattr(cs, name, {})
+    monkeypatch.setattr(cs, '_reloading', set())
+    return path
+
+
+def _replace(src, dst):
+    tmp = dst + '.tmp'
+    shutil.copy(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _md5(path):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_swaps_in_replaced_model(model_path, char_models):
+    first = cs._get_model('char')
+    assert SOLVER_MODEL_INFO.get(mode='char', version=first.version) == 1
+    swapped = SOLVER_MODEL_RELOADS.get(mode='char', result='swapped')
+
+    _replace(char_models[1], model_path)
+    assert cs._get_model('char') is first  # the old model keeps serving while the new one loads
+    _wait_for(lambda: cs.model_version('char') != first.version)
+
+    assert SOLVER_MODEL_RELOADS.get(mode='char', result='swapped') == swapped + 1
+    assert SOLVER_MODEL_INFO.get(mode='char', version=first.version) == 0
+    assert SOLVER_MODEL_INFO.get(mode='char', version=cs.model_version('char')) == 1
+
+
+def test_keeps_model_when_new_file_is_broken(model_path):
+    first = cs._get_model('char')
+    failed = SOLVER_MODEL_RELOADS.get(mode='char', result='failed')
+    with open(model_path, 'wb') as f:
+        f.write(b'half-written')
+    cs._get_model('char')
+    _wait_for(lambda: SOLVER_MODEL_RELOADS.get(mode='char', result='failed') == failed + 1)
+    _wait_for(lambda: not cs._reloading)
+
+    assert cs._get_model('char') is first
+    assert not cs._reloading  # the same broken file is not retried
+
+
+def test_thresholds_change_reuses_session(model_path):
+    first = cs._get_model('char')
+    with open(cs.thresholds_path(model_path), 'w') as f:
+        json.dump({'model_md5': _md5(model_path), 'thresholds': [0.5, 0.5, 0.5, 0.5]}, f)
+    cs._get_model('char')
+    _wait_for(lambda: cs._get_model('char').thresholds == (0.5,) * 4)
+    assert cs._get_model('char').session is first.session
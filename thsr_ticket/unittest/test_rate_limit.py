@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from thsr_ticket.remote.rate_limit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self.sleeps.append(seconds)
+
+
+def test_waits_grow_with_concurrent_demand():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=1, clock=clock, sleep=clock.sleep)
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.sleeps == pytest.approx([0.5, 1.0, 1.5])
+
+
+def test_refills_over_time_up_to_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, burst=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now = 10.0  # long idle: only `burst` tokens accumulate
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == pytest.approx([1.0])
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
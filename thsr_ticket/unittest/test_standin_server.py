@@ -0,0 +1,188 @@
+import base64
+import json
+
+import pytest
+
+from thsr_ticket.remote.capture import REDACTED, Recorder, load_cassette, redact_text
+from thsr_ticket.remote import standin_pages as pages
+from thsr_ticket.remote.http_request import (
+    HTTPOptions, HTTPRequest, SharedPool, find_security_img_url, parse_security_img_url,
+)
+from thsr_ticket.remote.standin_server import StandInConfig, StandInServer
+from thsr_ticket.view_model.avail_trains import AvailTrains
+from thsr_ticket.view_model.booking_result import BookingResult
+from thsr_ticket.view_model.error_feedback import ErrorFeedback
+
+BOOKING_PARAMS = {
+    'selectStartStation': 2,
+    'selectDestinationStation': 12,
+    'toTimeTable': '1000A',
+    'toTimeInputField': '2026/10/20',
+    'homeCaptcha:securityCode': 'A2C4',
+}
+TICKET_PARAMS = {'dummyId': 'A123456789', 'dummyPhone': '0912345678', 'agree': 'on'}
+
+
+@pytest.fixture
+def server():
+    with StandInServer(StandInConfig(seed=0)) as srv:
+        yield srv
+
+
+def _first_page(client: HTTPRequest) -> bytes:
+    page = client.request_booking_page()
+    assert page.status_code == 200
+    img = client.request_security_code_img(page.content)
+    assert img.content.startswith(b'\x89PNG')
+    return page.content
+
+
+def test_full_booking(server):
+    client = HTTPRequest(base_url=server.url)
+    _first_page(client)
+
+    resp = client.submit_booking_form(BOOKING_PARAMS)
+    assert ErrorFeedback().parse(resp.content) == []
+    trains = AvailTrains().parse(resp.content)
+    assert [t.id for t in trains][:2] == [803, 603]
+    assert trains[1].discount_str == '(早鳥8折)'
+
+    resp = client.submit_train({'TrainQueryDataViewPanel:TrainGroup': trains[1].form_value})
+    assert ErrorFeedback().parse(resp.content) == []
+
+    resp = client.submit_ticket(TICKET_PARAMS)
+    ticket = BookingResult().parse(resp.content)[0]
+    assert ticket.id == '00000001'
+    assert ticket.train_id == '603'
+    assert ticket.date == '2026/10/20'
+
+
+def test_captcha_reject_and_no_trains():
+    config = StandInConfig(captcha_accept_rate=0.0, seed=0)
+    with StandInServer(config) as srv:
+        client = HTTPRequest(base_url=srv.url)
+        _first_page(client)
+        errors = ErrorFeedback().parse(client.submit_booking_form(BOOKING_PARAMS).content)
+        assert any('檢測碼' in e.msg for e in errors)
+
+        config.captcha_accept_rate = 1.0
+        config.no_trains_rounds = 1
+        errors = ErrorFeedback().parse(client.submit_booking_form(BOOKING_PARAMS).content)
+        assert any('查無' in e.msg for e in errors)
+        assert srv.app.stats.captcha_rejected == 1
+        assert srv.app.stats.no_trains == 1
+
+
+def test_out_of_order_submit_expires(server):
+    client = HTTPRequest(base_url=server.url)
+    _first_page(client)
+    resp = client.submit_ticket(TICKET_PARAMS)
+    assert ErrorFeedback().parse(resp.content)
+
+
+def test_record_and_replay(server, tmp_path):
+    cassette = str(tmp_path / 'session.jsonl')
+    client = HTTPRequest(base_url=server.url, recorder=Recorder(cassette))
+    _first_page(client)
+    client.submit_booking_form(BOOKING_PARAMS)
+    client.submit_train({'TrainQueryDataViewPanel:TrainGroup': 'radio18'})
+    client.submit_ticket(TICKET_PARAMS)
+
+    with open(cassette, encoding='utf-8') as f:
+        raw = f.read()
+    assert 'A123456789' not in raw and '0912345678' not in raw
+    entries = list(load_cassette(cassette))
+    assert [e['endpoint'] for e in entries] == [
+        'booking_page', 'security_code_img', 'submit_booking_form', 'submit_train', 'submit_ticket',
+    ]
+    assert f'dummyId={REDACTED}' in entries[-1]['url']
+    assert json.loads(raw.splitlines()[0])['response_headers'].get('Set-Cookie') == REDACTED
+    assert base64.b64decode(json.loads(raw.splitlines()[1])['body']) == entries[1]['body']
+
+    with StandInServer(StandInConfig(cassette=cassette)) as replay:
+        client = HTTPRequest(base_url=replay.url)
+        assert _first_page(client) == entries[0]['body']
+        resp = client.submit_booking_form(BOOKING_PARAMS)
+        assert resp.content == entries[2]['body']
+
+
+def test_redact_text():
+    text = 'ID A123456789, phone 0912-345-678, mail a.b@example.com, jsessionid=ABC123'
+    assert redact_text(text) == f'ID {REDACTED}, phone {REDACTED}, mail {REDACTED}, jsessionid={REDACTED}'
+
+
+def test_incremental_collect_against_standin(tmp_path, monkeypatch):
+    from thsr_ticket.ml import captcha_solver
+    from thsr_ticket.ml.train import incremental
+    from thsr_ticket.ml.train.manifest import MANIFEST_FILE
+
+    raw = tmp_path / 'raw'
+    monkeypatch.setattr(incremental, 'RAW_DIR', str(raw))
+    monkeypatch.setattr(captcha_solver, 'solve', lambda img: 'A2C4')
+
+    with StandInServer(StandInConfig(captcha_accept_rate=0.5, seed=1)) as srv:
+        verified, failed, skipped = incremental.collect_and_label(
+            8, rate=1000.0, workers=3, base_url=srv.url,
+        )
+    assert (verified, failed, skipped) == (srv.app.stats.captcha_accepted, srv.app.stats.captcha_rejected, 0)
+    assert verified + failed == 8
+
+    files = sorted(p.name for p in raw.iterdir() if p.suffix == '.png')
+    assert len(files) == 8
+    assert sorted(int(name.split('_')[0]) for name in files) == list(range(1, 9))
+    entries = [json.loads(line) for line in (raw / MANIFEST_FILE).read_text().splitlines()]
+    assert sorted(e['file'] for e in entries) == files
+    assert sum(e['verified'] for e in entries) == verified
+    assert all(e['label'] == 'A2C4' for e in entries if e['verified'])
+
+
+def test_find_security_img_url_on_prefix():
+    page = pages.booking_page('ABC', 42, tail=1000)
+    end = page.index(b'passCode"') + 20
+    assert find_security_img_url(page[:end]) is None
+    url = find_security_img_url(page[:page.index(b'</form>')])
+    assert url == parse_security_img_url(page)
+    assert url.endswith('::IResourceListener&wicket:antiCache=42')
+
+
+def test_captcha_prefetched_while_page_streams(tmp_path):
+    config = StandInConfig(seed=0, chunk_size=256, chunk_delay=0.001, page_tail=4096)
+    with StandInServer(config) as srv:
+        client = HTTPRequest(base_url=srv.url)
+        page, img = client.request_booking_page_and_captcha()
+        assert page.content.endswith(b'</html>') and img.content.startswith(b'\x89PNG')
+        resp = client.submit_booking_form(BOOKING_PARAMS)
+        assert ErrorFeedback().parse(resp.content) == []
+
+        # A recorder reads each body in its hook, so the pages are fetched one after the other
+        cassette = str(tmp_path / 'first_page.jsonl')
+        page, img = HTTPRequest(base_url=srv.url, recorder=Recorder(cassette)).request_booking_page_and_captcha()
+        assert [e['endpoint'] for e in load_cassette(cassette)] == ['booking_page', 'security_code_img']
+        assert img.content.startswith(b'\x89PNG')
+
+
+def test_error_page_read_only_up_to_feedback_panel():
+    config = StandInConfig(seed=0, captcha_accept_rate=0.0, page_tail=50000)
+    with StandInServer(config) as srv:
+        pool = SharedPool(HTTPOptions(pool_maxsize=1))
+        for _ in range(3):
+            client = HTTPRequest(base_url=srv.url, pool=pool)
+            _first_page(client)
+            resp = client.submit_booking_form(BOOKING_PARAMS)
+            assert resp.content.endswith(b'</ul>') and len(resp.content) < 1000
+            assert any('檢測碼' in e.msg for e in ErrorFeedback().parse(resp.content))
+
+        # The rest of the body is drained, so the one pooled connection keeps being reused
+        (conn_pool,) = pool.adapter.poolmanager.pools._container.values()
+        assert conn_pool.num_connections == 1
+
+        config.captcha_accept_rate = 1.0
+        resp = client.submit_booking_form(BOOKING_PARAMS)
+        assert resp.content.endswith(b'</html>')
+        assert len(AvailTrains().parse(resp.content)) == len(pages.DEFAULT_TRAINS)
+
+        client = HTTPRequest(base_url=srv.url, options=HTTPOptions(early_exit=False))
+        _first_page(client)
+        config.captcha_accept_rate = 0.0
+        assert len(client.submit_booking_form(BOOKING_PARAMS).content) > 50000
+        pool.close()
@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+import pytest
+
+from thsr_ticket.ml.train import cache as cache_mod
+from thsr_ticket.ml.train.cache import PreprocessedCache, open_images
+
+
+def _write_png(path, seed: int) -> str:
+    img = np.random.default_rng(seed).integers(0, 256, (48, 140, 3), dtype=np.uint8)
+    cv2.imwrite(str(path), img)
+    return str(path)
+
+
+class CountingPreprocess:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path: str) -> np.ndarray:
+        self.calls.append(path)
+        return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+@pytest.fixture
+def raw(tmp_path):
+    d = tmp_path / 'raw'
+    d.mkdir()
+    return d
+
+
+def test_sync_is_incremental(tmp_path, raw):
+    fn = CountingPreprocess()
+    samples = [(_write_png(raw / f'{i:05d}_AAAA_x.png', i), [i, 0, 0, 0]) for i in range(3)]
+
+    rows = PreprocessedCache(str(tmp_path / 'cache')).sync(samples, fn)
+    assert rows == [0, 1, 2] and len(fn.calls) == 3
+
+    # A fresh instance loads the index and preprocesses nothing.
+    assert PreprocessedCache(str(tmp_path / 'cache')).sync(samples, fn) == rows
+    assert len(fn.calls) == 3
+
+    samples.append((_write_png(raw / '00003_AAAA_x.png', 3), [3, 0, 0, 0]))
+    c = PreprocessedCache(str(tmp_path / 'cache'))
+    assert c.sync(samples, fn) == [0, 1, 2, 3]
+    assert fn.calls[3:] == [samples[3][0]]
+
+    images = open_images(str(tmp_path / 'cache'))
+    assert images.shape == (4, 48, 140) and images.dtype == np.uint8
+    for row, (path, _) in enumerate(samples):
+        assert np.array_equal(images[row], cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+    assert c.labels[:, 0].tolist() == [0, 1, 2, 3]
+
+
+def test_relabel_keeps_row(tmp_path, raw):
+    fn = CountingPreprocess()
+    path = _write_png(raw / '00001_AAAA_x.png', 1)
+    PreprocessedCache(str(tmp_path / 'cache')).sync([(path, [0, 0, 0, 0])], fn)
+
+    c = PreprocessedCache(str(tmp_path / 'cache'))
+    assert c.sync([(path, [1, 2, 3, 4])], fn) == [0]
+    assert len(fn.calls) == 1
+    assert PreprocessedCache(str(tmp_path / 'cache')).labels.tolist() == [[1, 2, 3, 4]]
+
+
+def test_version_bump_rebuilds(tmp_path, raw, monkeypatch):
+    fn = CountingPreprocess()
+    samples = [(_write_png(raw / '00001_AAAA_x.png', 1), [0, 0, 0, 0])]
+    PreprocessedCache(str(tmp_path / 'cache')).sync(samples, fn)
+
+    monkeypatch.setattr(cache_mod, 'PREPROCESS_VERSION', cache_mod.PREPROCESS_VERSION + 1)
+    assert len(PreprocessedCache(str(tmp_path / 'cache'))) == 0
+    PreprocessedCache(str(tmp_path / 'cache')).sync(samples, fn)
+    assert len(fn.calls) == 2
+
+
+def test_dataset_matches_uncached(tmp_path, raw):
+    pytest.importorskip('torch')
+    from thsr_ticket.ml.train.dataset import CaptchaDataset
+
+    for i, label in enumerate(['A2C4', 'ZZ99']):
+        _write_png(raw / f'{i:05d}_{label}_x.png', i)
+
+    cached = CaptchaDataset(data_dir=str(raw), cache_dir=str(tmp_path / 'cache'))
+    plain = CaptchaDataset(data_dir=str(raw), cache_dir=None)
+    assert len(cached) == len(plain) == 2
+    for idx in range(len(plain)):
+        for a, b in zip(cached[idx], plain[idx]):
+            assert a.shape == b.shape and a.dtype == b.dtype
+            assert (a == b).all()
+
+
+def test_build_resumes_after_interrupt(tmp_path, raw):
+    from thsr_ticket.ml.train import build_cache
+
+    samples = sorted((_write_png(raw / f'{i:05d}_AAAA_x.png', i), [i % 24, 0, 0, 0]) for i in range(10))
+    cache_dir = str(tmp_path / 'cache')
+
+    def interrupt(processed, completed, total, elapsed):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        build_cache.build(samples, cache_dir, workers=1, chunk_size=4, report=interrupt)
+    assert len(PreprocessedCache(cache_dir)) == 0
+
+    progress = []
+    cache = build_cache.build(samples, cache_dir, workers=2, chunk_size=4,
+                              report=lambda *args: progress.append(args))
+    assert progress[0][1] > progress[0][0]  # the first chunk was not redone
+    assert progress[-1][1:3] == (10, 10)
+    assert not (tmp_path / 'cache' / build_cache.PROGRESS_FILE).exists()
+
+    images = open_images(cache_dir)
+    for path, _ in samples:
+        row = cache.rows[cache_mod.file_hash(path)]
+        assert np.array_equal(images[row], cache_mod.load_preprocessed(path))
+
+
+def test_build_resume_with_other_chunk_size_starts_over(tmp_path, raw):
+    from thsr_ticket.ml.train import build_cache
+
+    samples = sorted((_write_png(raw / f'{i:05d}_AAAA_x.png', i), [i % 24, 0, 0, 0]) for i in range(10))
+    cache_dir = str(tmp_path / 'cache')
+
+    def interrupt(processed, completed, total, elapsed):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        build_cache.build(samples, cache_dir, workers=1, chunk_size=4, report=interrupt)
+
+    progress = []
+    cache = build_cache.build(samples, cache_dir, workers=1, chunk_size=3,
+                              report=lambda *args: progress.append(args))
+    assert progress[0][0] == progress[0][1]  # nothing was taken over from the chunk_size=4 run
+    assert progress[-1][1:3] == (10, 10)
+
+    images = open_images(cache_dir)
+    for path, _ in samples:
+        row = cache.rows[cache_mod.file_hash(path)]
+        assert np.array_equal(images[row], cache_mod.load_preprocessed(path))